@@ -5,7 +5,9 @@ This module registers the Chat model with the Django admin site.
 """
 
 from django.contrib import admin
-from . models import Chat,Document
+from . models import Chat,ChatSession,ConversationSummary,Document
 
 admin.site.register(Chat)
 admin.site.register(Document)
+admin.site.register(ConversationSummary)
+admin.site.register(ChatSession)
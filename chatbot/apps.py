@@ -14,3 +14,7 @@ class ChatbotConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chatbot'
+
+    def ready(self):
+        """Connect the signal handlers maintaining session aggregates."""
+        from . import signals  # pylint: disable=import-outside-toplevel,unused-import
@@ -0,0 +1,22 @@
+"""View decorators for the chatbot application.
+
+Django's ``login_required`` only wraps synchronous views on the Django versions
+this project supports, and resolving ``request.user`` touches the session and
+user tables, which async code must not do directly. ``async_login_required``
+resolves the user in a thread before running the async view.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+
+
+def async_login_required(view):
+    """Redirect anonymous users to the login page before running an async view."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,106 @@
+"""
+Management command running the ingestion, retrieval and index type microbenchmarks.
+
+Example:
+
+    python manage.py benchmark --pages 10,100 --documents 1,10 --output bench.json
+
+Results are written as JSON so runs on different commits can be compared.
+"""
+import json
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from chatbot.utils.benchmark import run_benchmarks
+from chatbot.utils.clients import client_registry
+from chatbot.utils.rag_utils import RAGProcessor
+from chatbot.utils.rate_limit import gemini_rate_limiter
+from chatbot.utils.response_cache import ResponseCache
+from chatbot.utils.store_cache import VectorStoreCache
+
+
+def int_list(value):
+    """Parse a comma-separated list of positive integers."""
+    try:
+        numbers = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError as e:
+        raise CommandError(f"Expected comma-separated integers, got {value!r}") from e
+    if not numbers or min(numbers) < 1:
+        raise CommandError(f"Expected positive integers, got {value!r}")
+    return numbers
+
+
+class Command(BaseCommand):
+    """Benchmark document ingestion and retrieval with offline backends."""
+
+    help = "Benchmark ingestion and retrieval on synthetic PDFs and report JSON timings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', default='10,50,200',
+                            help="Comma-separated document sizes, in pages, to ingest.")
+        parser.add_argument('--documents', default='1,5,20',
+                            help="Comma-separated numbers of documents per session to query.")
+        parser.add_argument('--pages-per-document', type=int, default=20,
+                            help="Pages of each document in the retrieval sessions.")
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Measured runs per ingestion size.")
+        parser.add_argument('--queries', type=int, default=20,
+                            help="Measured queries per session size.")
+        parser.add_argument('--index-sizes', default='1000,10000',
+                            help="Comma-separated vector counts to compare index types on.")
+        parser.add_argument('--index-dim', type=int, default=768,
+                            help="Dimension of the vectors in the index type comparison.")
+        parser.add_argument('--backend', choices=('fake', 'replay'), default='fake',
+                            help="Offline LLM and embedding backend to use.")
+        parser.add_argument('--rate-limit', type=float, default=None,
+                            help="Gemini API requests per minute; unlimited by default.")
+        parser.add_argument('--memory', action='store_true',
+                            help="Trace peak allocations per stage (slows every stage).")
+        parser.add_argument('--output', help="Write the JSON report here instead of stdout.")
+
+    def handle(self, *args, **options):
+        ingestion_pages = int_list(options['pages'])
+        session_documents = int_list(options['documents'])
+        index_sizes = int_list(options['index_sizes'])
+        if min(options['repeat'], options['queries'], options['pages_per_document']) < 1:
+            raise CommandError("--repeat, --queries and --pages-per-document must be positive")
+
+        with tempfile.TemporaryDirectory(prefix='chatbot-bench-') as work_dir, \
+                override_settings(
+                    MEDIA_ROOT=work_dir,
+                    LLM_BACKEND=options['backend'],
+                    EMBEDDING_BACKEND=options['backend'],
+                    EMBEDDING_CACHE_DB=None
+                ):
+            client_registry.clear()
+            processor = RAGProcessor('benchmark')
+            processor.store_cache = VectorStoreCache()
+            processor.response_cache = ResponseCache(max_entries=0)
+            quota = gemini_rate_limiter.rate_per_minute
+            gemini_rate_limiter.rate_per_minute = options['rate_limit'] or 1e12
+            try:
+                report = run_benchmarks(
+                    processor,
+                    Path(work_dir),
+                    ingestion_pages,
+                    session_documents,
+                    options['pages_per_document'],
+                    options['repeat'],
+                    options['queries'],
+                    trace_memory=options['memory'],
+                    index_sizes=index_sizes,
+                    index_dim=options['index_dim']
+                )
+            finally:
+                client_registry.clear()
+                gemini_rate_limiter.rate_per_minute = quota
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output + "\n", encoding='utf-8')
+            self.stdout.write(f"Wrote benchmark report to {options['output']}")
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,39 @@
+"""
+Management command reclaiming the files of deleted documents.
+
+Example:
+
+    python manage.py reclaim_storage --sweep
+
+Deleting a session schedules the same reclamation in the background; this
+command retries whatever is left and, with ``--sweep``, also removes stores,
+metadata, routing entries and uploads that no document refers to.
+"""
+from django.core.management.base import BaseCommand
+
+from chatbot.utils.reclaim import reclaim_deleted_documents, sweep_orphans
+from chatbot.views import rag_processor
+
+
+class Command(BaseCommand):
+    """Reclaim deleted documents and optionally sweep orphaned files."""
+
+    help = "Remove the stores, metadata and uploads of deleted documents."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sweep', action='store_true',
+                            help="Also remove files no document refers to.")
+        parser.add_argument('--grace', type=float, default=None,
+                            help="Minimum age in seconds of swept files; "
+                                 "defaults to RECLAIM_GRACE_SECONDS.")
+
+    def handle(self, *args, **options):
+        reclaimed = reclaim_deleted_documents(rag_processor)
+        self.stdout.write(f"Reclaimed {reclaimed} deleted document(s).")
+        if options['sweep']:
+            removed = sweep_orphans(rag_processor, options['grace'])
+            self.stdout.write(
+                f"Swept {removed['stores']} store(s), {removed['metadata']} metadata "
+                f"file(s), {removed['uploads']} upload(s) and {removed['routing']} "
+                f"routing table row(s)."
+            )
@@ -0,0 +1,54 @@
+"""
+Middleware timing every request and its instrumented stages.
+
+The stages recorded with ``chatbot.utils.timing.span`` while a view runs are
+returned in a ``Server-Timing`` header, which browser developer tools show
+next to the request. Every request's duration also goes into the
+``chatbot_request_duration_seconds`` histogram exported on ``/metrics/``.
+
+For streamed responses the header only covers the work done before streaming
+started; stages that run while tokens stream still feed the histograms.
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from chatbot.utils.timing import collect_request_timings, request_duration, server_timing_header
+
+
+class ServerTimingMiddleware:
+    """Collect stage spans per request and report them in ``Server-Timing``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with collect_request_timings() as timings:
+            response = self.get_response(request)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with collect_request_timings() as timings:
+            response = await self.get_response(request)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    @staticmethod
+    def finish(request, response, timings, elapsed):
+        """Record the request duration and attach the ``Server-Timing`` header."""
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        request_duration.observe(elapsed, view, request.method, str(response.status_code))
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = server_timing_header(timings, elapsed)
+        return response
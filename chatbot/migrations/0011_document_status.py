@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+
+def mark_processed_documents_indexed(apps, schema_editor):
+    """Documents processed before the status field existed are already indexed."""
+    Document = apps.get_model('chatbot', 'Document')
+    Document.objects.filter(processed=True).update(status='indexed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0010_remove_document_is_document_query'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('parsing', 'Parsing'), ('embedding', 'Embedding'), ('indexed', 'Indexed'), ('failed', 'Failed')], default='queued', max_length=16),
+        ),
+        migrations.RunPython(mark_processed_documents_indexed, migrations.RunPython.noop),
+    ]
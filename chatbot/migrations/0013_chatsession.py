@@ -0,0 +1,84 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_chat_sessions(apps, schema_editor):
+    """Build a ChatSession row for every existing (user, session_id) pair."""
+    Chat = apps.get_model('chatbot', 'Chat')
+    ChatSession = apps.get_model('chatbot', 'ChatSession')
+    Document = apps.get_model('chatbot', 'Document')
+
+    document_counts = {
+        (row['user_id'], row['session_id']): row['count']
+        for row in Document.objects.exclude(status='failed').values(
+            'user_id', 'session_id'
+        ).annotate(
+            count=models.Count('id')
+        )
+    }
+    sessions = {}
+    for chat in Chat.objects.order_by('created_at', 'id').iterator():
+        key = (chat.user_id, chat.session_id)
+        session = sessions.get(key)
+        if session is None:
+            session = sessions[key] = ChatSession(
+                user_id=chat.user_id,
+                session_id=chat.session_id,
+                created_at=chat.created_at,
+                document_count=document_counts.get(key, 0),
+            )
+        session.last_activity_at = chat.created_at
+        if chat.message:
+            if session.message_count == 0:
+                message = chat.message
+                session.title = message[:30] + "..." if len(message) > 30 else message
+            session.message_count += 1
+    ChatSession.objects.bulk_create(sessions.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chatbot', '0012_conversationsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.UUIDField()),
+                ('title', models.CharField(default='New Chat', max_length=255)),
+                ('created_at', models.DateTimeField()),
+                ('last_activity_at', models.DateTimeField()),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('document_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['user', 'session_id', 'created_at'], name='chat_user_session_created'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['user', 'session_id', 'processed'], name='document_user_session_proc'),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['user', 'created_at'], name='chatsession_user_created'),
+        ),
+        migrations.AddConstraint(
+            model_name='chatsession',
+            constraint=models.UniqueConstraint(fields=('user', 'session_id'), name='unique_chat_session'),
+        ),
+        migrations.RunPython(populate_chat_sessions, migrations.RunPython.noop),
+    ]
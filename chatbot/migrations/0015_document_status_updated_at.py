@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:24
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0014_document_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='status_updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -7,11 +7,17 @@ chatbot's response, and the timestamp when the chat was created.
 
 Classes:
     Chat: Represents a single chat interaction with fields for the user, 
-    session ID, message, response, and creation timestamp."""
+    session ID, message, response, and creation timestamp.
+    Document: Represents an uploaded PDF and the state of its ingestion.
+    ConversationSummary: Holds the rolling summary of a session's older turns.
+    ChatSession: Per-session aggregates (title, activity, counts) for the sidebar."""
 
 import uuid
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Chat(models.Model):
     """Chat model for storing user-chatbot interactions."""
@@ -22,6 +28,12 @@ class Chat(models.Model):
     response = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'session_id', 'created_at'],
+                         name='chat_user_session_created'),
+        ]
+
     def __str__(self):
         return (
             f'Session {self.session_id} - '
@@ -31,6 +43,19 @@ class Chat(models.Model):
 
 class Document(models.Model):
     """Model for storing uploaded documents and their vector embeddings."""
+    STATUS_QUEUED = 'queued'
+    STATUS_PARSING = 'parsing'
+    STATUS_EMBEDDING = 'embedding'
+    STATUS_INDEXED = 'indexed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_PARSING, 'Parsing'),
+        (STATUS_EMBEDDING, 'Embedding'),
+        (STATUS_INDEXED, 'Indexed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     session_id = models.UUIDField()
     title = models.CharField(max_length=255)
@@ -38,6 +63,73 @@ class Document(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
     embedding_store = models.TextField(null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    error = models.TextField(blank=True, default='')
+    # Last status change; documents left in progress by a stopped worker are
+    # recognised by this being older than INGESTION_STALE_SECONDS.
+    status_updated_at = models.DateTimeField(default=timezone.now)
+    # Set when the document's session is deleted; its files are reclaimed later.
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'session_id', 'processed'],
+                         name='document_user_session_proc'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} - {self.user.username} - {self.session_id}"
+
+class ConversationSummary(models.Model):
+    """Rolling summary of the chat turns that fell out of a session's memory window."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    session_id = models.UUIDField()
+    summary = models.TextField(blank=True, default='')
+    summarized_through = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'session_id'],
+                                    name='unique_conversation_summary'),
+        ]
+
+    def __str__(self):
+        return f"Summary {self.session_id} - {self.user.username}"
+
+class ChatSession(models.Model):
+    """Aggregates of a chat session, maintained as its chats and documents are written."""
+    DEFAULT_TITLE = "New Chat"
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    session_id = models.UUIDField()
+    title = models.CharField(max_length=255, default=DEFAULT_TITLE)
+    created_at = models.DateTimeField()
+    last_activity_at = models.DateTimeField()
+    message_count = models.PositiveIntegerField(default=0)
+    document_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'session_id'],
+                                    name='unique_chat_session'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='chatsession_user_created'),
+        ]
+
+    @staticmethod
+    def make_title(message):
+        """Build a sidebar title from the first user message of a session."""
+        return message[:30] + "..." if len(message) > 30 else message
+
+    @classmethod
+    def forget_documents(cls, user_id, session_id, count=1):
+        """Stop counting documents that failed or were deleted against a session."""
+        if count:
+            cls.objects.filter(user=user_id, session_id=session_id).update(
+                document_count=Greatest(F('document_count') - count, 0)
+            )
 
     def __str__(self):
         return f"{self.title} - {self.user.username} - {self.session_id}"
@@ -0,0 +1,60 @@
+"""Signal handlers keeping ChatSession aggregates in step with writes.
+
+Every chat or document written for a session updates its ``ChatSession`` row
+with conditional UPDATEs, so the sidebar can be rendered from that table alone
+instead of aggregating the chat history on every page load.
+
+``document_count`` only counts live documents: ingestion uncounts a document
+when it fails and ``delete_session`` when it tombstones one, so deleting a
+failed or tombstoned document row leaves the count alone.
+"""
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Chat, ChatSession, Document
+
+
+@receiver(post_save, sender=Chat)
+def record_chat(sender, instance, created, **kwargs):
+    """Create or update the session aggregates when a chat is stored."""
+    if not created:
+        return
+    session, _ = ChatSession.objects.get_or_create(
+        user=instance.user,
+        session_id=instance.session_id,
+        defaults={
+            'created_at': instance.created_at,
+            'last_activity_at': instance.created_at,
+        }
+    )
+    session_row = ChatSession.objects.filter(pk=session.pk)
+    updates = {
+        'last_activity_at': Greatest(F('last_activity_at'), Value(instance.created_at)),
+    }
+    if instance.message:
+        # Only the write that takes the count from zero may set the title.
+        if session_row.filter(message_count=0).update(
+            title=ChatSession.make_title(instance.message), message_count=1, **updates
+        ):
+            return
+        updates['message_count'] = F('message_count') + 1
+    session_row.update(**updates)
+
+
+@receiver(post_save, sender=Document)
+def record_document(sender, instance, created, **kwargs):
+    """Count a newly uploaded document against its session."""
+    if created and instance.deleted_at is None and instance.status != Document.STATUS_FAILED:
+        ChatSession.objects.filter(
+            user=instance.user_id,
+            session_id=instance.session_id
+        ).update(document_count=F('document_count') + 1)
+
+
+@receiver(post_delete, sender=Document)
+def forget_document(sender, instance, **kwargs):
+    """Stop counting a deleted document that was still counted against its session."""
+    if instance.deleted_at is None and instance.status != Document.STATUS_FAILED:
+        ChatSession.forget_documents(instance.user_id, instance.session_id)
@@ -14,20 +14,87 @@ Test scenarios include:
 
 1. Testing that an authenticated user can access the chatbot and view chat sessions.
 2. Testing the creation of a new chat session for a user.
-3. Testing posting a message to the chatbot and receiving a response.
+3. Testing posting a message to the chatbot and receiving a response, whole or streamed.
 4. Testing the creation of a new chat session via the API endpoint.
 5. Testing the deletion of a chat session.
 6. Testing that unauthenticated users are redirected to the login page.
+7. Testing the vector store cache hit, invalidation and eviction behaviour.
+8. Testing merged retrieval across documents with a single LLM call, streamed or not.
+9. Testing incremental updates and removals in the per-session vector store.
+10. Testing that query embeddings are memoized in memory and on disk.
+11. Testing that duplicate uploads and known chunks skip the embedding API.
+12. Testing the ingestion status reported for queued, indexed and failed uploads.
+13. Testing that PDF pages are streamed into the index in batches.
+14. Testing batching, pacing and quota retries of the embedding client.
+15. Testing the rolling summary that replaces older conversation turns.
+16. Testing the ChatSession aggregates and the constant-query sidebar.
+17. Testing keyset pagination of the chat history.
+18. Testing the exact and semantic response cache and its document scoping.
+19. Testing that LLM clients are built once and reused.
+20. Testing the fake, recording and replaying LLM and embedding backends.
+21. Testing the ingestion and retrieval benchmark command.
+22. Testing the Server-Timing header, stage histograms and the metrics endpoint.
+23. Testing the vectorized relevance gate ranking a session's documents.
+24. Testing that the routing index skips stores without loading them.
+25. Testing session-scoped reclamation of deleted documents and the orphan sweep,
+    and the recovery of ingestion interrupted by a restart.
+26. Testing the memory-mapped store format against FAISS.
+27. Testing that session stores change index type as they grow and shrink, rebuilding
+    from full-precision vectors, while mmap stores stay flat.
+28. Testing the lexical index, its keyword and embedding-failure fallbacks and fusion.
+29. Testing that PDF page ranges extracted in worker processes keep page order.
 """
 
+import asyncio
+import json
+import os
+import subprocess
+import sys
 import uuid
 import tempfile
-from unittest.mock import patch
-from django.test import TestCase, Client
+from dataclasses import asdict
+from datetime import timedelta
+from pathlib import Path
+from unittest import skipIf
+from unittest.mock import AsyncMock, MagicMock, patch
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from django.db import IntegrityError, connection
+from django.db.models.signals import post_save
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
-from .models import Chat,Document
+from google.api_core import exceptions
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document as LangchainDocument
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import numpy as np
+from .models import Chat,ChatSession,ConversationSummary,Document
+from .utils.backends import (
+    BackendChatModel,
+    BackendGenerativeModel,
+    HashEmbeddings,
+    LatencyModel,
+    build_text_model,
+)
+from .utils.benchmark import write_synthetic_pdf
+from .utils.clients import ClientRegistry, get_gemini_model
+from .utils.embedding_cache import CachedEmbeddings
+from .utils.embedding_client import BatchedEmbeddings
+from .utils.index_types import index_type_of
+from .utils.ingestion import ingest_document, recover_interrupted_documents
+from .utils.lexical_index import is_keyword_query, tokenize
+from .utils.rag_utils import DocumentMetadata, RAGProcessor
+from .utils.memory import aload_conversation_memory, summarize_conversation
+from .utils.mmap_store import MmapVectorStore, is_mmap_store
+from .utils.rate_limit import TokenBucket
+from .utils.reclaim import reclaim_deleted_documents, sweep_orphans
+from .utils.response_cache import ResponseCache
+from .utils.store_cache import VectorStoreCache
+from .utils.timing import Histogram, span
 
 class ChatbotViewTests(TestCase):
     """Test cases for chatbot views."""
@@ -56,7 +123,7 @@ class ChatbotViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('Hi testuser', response.context['chats'][0].response)
 
-    @patch('chatbot.views.ask_gemini')
+    @patch('chatbot.views.aask_gemini', new_callable=AsyncMock)
     def test_post_message_to_chatbot(self, mock_ask_gemini):
         """Test posting a message to the chatbot."""
         mock_ask_gemini.return_value = "Hello to you too! How can I help you today!\n"
@@ -75,6 +142,32 @@ class ChatbotViewTests(TestCase):
             }
         )
 
+    @patch('chatbot.views.aask_gemini_stream')
+    async def test_post_message_streams_response(self, mock_ask_gemini_stream):
+        """Test that a streamed answer arrives token by token and is stored."""
+        async def tokens(*args):
+            for token in ['Hello ', 'there']:
+                yield token
+        mock_ask_gemini_stream.side_effect = tokens
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.post(reverse('chatbot'), {
+            'session_id': self.session_id,
+            'message': 'Stream please',
+            'stream': '1'
+        })
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        events = [
+            json.loads(event[len('data: '):])
+            for event in content.decode().split('\n\n')
+            if event
+        ]
+        self.assertEqual([event['token'] for event in events[:-1]], ['Hello ', 'there'])
+        self.assertTrue(events[-1]['done'])
+        self.assertTrue(await Chat.objects.filter(
+            session_id=self.session_id, message='Stream please', response='Hello there'
+        ).aexists())
+
     def test_create_new_chat_view(self):
         """Test the create new chat view."""
         self.client.login(username='testuser', password='testpassword')
@@ -92,8 +185,8 @@ class ChatbotViewTests(TestCase):
         self.assertFalse(Chat.objects.filter(session_id=self.session_id).exists())
 
 
-    @patch('chatbot.views.rag_processor.query_documents')
-    @patch('chatbot.views.ask_gemini')
+    @patch('chatbot.views.rag_processor.aquery_documents', new_callable=AsyncMock)
+    @patch('chatbot.views.aask_gemini', new_callable=AsyncMock)
     def test_post_message_to_chatbot_with_rag(self, mock_ask_gemini, mock_query_documents):
         """Test posting a message to the chatbot with RAG processing."""
         self.client.login(username='testuser', password='testpassword')
@@ -119,6 +212,7 @@ class ChatbotViewTests(TestCase):
         self.assertEqual(response_json['session_id'], self.session_id)
         self.assertIn('RAG-based response', response_json['response'])
 
+    @override_settings(INGESTION_EAGER=True)
     @patch('chatbot.views.rag_processor.process_document')
     def test_upload_document(self, mock_process_document):
         """Test document upload functionality."""
@@ -140,7 +234,8 @@ class ChatbotViewTests(TestCase):
         self.assertTrue(response_json['success'],
             f"Document upload failed. Response: {response_json}")
 
-        self.assertEqual(response_json['message'], 'Document processed successfully')
+        self.assertEqual(response_json['message'], 'Document queued for processing')
+        self.assertEqual(response_json['status'], Document.STATUS_INDEXED)
 
         document = Document.objects.get(session_id=self.session_id)
         self.assertTrue(document.processed)
@@ -148,8 +243,1134 @@ class ChatbotViewTests(TestCase):
 
         mock_process_document.assert_called_once()
 
+        status = self.client.get(reverse('document_status', args=[document.id])).json()
+        self.assertEqual(status['status'], Document.STATUS_INDEXED)
+
+    @override_settings(INGESTION_EAGER=True)
+    @patch('chatbot.views.rag_processor.process_document')
+    def test_upload_document_failure_is_reported(self, mock_process_document):
+        """Test that a failed ingestion is visible through the status endpoint."""
+        self.client.login(username='testuser', password='testpassword')
+        mock_process_document.side_effect = ValueError('Error processing document: bad pdf')
+
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as temp_file:
+            temp_file.write(b'Dummy PDF content')
+            temp_file.seek(0)
+            response = self.client.post(reverse('upload_document'), {
+                'document': temp_file,
+                'session_id': self.session_id
+            })
+
+        document_id = response.json()['document_id']
+        status = self.client.get(reverse('document_status', args=[document_id])).json()
+        self.assertEqual(status['status'], Document.STATUS_FAILED)
+        self.assertIn('bad pdf', status['error'])
+        self.assertFalse(status['processed'])
+        Document.objects.get(id=document_id).file.delete()
+
     def test_chatbot_redirect_if_not_authenticated(self):
         """Test that an unauthenticated user is redirected to the login page."""
         response = self.client.get(reverse('chatbot'))
         self.assertRedirects(response, '/login/?next=/chatbot/')
-    
\ No newline at end of file
+    
+
+class VectorStoreCacheTests(TestCase):
+    """Test cases for the process-wide vector store cache."""
+
+    def setUp(self):
+        """Create a temporary directory holding two fake stores."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.stores = []
+        for name in ('store_1', 'store_2'):
+            store_path = Path(self.temp_dir.name) / name
+            store_path.mkdir()
+            (store_path / 'index.faiss').write_bytes(b'0' * 10)
+            self.stores.append(str(store_path))
+
+    def test_hit_after_first_load(self):
+        """Test that a store is only loaded once while unchanged."""
+        cache = VectorStoreCache()
+        loader = MagicMock(side_effect=lambda path: object())
+        first = cache.get(self.stores[0], loader)
+        second = cache.get(self.stores[0], loader)
+        self.assertIs(first, second)
+        loader.assert_called_once()
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_invalidate_forces_reload(self):
+        """Test that invalidating a store reloads it on the next access."""
+        cache = VectorStoreCache()
+        loader = MagicMock(side_effect=lambda path: object())
+        first = cache.get(self.stores[0], loader)
+        cache.invalidate(self.stores[0])
+        self.assertIsNot(first, cache.get(self.stores[0], loader))
+        self.assertEqual(loader.call_count, 2)
+
+    def test_evicts_least_recently_used(self):
+        """Test that the entry budget evicts the least recently used store."""
+        cache = VectorStoreCache(max_entries=1)
+        loader = MagicMock(side_effect=lambda path: object())
+        cache.get(self.stores[0], loader)
+        cache.get(self.stores[1], loader)
+        stats = cache.stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['evictions'], 1)
+
+
+class MergedRetrievalTests(TestCase):
+    """Test cases for merged retrieval across a session's documents."""
+
+    def setUp(self):
+        """Build two small FAISS stores with deterministic embeddings."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        with override_settings(MEDIA_ROOT=self.temp_dir.name):
+            self.processor = RAGProcessor('test-key')
+        self.processor.embeddings = DeterministicFakeEmbedding(size=16)
+        self.processor.store_cache = VectorStoreCache()
+        self.processor.response_cache = ResponseCache()
+        self.store_paths = []
+        for doc_id, texts in (('1', ['alpha facts', 'beta facts']),
+                              ('2', ['gamma facts', 'delta facts'])):
+            store = FAISS.from_texts(texts, self.processor.embeddings)
+            store_path, _ = self.processor.get_store_paths(doc_id)
+            store.save_local(str(store_path))
+            self.store_paths.append(str(store_path))
+
+    def test_retrieve_chunks_merges_stores_by_score(self):
+        """Test that the best chunk across all stores is ranked first."""
+        results = async_to_sync(self.processor.aretrieve_chunks)(self.store_paths, 'gamma facts')
+        self.assertEqual(results[0][0].page_content, 'gamma facts')
+
+    def test_document_scope_tolerates_empty_and_missing_stores(self):
+        """Test that a store emptied or removed mid-request does not break the scope."""
+        empty_store = Path(self.temp_dir.name) / 'empty_store'
+        empty_store.mkdir()
+        scope = self.processor.document_scope([str(empty_store)])
+        self.assertTrue(scope.endswith('@0'))
+        with patch.object(Path, 'iterdir', side_effect=FileNotFoundError):
+            scope = self.processor.document_scope(self.store_paths[:1])
+        self.assertTrue(scope.endswith('@missing'))
+
+    def test_rank_documents_orders_by_best_chunk(self):
+        """Test that documents are ranked by their closest chunk in one pass."""
+        self.processor.document_relevance_threshold = float('inf')
+        ranked = self.processor.rank_documents(self.store_paths, 'delta facts')
+        self.assertEqual([document.doc_id for document in ranked], ['2', '1'])
+        self.assertAlmostEqual(ranked[0].score, 0.0, places=4)
+        self.assertEqual(ranked[0].store_path, self.store_paths[1])
+
+    def test_relevance_gate_drops_distant_documents(self):
+        """Test that documents without a chunk under the threshold are gated out."""
+        self.processor.document_relevance_threshold = 1e-4
+        query_embedding = self.processor.embeddings.embed_query('alpha facts')
+        documents, chunks = self.processor.relevance_gate(self.store_paths, query_embedding)
+        self.assertEqual([document.doc_id for document in documents], ['1'])
+        self.assertEqual([chunk.page_content for chunk, _ in chunks], ['alpha facts'])
+
+    async def test_aquery_documents_awaits_one_llm_call(self):
+        """Test that several relevant documents produce a single generation."""
+        self.processor.document_relevance_threshold = float('inf')
+        llm = MagicMock()
+        llm.ainvoke = AsyncMock(return_value=MagicMock(content='async answer'))
+        with patch.object(self.processor, 'get_llm', return_value=llm):
+            answer = await self.processor.aquery_documents(self.store_paths, 'alpha facts', [])
+        self.assertEqual(answer, 'async answer')
+        llm.ainvoke.assert_awaited_once()
+
+    async def test_astream_query_yields_llm_tokens(self):
+        """Test that document answers are streamed from the LLM."""
+        self.processor.document_relevance_threshold = float('inf')
+
+        async def astream(prompt):
+            for content in ['part one ', 'part two']:
+                yield MagicMock(content=content)
+
+        llm = MagicMock()
+        llm.astream = astream
+        with patch.object(self.processor, 'get_llm', return_value=llm):
+            tokens = [token async for token in
+                      self.processor.astream_query(self.store_paths, 'alpha facts', [])]
+        self.assertEqual(tokens, ['part one ', 'part two'])
+
+    def test_document_answer_cached_per_document_set(self):
+        """Test that a cached document answer is dropped once the document set changes."""
+        self.processor.document_relevance_threshold = float('inf')
+        query_documents = async_to_sync(self.processor.aquery_documents)
+        llm = MagicMock()
+        llm.ainvoke = AsyncMock(side_effect=[MagicMock(content='first'),
+                                             MagicMock(content='second')])
+        with patch.object(self.processor, 'get_llm', return_value=llm):
+            query_documents(self.store_paths, 'alpha facts', [])
+            self.assertEqual(query_documents(self.store_paths, 'alpha facts', []), 'first')
+            store = FAISS.load_local(self.store_paths[1], self.processor.embeddings,
+                                     allow_dangerous_deserialization=True)
+            store.add_texts(['epsilon facts'])
+            store.save_local(self.store_paths[1])
+            index_file = Path(self.store_paths[1]) / 'index.faiss'
+            os.utime(index_file, (index_file.stat().st_atime, index_file.stat().st_mtime + 5))
+            self.assertEqual(query_documents(self.store_paths, 'alpha facts', []), 'second')
+
+
+class SessionIndexTests(TestCase):
+    """Test cases for the per-session incremental vector store."""
+
+    def setUp(self):
+        """Create a processor writing into a temporary media root."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        with override_settings(MEDIA_ROOT=self.temp_dir.name):
+            self.processor = RAGProcessor('test-key')
+        self.processor.embeddings = DeterministicFakeEmbedding(size=16)
+        self.processor.store_cache = VectorStoreCache()
+        self.session_id = str(uuid.uuid4())
+
+    def _index(self, doc_id, texts):
+        chunks = [LangchainDocument(page_content=text) for text in texts]
+        with self.processor.open_session_index(self.session_id) as writer:
+            chunk_ids = writer.add(chunks, doc_id)
+        store_path = writer.store_path
+        _, metadata_path = self.processor.get_store_paths(doc_id)
+        metadata_path.write_text(json.dumps(asdict(DocumentMetadata(
+            doc_id=doc_id, chunk_size=1000, chunk_overlap=200, num_chunks=len(chunks),
+            embedding_model='fake', session_id=self.session_id, chunk_ids=chunk_ids
+        ))), encoding='utf-8')
+        return store_path
+
+    def test_documents_share_one_session_store(self):
+        """Test that uploads in a session are merged into a single index."""
+        first = self._index('1', ['alpha', 'beta'])
+        second = self._index('2', ['gamma'])
+        self.assertEqual(first, second)
+        store = self.processor.load_vector_store(str(first))
+        self.assertEqual(store.index.ntotal, 3)
+
+    def test_remove_document_from_session_store(self):
+        """Test that removing a document drops only its chunks."""
+        store_path = self._index('1', ['alpha', 'beta'])
+        self._index('2', ['gamma'])
+        self.processor.remove_document('1', self.session_id)
+        store = self.processor.load_vector_store(str(store_path))
+        self.assertEqual(store.index.ntotal, 1)
+        self.processor.remove_document('2', self.session_id)
+        self.assertFalse(store_path.exists())
+
+    @skipIf(sys.platform == 'win32', 'probes the lock with fcntl')
+    def test_session_writer_locks_out_other_processes(self):
+        """Test that a session writer holds a lock another process cannot take."""
+        lock_path = self.processor.get_store_lock_path(
+            self.processor.get_session_store_path(self.session_id)
+        )
+        probe = ("import fcntl, sys; handle = open(sys.argv[1], 'a+b'); "
+                 "fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)")
+
+        def probe_lock():
+            return subprocess.run([sys.executable, '-c', probe, str(lock_path)],
+                                  capture_output=True).returncode
+
+        with self.processor.open_session_index(self.session_id):
+            self.assertNotEqual(probe_lock(), 0)
+        self.assertEqual(probe_lock(), 0)
+
+
+class MmapStoreTests(SessionIndexTests):
+    """Test cases for session stores saved in the memory-mapped format."""
+
+    def setUp(self):
+        """Write session stores in the mmap format."""
+        super().setUp()
+        self.processor.store_format = 'mmap'
+
+    def test_store_is_opened_without_unpickling(self):
+        """Test that mmap stores have no pickle and answer searches like FAISS."""
+        store_path = self._index('1', ['alpha', 'beta', 'gamma'])
+        self.assertFalse((store_path / 'index.pkl').exists())
+        store = self.processor.load_vector_store(str(store_path))
+        self.assertIsInstance(store, MmapVectorStore)
+
+        reference = FAISS.from_texts(['alpha', 'beta', 'gamma'], self.processor.embeddings)
+        query = self.processor.embeddings.embed_query('beta')
+        for result, expected in zip(
+            store.similarity_search_with_score_by_vector(query, k=3),
+            reference.similarity_search_with_score_by_vector(query, k=3)
+        ):
+            self.assertEqual(result[0].page_content, expected[0].page_content)
+            self.assertAlmostEqual(result[1], expected[1], places=3)
+        self.assertEqual(
+            [chunk.page_content for chunk, _ in async_to_sync(
+                self.processor.aretrieve_chunks)([str(store_path)], 'beta')][0],
+            'beta'
+        )
+
+    def test_saves_swap_versions_under_open_readers(self):
+        """Test that each save writes a new version and keeps only the previous one."""
+        store_path = self._index('1', ['alpha'])
+        reader = MmapVectorStore(store_path, self.processor.embeddings)
+        self._index('2', ['beta'])
+        self._index('3', ['gamma'])
+        self.assertEqual(len(list(store_path.glob('mmap-*'))), 2)
+        self.assertEqual(MmapVectorStore(store_path, self.processor.embeddings).index.ntotal, 3)
+        self.assertEqual(reader.similarity_search('alpha', k=1)[0].page_content, 'alpha')
+
+        manifest = json.loads((store_path / 'manifest.json').read_text(encoding='utf-8'))
+        with open(store_path / manifest['version'] / 'vectors.f32', 'r+b') as f:
+            f.truncate(16)
+        with self.assertRaises(ValueError):
+            MmapVectorStore(store_path, self.processor.embeddings)
+
+    def test_from_texts_writes_a_store(self):
+        """Test that from_texts embeds, writes and opens an mmap store."""
+        store_path = Path(self.temp_dir.name) / 'from_texts'
+        store = MmapVectorStore.from_texts(['alpha', 'beta'], self.processor.embeddings,
+                                           [{'doc_id': '1'}, {'doc_id': '2'}],
+                                           store_path=store_path)
+        self.assertTrue(is_mmap_store(store_path))
+        chunk = store.similarity_search('beta', k=1)[0]
+        self.assertEqual((chunk.page_content, chunk.metadata['doc_id']), ('beta', '2'))
+
+
+@override_settings(INDEX_SQ_THRESHOLD=3, INDEX_IVFPQ_THRESHOLD=400)
+class IndexTypeTests(TestCase):
+    """Test cases for the size-adaptive index type of session stores."""
+
+    def setUp(self):
+        """Create a processor writing into a temporary media root."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        with override_settings(MEDIA_ROOT=self.temp_dir.name):
+            self.processor = RAGProcessor('test-key')
+        self.processor.embeddings = DeterministicFakeEmbedding(size=16)
+        self.processor.store_cache = VectorStoreCache()
+        self.session_id = str(uuid.uuid4())
+
+    def _index(self, doc_id, count):
+        chunks = [LangchainDocument(page_content=f'chunk {doc_id} {index}')
+                  for index in range(count)]
+        with self.processor.open_session_index(self.session_id) as writer:
+            writer.add(chunks, doc_id)
+        return self.processor.load_vector_store(str(writer.store_path))
+
+    def test_store_switches_to_float16_past_threshold(self):
+        """Test that a growing store is rebuilt as a float16 index."""
+        self.assertEqual(index_type_of(self._index('1', 2).index), 'flat')
+        with self.processor.open_session_index(self.session_id) as writer:
+            self.assertIsNone(writer.originals)
+            writer.add([LangchainDocument(page_content=f'chunk 2 {index}')
+                        for index in range(2)], '2')
+        store = self.processor.load_vector_store(
+            str(self.processor.get_session_store_path(self.session_id))
+        )
+        self.assertEqual(index_type_of(store.index), 'sq_fp16')
+        self.assertEqual(store.index.ntotal, 4)
+        self.assertEqual(writer.originals.get(range(4)).shape, (4, 16))
+        store_path = self.processor.get_session_store_path(self.session_id)
+        results = async_to_sync(self.processor.aretrieve_chunks)([str(store_path)], 'chunk 2 1')
+        self.assertEqual(results[0][0].page_content, 'chunk 2 1')
+
+    def test_ivf_pq_store_removes_documents_by_rebuilding(self):
+        """Test that removing from an IVF-PQ store keeps positions contiguous."""
+        self._index('1', 200)
+        store = self._index('2', 200)
+        self.assertEqual(index_type_of(store.index), 'ivf_pq')
+        with self.processor.open_session_index(self.session_id) as writer:
+            writer.remove([f'1-{index}' for index in range(200)])
+        store = self.processor.load_vector_store(
+            str(self.processor.get_session_store_path(self.session_id))
+        )
+        self.assertEqual(index_type_of(store.index), 'sq_fp16')
+        self.assertEqual(sorted(store.index_to_docstore_id), list(range(200)))
+        self.assertTrue(all(chunk_id.startswith('2-')
+                            for chunk_id in store.index_to_docstore_id.values()))
+
+    def test_quantized_stores_rebuild_from_original_vectors(self):
+        """Test that rebuilds start from the full-precision vectors, not the codes."""
+        self._index('1', 200)
+        self._index('2', 200)
+        store_path = self.processor.get_session_store_path(self.session_id)
+        originals = np.fromfile(store_path / 'originals.f32', dtype=np.float32)
+        self.assertEqual(originals.shape, (400 * 16,))
+        with self.processor.open_session_index(self.session_id) as writer:
+            writer.remove([f'1-{index}' for index in range(200)])
+        store = self.processor.load_vector_store(str(store_path))
+        expected = np.asarray(self.processor.embeddings.embed_documents(
+            [store.docstore.search(store.index_to_docstore_id[position]).page_content
+             for position in range(200)]
+        ), dtype=np.float32)
+        np.testing.assert_allclose(store.index.reconstruct_n(0, 200), expected, atol=1e-3)
+
+    def test_mmap_stores_stay_flat(self):
+        """Test that mmap stores are never quantized and record the flat type."""
+        self.processor.store_format = 'mmap'
+        self._index('1', 2)
+        with self.processor.open_session_index(self.session_id) as writer:
+            writer.add([LangchainDocument(page_content=f'chunk 2 {index}')
+                        for index in range(2)], '2')
+        self.assertEqual(writer.index_type, 'flat')
+        store_path = self.processor.get_session_store_path(self.session_id)
+        store = self.processor.load_vector_store(str(store_path))
+        self.assertIsInstance(store, MmapVectorStore)
+        self.assertEqual(store.index.ntotal, 4)
+        self.assertFalse((store_path / 'originals.f32').exists())
+
+
+class LexicalIndexTests(TestCase):
+    """Test cases for the BM25 index kept alongside each session store."""
+
+    def setUp(self):
+        """Index two chunks into a session store under a temporary media root."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        with override_settings(MEDIA_ROOT=self.temp_dir.name):
+            self.processor = RAGProcessor('test-key')
+        self.processor.embeddings = DeterministicFakeEmbedding(size=16)
+        self.processor.store_cache = VectorStoreCache()
+        self.session_id = str(uuid.uuid4())
+        chunks = [LangchainDocument(page_content='Error ERR-4011 means the disk is full'),
+                  LangchainDocument(page_content='Invoices are due within thirty days')]
+        with self.processor.open_session_index(self.session_id) as writer:
+            self.chunk_ids = writer.add(chunks, '1')
+        self.store_paths = [str(writer.store_path)]
+        self.retrieve_chunks = async_to_sync(self.processor.aretrieve_chunks)
+
+    def test_keyword_query_skips_the_embedding(self):
+        """Test that an identifier found lexically is answered without embedding it."""
+        with patch.object(DeterministicFakeEmbedding, 'embed_query') as mock_embed:
+            results = self.retrieve_chunks(self.store_paths, 'ERR-4011')
+        mock_embed.assert_not_called()
+        self.assertEqual(results[0][0].page_content, 'Error ERR-4011 means the disk is full')
+        self.assertEqual(results[0][0].metadata['doc_id'], '1')
+
+    def test_keyword_queries_need_an_identifier(self):
+        """Test that only codes, numbers and identifiers make a query keyword-like."""
+        for query in ('ERR-4011', 'section 4.2', 'settings.py?', '"disk is full"'):
+            self.assertTrue(is_keyword_query(query), query)
+        for query in ('Hi!', "What's this?", 'Summarize it.', 'thanks :)'):
+            self.assertFalse(is_keyword_query(query), query)
+        self.assertEqual(tokenize("What's this?"), [])
+
+    def test_embedding_failure_falls_back_to_lexical_index(self):
+        """Test that a failing embedding call is bridged only when BM25 matches."""
+        with patch.object(DeterministicFakeEmbedding, 'embed_query',
+                          side_effect=exceptions.ResourceExhausted('quota')):
+            results = self.retrieve_chunks(self.store_paths, 'When are invoices due?')
+            self.assertEqual([chunk.page_content for chunk, _ in results],
+                             ['Invoices are due within thirty days'])
+            with self.assertRaises(exceptions.ResourceExhausted):
+                self.retrieve_chunks(self.store_paths, 'Who won the cup?')
+
+    def test_removed_chunks_leave_the_lexical_index(self):
+        """Test that lexical postings follow removals and hybrid ranks shared hits first."""
+        with self.processor.open_session_index(self.session_id) as writer:
+            writer.remove(self.chunk_ids[1:])
+        self.assertEqual(self.processor.lexical_search(self.store_paths, 'invoices due'), [])
+
+        first, second = (LangchainDocument(id=chunk_id, page_content=chunk_id)
+                         for chunk_id in ('a', 'b'))
+        fused = self.processor.fuse_results([(first, 0.1), (second, 0.2)], [(second, 3.0)])
+        self.assertEqual([chunk.id for chunk, _ in fused], ['b', 'a'])
+
+
+class CachedEmbeddingsTests(TestCase):
+    """Test cases for the query embedding memoization layer."""
+
+    def test_query_embedded_once(self):
+        """Test that repeated questions only reach the wrapped model once."""
+        inner = MagicMock()
+        inner.embed_query.return_value = [0.5, 0.25]
+        embeddings = CachedEmbeddings(inner, model_name='fake')
+        self.assertEqual(embeddings.embed_query('What is  this?'), [0.5, 0.25])
+        self.assertEqual(embeddings.embed_query(' What is this? '), [0.5, 0.25])
+        inner.embed_query.assert_called_once()
+        self.assertEqual(embeddings.stats()['hits'], 1)
+
+    def test_persisted_across_instances(self):
+        """Test that persisted query embeddings survive a restart."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = Path(temp_dir) / 'embeddings.sqlite3'
+            inner = MagicMock()
+            inner.embed_query.return_value = [0.5, 0.25]
+            CachedEmbeddings(inner, 'fake', db_path=db_path,
+                             persist_queries=True).embed_query('hello')
+            restarted = CachedEmbeddings(inner, 'fake', db_path=db_path, persist_queries=True)
+            self.assertEqual(restarted.embed_query('hello'), [0.5, 0.25])
+            inner.embed_query.assert_called_once()
+
+
+class DuplicateUploadTests(TestCase):
+    """Test cases for chunk embedding reuse and duplicate upload detection."""
+
+    def setUp(self):
+        """Create a processor with a persistent chunk cache in a temp dir."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        with override_settings(MEDIA_ROOT=self.temp_dir.name):
+            self.processor = RAGProcessor('test-key')
+        self.inner = MagicMock(wraps=DeterministicFakeEmbedding(size=16))
+        self.processor.embeddings = CachedEmbeddings(
+            self.inner, 'fake', db_path=Path(self.temp_dir.name) / 'cache.sqlite3'
+        )
+        self.processor.store_cache = VectorStoreCache()
+        self.session_id = str(uuid.uuid4())
+        self.pages = [LangchainDocument(page_content='page one text'),
+                      LangchainDocument(page_content='page two text')]
+
+    def _write_pdf(self, name, content):
+        file_path = Path(self.temp_dir.name) / name
+        file_path.write_bytes(content)
+        return str(file_path)
+
+    @patch('chatbot.utils.rag_utils.PyPDFLoader')
+    def test_identical_upload_reuses_index(self, mock_loader):
+        """Test that an identical re-upload is neither parsed nor embedded."""
+        mock_loader.return_value.lazy_load.side_effect = lambda: (
+            LangchainDocument(page_content=page.page_content) for page in self.pages
+        )
+        self.processor.process_document(self._write_pdf('a.pdf', b'same'), '1', self.session_id)
+        store_path = self.processor.process_document(
+            self._write_pdf('b.pdf', b'same'), '2', self.session_id
+        )
+        mock_loader.assert_called_once()
+        self.inner.embed_documents.assert_called_once()
+        self.assertEqual(self.processor.read_metadata('2').num_chunks, 2)
+        self.assertEqual(self.processor.read_metadata('2').embedding_model, 'fake')
+        self.assertEqual(self.processor.load_vector_store(store_path).index.ntotal, 4)
+
+    @patch('chatbot.utils.rag_utils.PyPDFLoader')
+    def test_known_chunks_are_not_re_embedded(self, mock_loader):
+        """Test that chunks already embedded are served from the cache."""
+        mock_loader.return_value.lazy_load.side_effect = lambda: (
+            LangchainDocument(page_content=page.page_content) for page in self.pages
+        )
+        self.processor.process_document(self._write_pdf('a.pdf', b'one'), '1', self.session_id)
+        self.processor.process_document(self._write_pdf('b.pdf', b'two'), '2', self.session_id)
+        self.assertEqual(mock_loader.call_count, 2)
+        self.inner.embed_documents.assert_called_once()
+        self.assertEqual(self.processor.embeddings.stats()['chunk_hits'], 2)
+
+    def test_repeated_chunks_in_a_batch_are_not_hits(self):
+        """Test that a chunk repeated in one batch is embedded once and is not a hit."""
+        self.processor.embeddings.embed_documents(['same text', 'same text', 'other text'])
+        self.inner.embed_documents.assert_called_once_with(['same text', 'other text'])
+        stats = self.processor.embeddings.stats()
+        self.assertEqual((stats['chunk_hits'], stats['chunk_misses']), (0, 2))
+        self.processor.embeddings.embed_documents(['same text', 'same text'])
+        self.assertEqual(self.processor.embeddings.stats()['chunk_hits'], 2)
+
+    @override_settings(INGESTION_BATCH_SIZE=1)
+    @patch('chatbot.utils.rag_utils.PyPDFLoader')
+    def test_pages_are_embedded_in_batches(self, mock_loader):
+        """Test that pages are streamed and embedded one batch at a time."""
+        mock_loader.return_value.lazy_load.side_effect = lambda: (
+            LangchainDocument(page_content=page.page_content) for page in self.pages
+        )
+        stages = []
+        self.processor.process_document(self._write_pdf('a.pdf', b'one'), '1', self.session_id,
+                                        on_stage=stages.append)
+        mock_loader.return_value.load.assert_not_called()
+        self.assertEqual(self.inner.embed_documents.call_count, 2)
+        self.assertEqual(stages, ['parsing', 'embedding', 'embedding'])
+        self.assertEqual(self.processor.read_metadata('1').chunk_ids, ['1-0', '1-1'])
+
+    @patch('chatbot.utils.rag_utils.PyPDFLoader')
+    def test_pdf_without_text_fails(self, mock_loader):
+        """Test that a PDF yielding no chunks is rejected instead of indexed."""
+        mock_loader.return_value.lazy_load.side_effect = lambda: iter(
+            [LangchainDocument(page_content='')]
+        )
+        with self.assertRaisesRegex(ValueError, 'No text'):
+            self.processor.process_document(
+                self._write_pdf('scan.pdf', b'scan'), '1', self.session_id
+            )
+        self.assertFalse(self.processor.get_session_store_path(self.session_id).exists())
+        self.assertIsNone(self.processor.read_metadata('1'))
+
+    def test_parallel_extraction_matches_sequential_order(self):
+        """Test that page ranges extracted in worker processes match the loader's chunks."""
+        pdf_path = str(write_synthetic_pdf(Path(self.temp_dir.name) / 'long.pdf', 5))
+
+        def chunks(workers):
+            with override_settings(PDF_EXTRACTION_WORKERS=workers,
+                                   PDF_PARALLEL_MIN_PAGES=2, PDF_PAGES_PER_TASK=2):
+                return [chunk for batch in RAGProcessor.iter_pdf_chunks(pdf_path, 500, 50, 3)
+                        for chunk in batch]
+
+        sequential, parallel = chunks(1), chunks(2)
+        self.assertEqual([chunk.page_content for chunk in parallel],
+                         [chunk.page_content for chunk in sequential])
+        self.assertEqual([chunk.metadata for chunk in parallel],
+                         [chunk.metadata for chunk in sequential])
+        self.assertIn('producer', parallel[0].metadata)
+
+
+class RoutingIndexTests(TestCase):
+    """Test cases for the per-user routing index of document centroids."""
+
+    def setUp(self):
+        """Ingest one single-page document into each of two sessions."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        with override_settings(MEDIA_ROOT=self.temp_dir.name):
+            self.processor = RAGProcessor('test-key')
+        self.processor.embeddings = CachedEmbeddings(DeterministicFakeEmbedding(size=16), 'fake')
+        self.processor.store_cache = VectorStoreCache()
+        self.store_paths = []
+        for doc_id, text in (('1', 'alpha facts'), ('2', 'gamma facts')):
+            file_path = Path(self.temp_dir.name) / f'{doc_id}.pdf'
+            file_path.write_bytes(text.encode())
+            with patch('chatbot.utils.rag_utils.PyPDFLoader') as mock_loader:
+                mock_loader.return_value.lazy_load.side_effect = lambda text=text: iter(
+                    [LangchainDocument(page_content=text)]
+                )
+                self.store_paths.append(self.processor.process_document(
+                    str(file_path), doc_id, str(uuid.uuid4()), user_id=7
+                ))
+
+    def test_irrelevant_store_is_not_loaded(self):
+        """Test that a store whose centroids rule it out is never opened."""
+        with patch.object(self.processor, 'load_vector_store',
+                          wraps=self.processor.load_vector_store) as mock_load:
+            results = async_to_sync(self.processor.aretrieve_chunks)(
+                self.store_paths, 'alpha facts', user_id=7, doc_ids=['1', '2']
+            )
+        mock_load.assert_called_once_with(self.store_paths[0])
+        self.assertEqual([chunk.page_content for chunk, _ in results], ['alpha facts'])
+
+    def test_unrouted_document_searches_every_store(self):
+        """Test that a document missing from the index disables routing."""
+        self.processor.routing_index.remove(7, '2')
+        routed = self.processor.routing_index.route(
+            7, ['1', '2'], self.store_paths,
+            self.processor.embeddings.embed_query('alpha facts'), 0.7
+        )
+        self.assertEqual(routed, self.store_paths)
+        self.assertEqual(self.processor.routing_index.load(7).doc_ids.tolist(), ['1'])
+
+
+class ReclaimTests(TestCase):
+    """Test cases for tombstoned session deletion and background reclamation."""
+
+    def setUp(self):
+        """Upload one document into each of two sessions under a temp media root."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        media = override_settings(MEDIA_ROOT=self.temp_dir.name, INGESTION_EAGER=True)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.processor = RAGProcessor('test-key')
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.docs = {}
+        for name in ('deleted', 'kept'):
+            session_id = str(uuid.uuid4())
+            Chat.objects.create(user=self.user, session_id=session_id,
+                                message='Hello', response='Hi', created_at=timezone.now())
+            self.docs[name] = Document.objects.create(
+                user=self.user, session_id=session_id, title=f'{name}.pdf',
+                file=ContentFile(b'%PDF', name=f'{name}.pdf'),
+                status=Document.STATUS_INDEXED
+            )
+
+    def test_delete_session_reclaims_only_its_documents(self):
+        """Test that deleting a session removes its documents and nothing else."""
+        deleted, kept = self.docs['deleted'], self.docs['kept']
+        self.client.login(username='testuser', password='testpassword')
+        with patch('chatbot.views.rag_processor', self.processor):
+            self.client.get(reverse('delete_session', args=[deleted.session_id]))
+        self.assertFalse(Document.objects.filter(pk=deleted.pk).exists())
+        self.assertFalse(Path(deleted.file.path).exists())
+        kept.refresh_from_db()
+        self.assertIsNone(kept.deleted_at)
+        self.assertTrue(Path(kept.file.path).exists())
+        self.assertTrue(Chat.objects.filter(session_id=kept.session_id).exists())
+
+    def test_documents_being_ingested_are_left_to_the_ingestion_job(self):
+        """Test that tombstoned documents still in the pipeline are not reclaimed."""
+        Document.objects.filter(pk=self.docs['deleted'].pk).update(
+            deleted_at=timezone.now(), status=Document.STATUS_EMBEDDING
+        )
+        self.assertEqual(reclaim_deleted_documents(self.processor), 0)
+        self.assertTrue(Document.objects.filter(pk=self.docs['deleted'].pk).exists())
+
+        Document.objects.filter(pk=self.docs['deleted'].pk).update(
+            status_updated_at=timezone.now() - timedelta(days=1)
+        )
+        self.assertEqual(reclaim_deleted_documents(self.processor), 1)
+
+    def test_interrupted_ingestion_is_re_enqueued(self):
+        """Test that documents left in progress by a stopped worker are queued again."""
+        kept = self.docs['kept']
+        Document.objects.filter(pk=kept.pk).update(status=Document.STATUS_PARSING)
+        with patch('chatbot.utils.ingestion.ingestion_queue') as mock_queue:
+            self.assertEqual(recover_interrupted_documents(self.processor), 0)
+            Document.objects.filter(pk=kept.pk).update(
+                status_updated_at=timezone.now() - timedelta(days=1)
+            )
+            self.assertEqual(recover_interrupted_documents(self.processor), 1)
+        mock_queue.enqueue.assert_called_once_with(kept.pk, self.processor)
+        kept.refresh_from_db()
+        self.assertEqual(kept.status, Document.STATUS_QUEUED)
+
+    def test_sweep_removes_stale_orphans_only(self):
+        """Test that unreferenced files are swept once past the grace period."""
+        orphan_store = self.processor.get_session_store_path(str(uuid.uuid4()))
+        live_store = self.processor.get_session_store_path(str(self.docs['kept'].session_id))
+        for store_path in (orphan_store, live_store):
+            store_path.mkdir()
+        orphan_upload = Path(self.temp_dir.name) / 'documents' / 'orphan.pdf'
+        orphan_upload.write_bytes(b'%PDF')
+        centroids, radii = np.ones((1, 4), dtype=np.float32), np.zeros(1, dtype=np.float32)
+        routing = self.processor.routing_index
+        routing.add(self.user.id, str(self.docs['kept'].id), str(live_store), centroids, radii)
+        routing.add(self.user.id, 'gone', str(orphan_store), centroids, radii)
+        routing.add(self.user.id + 1, 'gone', str(orphan_store), centroids, radii)
+
+        removed = sweep_orphans(self.processor)
+        self.assertEqual((removed['stores'], removed['routing']), (0, 2))
+        removed = sweep_orphans(self.processor, grace=0)
+        self.assertEqual((removed['stores'], removed['uploads']), (1, 1))
+        self.assertEqual(routing.load(self.user.id).doc_ids.tolist(),
+                         [str(self.docs['kept'].id)])
+        self.assertFalse(routing.path(self.user.id + 1).exists())
+        self.assertFalse(orphan_store.exists())
+        self.assertFalse(orphan_upload.exists())
+        self.assertTrue(live_store.exists())
+        self.assertTrue(Path(self.docs['kept'].file.path).exists())
+
+
+class EmbeddingClientTests(TestCase):
+    """Test cases for the batched, rate-limited embedding client."""
+
+    def test_token_bucket_paces_requests(self):
+        """Test that the bucket waits for a refill once its burst is spent."""
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        bucket = TokenBucket(60, capacity=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(sleeps, [1.0])
+
+    def test_priority_callers_are_served_first(self):
+        """Test that a waiting query takes the next token ahead of background requests."""
+        now = [0.0]
+        refused = []
+        bucket = TokenBucket(60, clock=lambda: now[0])
+
+        def sleep(seconds):
+            now[0] += seconds
+            refused.append(bucket._try_take() > 0)
+
+        bucket._sleep = sleep
+        bucket.acquire()
+        bucket.acquire(priority=True)
+        self.assertEqual(refused, [True])
+        now[0] += 1.0
+        self.assertEqual(bucket._try_take(), 0.0)
+
+    def test_query_embeddings_acquire_with_priority(self):
+        """Test that query embeddings are paced ahead of document batches."""
+        rate_limiter = MagicMock()
+        client = BatchedEmbeddings(MagicMock(), rate_limiter=rate_limiter)
+        client.embed_query('hello')
+        client.embed_documents(['chunk'])
+        self.assertEqual(rate_limiter.acquire.call_args_list,
+                         [((True,),), ((False,),)])
+
+    def test_batches_preserve_order(self):
+        """Test that texts are split into maximal batches and reassembled in order."""
+        inner = MagicMock()
+        inner.embed_documents.side_effect = lambda texts: [[float(text)] for text in texts]
+        client = BatchedEmbeddings(inner, batch_size=100, concurrency=3,
+                                   rate_limiter=TokenBucket(10 ** 6, capacity=10))
+        texts = [str(index) for index in range(250)]
+        vectors = client.embed_documents(texts)
+        self.assertEqual(vectors, [[float(index)] for index in range(250)])
+        self.assertEqual(inner.embed_documents.call_count, 3)
+
+    @patch('tenacity.nap.time.sleep')
+    def test_quota_errors_are_retried(self, _mock_sleep):
+        """Test that a quota rejection is retried instead of failing ingestion."""
+        wrapped_error = RuntimeError('Error embedding content')
+        wrapped_error.__cause__ = exceptions.ResourceExhausted('quota')
+        inner = MagicMock()
+        inner.embed_query.side_effect = [wrapped_error, [1.0]]
+        client = BatchedEmbeddings(inner, rate_limiter=TokenBucket(10 ** 6, capacity=10))
+        self.assertEqual(client.embed_query('hello'), [1.0])
+        self.assertEqual(inner.embed_query.call_count, 2)
+
+
+@override_settings(CHAT_MEMORY_WINDOW=2, CHAT_SUMMARY_BATCH=2, INGESTION_EAGER=True)
+class ConversationMemoryTests(TestCase):
+    """Test cases for the rolling conversation summary."""
+
+    def setUp(self):
+        """Create a session with a welcome turn and five turns."""
+        self.user = User.objects.create_user(username='memoryuser', password='testpassword')
+        self.session_id = str(uuid.uuid4())
+        Chat.objects.create(user=self.user, session_id=self.session_id, message='',
+                            response='Hi memoryuser, welcome.')
+        for index in range(5):
+            Chat.objects.create(user=self.user, session_id=self.session_id,
+                                message=f'question {index}', response=f'answer {index}')
+
+    @patch('chatbot.utils.memory.summarize_turns')
+    async def test_expired_turns_are_summarized_once(self, mock_summarize):
+        """Test that only turns leaving the window are summarized, and only once."""
+        mock_summarize.return_value = 'summary of 0-2'
+        summary, recent = await aload_conversation_memory(self.user, self.session_id)
+        self.assertEqual(summary, '')
+        self.assertEqual([turn['message'] for turn in recent],
+                         ['question 1', 'question 2', 'question 3', 'question 4'])
+        folded = mock_summarize.call_args.args[1]
+        self.assertEqual([turn['message'] for turn in folded],
+                         ['question 0', 'question 1', 'question 2'])
+
+        summary, recent = await aload_conversation_memory(self.user, self.session_id)
+        self.assertEqual(summary, 'summary of 0-2')
+        self.assertEqual([turn['message'] for turn in recent], ['question 3', 'question 4'])
+        mock_summarize.assert_called_once()
+
+    @patch('chatbot.utils.memory.summarize_turns')
+    async def test_failed_summary_is_retried(self, mock_summarize):
+        """Test that a failed summarization leaves the turns to fold later."""
+        mock_summarize.side_effect = RuntimeError('API down')
+        summary, recent = await aload_conversation_memory(self.user, self.session_id)
+        self.assertEqual(summary, '')
+        self.assertEqual(len(recent), 4)
+        mock_summarize.side_effect = None
+        mock_summarize.return_value = 'summary'
+        await aload_conversation_memory(self.user, self.session_id)
+        summary, _ = await aload_conversation_memory(self.user, self.session_id)
+        self.assertEqual(summary, 'summary')
+
+    @patch('chatbot.utils.memory.summarize_turns', return_value='summary')
+    def test_summary_row_created_concurrently_is_reused(self, _mock_summarize):
+        """Test that losing the race to create the summary row falls back to reading it."""
+        existing = ConversationSummary.objects.create(user=self.user, session_id=self.session_id)
+        with patch.object(ConversationSummary.objects, 'get_or_create',
+                          side_effect=IntegrityError('unique_conversation_summary')):
+            summarize_conversation(self.user.id, self.session_id)
+        existing.refresh_from_db()
+        self.assertEqual(existing.summary, 'summary')
+
+
+class ChatSessionTests(TestCase):
+    """Test cases for the ChatSession aggregates behind the sidebar."""
+
+    def setUp(self):
+        """Create a logged in user."""
+        self.user = User.objects.create_user(username='sessionuser', password='testpassword')
+        self.client.login(username='sessionuser', password='testpassword')
+
+    def _create_session(self, first_message):
+        session_id = uuid.uuid4()
+        Chat.objects.create(user=self.user, session_id=session_id, message='',
+                            response='Welcome')
+        Chat.objects.create(user=self.user, session_id=session_id, message=first_message,
+                            response='Answer')
+        return session_id
+
+    def test_aggregates_maintained_on_write(self):
+        """Test that title, counts and activity follow chat and document writes."""
+        session_id = self._create_session('A fairly long first question about documents')
+        Chat.objects.create(user=self.user, session_id=session_id, message='Second',
+                            response='Answer')
+        document = Document.objects.create(user=self.user, session_id=session_id,
+                                           title='doc.pdf')
+        session = ChatSession.objects.get(user=self.user, session_id=session_id)
+        self.assertEqual(session.title, 'A fairly long first question a...')
+        self.assertEqual(session.message_count, 2)
+        self.assertEqual(session.document_count, 1)
+        document.delete()
+        session.refresh_from_db()
+        self.assertEqual(session.document_count, 0)
+
+    def test_late_chat_keeps_title_and_activity(self):
+        """Test that a chat stored out of order neither retitles nor rewinds the session."""
+        session_id = self._create_session('First question')
+        session = ChatSession.objects.get(user=self.user, session_id=session_id)
+        late = Chat(user=self.user, session_id=session_id, message='Late question',
+                    response='Answer')
+        late.created_at = session.last_activity_at - timedelta(minutes=5)
+        post_save.send(sender=Chat, instance=late, created=True)
+        late_session = ChatSession.objects.get(pk=session.pk)
+        self.assertEqual(late_session.title, 'First question')
+        self.assertEqual(late_session.message_count, 2)
+        self.assertEqual(late_session.last_activity_at, session.last_activity_at)
+
+    def test_only_live_documents_are_counted(self):
+        """Test that failed and tombstoned documents stop counting against the session."""
+        session_id = self._create_session('Question')
+        failing, deleted = (
+            Document.objects.create(user=self.user, session_id=session_id, title=title)
+            for title in ('failing.pdf', 'deleted.pdf')
+        )
+        processor = MagicMock()
+        processor.process_document.side_effect = ValueError('bad pdf')
+        ingest_document(failing.id, processor)
+        ingest_document(failing.id, processor)
+        session = ChatSession.objects.get(user=self.user, session_id=session_id)
+        self.assertEqual(session.document_count, 1)
+        Document.objects.filter(pk=deleted.pk).update(deleted_at=timezone.now())
+        ChatSession.forget_documents(self.user.id, session_id)
+        for document in (failing, deleted):
+            Document.objects.get(pk=document.pk).delete()
+        session.refresh_from_db()
+        self.assertEqual(session.document_count, 0)
+
+    def test_sidebar_query_count_independent_of_sessions(self):
+        """Test that rendering the sidebar does not issue a query per session."""
+        current = self._create_session('Current')
+        url = reverse('chatbot') + f'?session_id={current}'
+        with CaptureQueriesContext(connection) as few_sessions:
+            self.client.get(url)
+        for index in range(5):
+            self._create_session(f'Question {index}')
+        with CaptureQueriesContext(connection) as many_sessions:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['all_sessions']), 6)
+        self.assertGreater(len(few_sessions), 0)
+        self.assertEqual(len(many_sessions), len(few_sessions))
+
+
+@override_settings(CHAT_HISTORY_PAGE_SIZE=2)
+class ChatHistoryPaginationTests(TestCase):
+    """Test cases for the keyset-paginated chat history."""
+
+    def setUp(self):
+        """Create a session with five messages sharing one timestamp."""
+        self.user = User.objects.create_user(username='historyuser', password='testpassword')
+        self.client.login(username='historyuser', password='testpassword')
+        self.session_id = str(uuid.uuid4())
+        for index in range(5):
+            Chat.objects.create(user=self.user, session_id=self.session_id,
+                                message=f'question {index}', response=f'answer {index}')
+        Chat.objects.filter(session_id=self.session_id).update(created_at=timezone.now())
+
+    def test_page_renders_latest_messages(self):
+        """Test that the chat page only renders the latest page."""
+        response = self.client.get(reverse('chatbot') + f'?session_id={self.session_id}')
+        self.assertEqual([chat.message for chat in response.context['chats']],
+                         ['question 3', 'question 4'])
+        self.assertIsNotNone(response.context['older_cursor'])
+
+    def test_walks_back_through_history(self):
+        """Test that following cursors returns every older message exactly once."""
+        url = reverse('chat_history', args=[self.session_id])
+        cursor = self.client.get(url).json()['older_cursor']
+        messages = []
+        while cursor:
+            data = self.client.get(url, {'before': cursor}).json()
+            messages = [chat['message'] for chat in data['messages']] + messages
+            cursor = data['older_cursor']
+        self.assertEqual(messages, ['question 0', 'question 1', 'question 2'])
+
+    def test_invalid_cursor_rejected(self):
+        """Test that a malformed cursor is a client error."""
+        response = self.client.get(reverse('chat_history', args=[self.session_id]),
+                                   {'before': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ResponseCacheTests(TestCase):
+    """Test cases for the exact and semantic response cache."""
+
+    def setUp(self):
+        """Create a cache with a controllable clock."""
+        self.now = 0.0
+        self.cache = ResponseCache(max_entries=2, ttl=60, clock=lambda: self.now)
+
+    def test_exact_hits_expire_and_evict(self):
+        """Test normalized exact hits, scoping, TTL expiry and LRU eviction."""
+        self.cache.store('You: hello\nAI Chatbot:', 'model', 'Hi!')
+        self.assertEqual(self.cache.lookup('You:  hello\n AI Chatbot:', 'model'), 'Hi!')
+        self.assertIsNone(self.cache.lookup('You: hello\nAI Chatbot:', 'model', scope='doc'))
+        self.cache.store('first', 'model', 'one')
+        self.cache.store('second', 'model', 'two')
+        self.assertIsNone(self.cache.lookup('You: hello\nAI Chatbot:', 'model'))
+        self.now = 61
+        self.assertIsNone(self.cache.lookup('second', 'model'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_similar_standalone_question_reuses_answer(self):
+        """Test that the semantic tier matches similar questions in the same scope only."""
+        embeddings = MagicMock()
+        embeddings.embed_query.side_effect = lambda text: (
+            [1.0, 0.1] if 'document' in text else [0.0, 1.0]
+        )
+        cache = ResponseCache(similarity_threshold=0.95, embeddings=embeddings)
+        cache.store('prompt a', 'model', 'A summary.', scope='docs',
+                    query='what is this document about')
+        self.assertEqual(cache.lookup('prompt b', 'model', scope='docs',
+                                      query='what is the document about?'), 'A summary.')
+        self.assertIsNone(cache.lookup('prompt b', 'model', scope='other',
+                                       query='what is the document about?'))
+        self.assertIsNone(cache.lookup('prompt c', 'model', scope='docs', query='hello'))
+
+    @patch('chatbot.utils.ask_gemini.get_gemini_model')
+    async def test_repeated_question_skips_generation(self, mock_model):
+        """Test that a repeated question is generated once per user and errors are not cached."""
+        from .utils.ask_gemini import aask_gemini
+        mock_model.return_value.generate_content_async = AsyncMock(
+            side_effect=[RuntimeError('quota'), MagicMock(text='Hello!'), MagicMock(text='Hey!')]
+        )
+        history = [{'message': '', 'response': 'Hi testuser, welcome.'}]
+        embeddings = MagicMock()
+        embeddings.aembed_query = AsyncMock(return_value=[1.0, 0.0])
+        cache = ResponseCache(similarity_threshold=0.95, embeddings=embeddings)
+        with patch('chatbot.utils.ask_gemini.response_cache', cache):
+            self.assertIn('error occurred', await aask_gemini('hello', history, user_id=1))
+            self.assertEqual(await aask_gemini('hello', history, user_id=1), 'Hello!')
+            self.assertEqual(await aask_gemini('hello', [], user_id=1), 'Hello!')
+            self.assertEqual(await aask_gemini('hello there', [], user_id=2), 'Hey!')
+        self.assertEqual(mock_model.return_value.generate_content_async.await_count, 3)
+
+
+class ClientRegistryTests(TestCase):
+    """Test cases for the long-lived client registry."""
+
+    def test_clients_shared_per_event_loop(self):
+        """Test that a client is built once outside a loop and once per running loop."""
+        registry = ClientRegistry()
+        factory = MagicMock(side_effect=lambda: object())
+        shared = registry.get('model', factory)
+        self.assertIs(registry.get('model', factory), shared)
+
+        async def get_in_loop():
+            return registry.get('model', factory), registry.get('model', factory)
+
+        first, second = asyncio.run(get_in_loop())
+        self.assertIs(first, second)
+        self.assertIsNot(first, shared)
+        self.assertEqual(factory.call_count, 2)
+
+
+class BackendTests(TestCase):
+    """Test cases for the offline LLM and embedding backends."""
+
+    def setUp(self):
+        """Use a temporary recordings directory and a fresh client registry."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        registry_patcher = patch('chatbot.utils.clients.client_registry', ClientRegistry())
+        registry_patcher.start()
+        self.addCleanup(registry_patcher.stop)
+
+    @override_settings(LLM_BACKEND='fake')
+    def test_fake_llm_is_deterministic(self):
+        """Test that the fake backend answers the same prompt identically, streamed or not."""
+        model = get_gemini_model()
+        answer = model.generate_content('You: hello\nAI Chatbot:').text
+        streamed = ''.join(chunk.text for chunk in
+                           model.generate_content('You: hello\nAI Chatbot:', stream=True))
+        self.assertEqual(answer, streamed)
+        self.assertNotEqual(answer, model.generate_content('You: bye\nAI Chatbot:').text)
+
+    def test_recorded_responses_replay_offline(self):
+        """Test that recorded chunks are replayed for both client interfaces."""
+        live = MagicMock()
+        live.generate_content.return_value = iter([MagicMock(text='recorded '),
+                                                   MagicMock(text='answer')])
+        with override_settings(LLM_BACKEND='record', BACKEND_RECORDINGS_DIR=self.temp_dir.name):
+            recorder = BackendGenerativeModel(build_text_model('gemini-test', lambda: live))
+            self.assertEqual(recorder.generate_content('prompt').text, 'recorded answer')
+        with override_settings(LLM_BACKEND='replay', BACKEND_RECORDINGS_DIR=self.temp_dir.name):
+            replay = build_text_model('gemini-test', MagicMock())
+            self.assertEqual(BackendChatModel(text_model=replay).invoke('prompt').content,
+                             'recorded answer')
+            with self.assertRaises(LookupError):
+                BackendGenerativeModel(replay).generate_content('unknown prompt')
+        live.generate_content.assert_called_once()
+
+    def test_hash_embeddings_and_error_injection(self):
+        """Test that shared words mean similar vectors and injected errors are quota errors."""
+        embeddings = HashEmbeddings(size=64)
+        query, related, unrelated = embeddings.embed_documents(
+            ['solar panel output', 'output of a solar panel', 'quarterly tax filing']
+        )
+        self.assertGreater(sum(a * b for a, b in zip(query, related)),
+                           sum(a * b for a, b in zip(query, unrelated)))
+        failing = HashEmbeddings(size=64, latency=LatencyModel(error_rate=1.0))
+        with self.assertRaises(exceptions.ResourceExhausted):
+            failing.embed_query('anything')
+
+
+class BenchmarkCommandTests(TestCase):
+    """Test cases for the benchmark management command."""
+
+    def test_reports_stage_timings_as_json(self):
+        """Test that a tiny run ingests synthetic PDFs and reports every stage."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = Path(temp_dir) / 'bench.json'
+            call_command('benchmark', pages='2', documents='2', pages_per_document=1,
+                         repeat=1, queries=2, index_sizes='500', index_dim=16,
+                         output=str(output), stdout=MagicMock())
+            report = json.loads(output.read_text())
+        ingestion, = report['ingestion']
+        self.assertGreater(ingestion['chunks'], 0)
+        self.assertEqual(set(ingestion['stages']),
+                         {'hash', 'load', 'split', 'embed', 'index', 'save', 'process_document'})
+        retrieval, = report['retrieval']
+        self.assertEqual(retrieval['stages']['query_documents']['n'], 2)
+        self.assertEqual(report['meta']['embedding_backend'], 'fake')
+        index, = report['index']
+        self.assertEqual(index['types']['flat']['recall_at_4'], 1.0)
+        self.assertEqual(set(index['types']), {'flat', 'sq_fp16', 'ivf_pq'})
+
+
+class TimingTests(TestCase):
+    """Test cases for stage timing spans and their export."""
+
+    def setUp(self):
+        """Create and log in a test user."""
+        self.user = User.objects.create_user(username='timinguser', password='testpassword')
+        self.client.login(username='timinguser', password='testpassword')
+
+    @patch('chatbot.views.aask_gemini', new_callable=AsyncMock)
+    def test_server_timing_lists_request_stages(self, mock_ask_gemini):
+        """Test that a chat message reports its stages in the Server-Timing header."""
+        mock_ask_gemini.return_value = 'Hello!'
+        response = self.client.post(reverse('chatbot'), {
+            'message': 'Hi', 'session_id': str(uuid.uuid4())
+        })
+        stages = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['db_documents', 'memory', 'llm', 'db_save', 'total'])
+
+    def test_metrics_endpoint_exports_histograms(self):
+        """Test that spans show up as Prometheus histograms on /metrics/."""
+        with span('unit_test_stage'):
+            pass
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        body = response.content.decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('chatbot_stage_duration_seconds_count{stage="unit_test_stage"} ', body)
+        self.assertIn('chatbot_cache_hits{cache="vector_store"}', body)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_metrics_hidden_without_token_unless_staff(self):
+        """Test that without a token only staff users can read /metrics/."""
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username='timinguser', password='testpassword')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test bucket placement and cumulative rendering."""
+        histogram = Histogram('test_seconds', 'Test.', ('stage',), buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.1, 0.5, 5.0):
+            histogram.observe(seconds, 'a')
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{stage="a",le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="a",le="1.0"} 3', lines)
+        self.assertIn('test_seconds_bucket{stage="a",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count{stage="a"} 4', lines)
@@ -7,7 +7,10 @@ from . import views
 
 urlpatterns = [
     path('chatbot/', views.chatbot, name='chatbot'),
+    path('chat-history/<str:session_id>/', views.chat_history, name='chat_history'),
     path('create-new-chat/', views.create_new_chat, name='create_new_chat'),
     path('delete_session/<str:session_id>/', views.delete_session, name='delete_session'),
     path('upload-document/', views.upload_document, name='upload_document'),
+    path('document-status/<int:document_id>/', views.document_status, name='document_status'),
+    path('metrics/', views.metrics, name='metrics'),
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
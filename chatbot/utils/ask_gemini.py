@@ -1,34 +1,109 @@
 """
 Module: ask_gemini
 Description: Provides functionality to interact with the 
-Gemini AI model using Google Generative AI API.
+Gemini AI model using Google Generative AI API, blocking or
+streamed asynchronously. All calls share one long-lived
+model client and are paced by the shared rate limiter, ahead of
+background requests. Answers are served from the response cache when
+the same (or, optionally, a similar) question was answered before.
 """
 import google.generativeai as genai
 from django.conf import settings
 
+from chatbot.utils.clients import GEMINI_MODEL, get_gemini_model
+from chatbot.utils.rate_limit import acall_paced, call_paced, gemini_rate_limiter
+from chatbot.utils.response_cache import response_cache
+
 
 genai_api_key = settings.API_KEY
 genai.configure(api_key=genai_api_key)
 
-def ask_gemini(message, history=None):
+NO_RESPONSE_MESSAGE = "Sorry, I didn't get a response. Please try again."
+ERROR_MESSAGE = "An error occurred while processing your request. Please try again later."
+
+def build_prompt(message, history=None, summary=None):
+    """Build the Gemini prompt from the conversation summary, recent history and message."""
+    if not history:
+        history = []
+    context = "\n".join(
+        [
+            f"You: {m['message']}\nAI Chatbot: {m['response']}"
+            for m in history
+            if isinstance(m, dict) and m.get('message') and 'response' in m
+        ]
+    )
+    if summary:
+        context = f"Summary of the earlier conversation: {summary}\n{context}"
+    return f"{context}\nYou: {message}\nAI Chatbot:"
+
+def standalone_query(message, history=None, summary=None):
+    """Return the message if the answer depends on it alone, otherwise None."""
+    if summary or any(isinstance(m, dict) and m.get('message') for m in history or []):
+        return None
+    return message
+
+def chat_scope(user_id=None):
+    """Return the response cache scope of plain chat answers for a user."""
+    return f"user:{user_id}" if user_id is not None else ''
+
+def prepare_chat(message, history=None, summary=None, user_id=None):
+    """Build the prompt of a chat message and the response cache arguments addressing it."""
+    cache_args = {
+        'model': GEMINI_MODEL,
+        'scope': chat_scope(user_id),
+        'query': standalone_query(message, history, summary),
+    }
+    return build_prompt(message, history, summary), cache_args
+
+def ask_gemini(message, history=None, summary=None, user_id=None):
     """Interact with the Gemini model to generate content based on the input message."""
     try:
-        if not history:
-            history = []
-        context = "\n".join(
-            [
-                f"You: {m['message']}\nAI Chatbot: {m['response']}"
-                for m in history
-                if isinstance(m, dict) and 'message' in m and 'response' in m
-            ]
+        prompt, cache_args = prepare_chat(message, history, summary, user_id)
+        cached = response_cache.lookup(prompt, **cache_args)
+        if cached is not None:
+            return cached
+        response = call_paced(get_gemini_model().generate_content, prompt, priority=True)
+        if response:
+            response_cache.store(prompt, response=response.text, **cache_args)
+            return response.text
+        return NO_RESPONSE_MESSAGE
+    except Exception as e:
+        print(f"Error while interacting with Gemini API: {e}")
+        return ERROR_MESSAGE
+
+async def aask_gemini(message, history=None, summary=None, user_id=None):
+    """Asynchronously generate a Gemini response without blocking the event loop."""
+    try:
+        prompt, cache_args = prepare_chat(message, history, summary, user_id)
+        cached = await response_cache.alookup(prompt, **cache_args)
+        if cached is not None:
+            return cached
+        response = await acall_paced(
+            get_gemini_model().generate_content_async, prompt, priority=True
         )
-        prompt = f"{context}\nYou: {message}\nAI Chatbot:"
-        model = genai.GenerativeModel("gemini-1.5-flash-002")
-        response = model.generate_content(prompt)
         if response:
+            await response_cache.astore(prompt, response=response.text, **cache_args)
             return response.text
-        return "Sorry, I didn't get a response. Please try again."
+        return NO_RESPONSE_MESSAGE
     except Exception as e:
         print(f"Error while interacting with Gemini API: {e}")
-        return "An error occurred while processing your request. Please try again later."
-    
\ No newline at end of file
+        return ERROR_MESSAGE
+
+async def aask_gemini_stream(message, history=None, summary=None, user_id=None):
+    """Asynchronously stream the Gemini response as text chunks are generated."""
+    try:
+        prompt, cache_args = prepare_chat(message, history, summary, user_id)
+        cached = await response_cache.alookup(prompt, **cache_args)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        await gemini_rate_limiter.aacquire(priority=True)
+        async for chunk in await get_gemini_model().generate_content_async(prompt, stream=True):
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+        await response_cache.astore(prompt, response="".join(parts), **cache_args)
+    except Exception as e:
+        print(f"Error while streaming from Gemini API: {e}")
+        yield ERROR_MESSAGE
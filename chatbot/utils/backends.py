@@ -0,0 +1,536 @@
+"""
+Pluggable Gemini and embedding backends for offline testing and benchmarking.
+
+``LLM_BACKEND`` and ``EMBEDDING_BACKEND`` select what answers generation and
+embedding calls:
+
+- ``gemini``: the live Google APIs (the default).
+- ``fake``: deterministic stand-ins. The fake LLM derives its answer from a hash
+  of the prompt, and the fake embedding model hashes words into a fixed number
+  of dimensions, so texts sharing words get similar vectors and retrieval still
+  behaves sensibly.
+- ``record``: calls the live API and writes every response, together with its
+  timing, under ``BACKEND_RECORDINGS_DIR``.
+- ``replay``: serves recorded responses without network access, sleeping for
+  the recorded timings so throughput tests reproduce production latency.
+
+Fake and replayed calls pass through a ``LatencyModel`` configured by
+``BACKEND_LATENCY``. It can add latency drawn from a distribution and inject
+quota errors at a given rate, so retry and backoff paths get exercised too.
+
+The backends mimic the parts of ``genai.GenerativeModel`` and LangChain's chat
+model and ``Embeddings`` interfaces that the app uses, so callers never know
+which backend they were given.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from google.api_core import exceptions
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+BACKENDS = ('gemini', 'fake', 'record', 'replay')
+EMBEDDING_MODEL = "models/embedding-001"
+
+
+class LatencyModel:
+    """
+    Latency and error injection for simulated API calls.
+
+    Attributes:
+        distribution (str): One of ``fixed``, ``uniform``, ``normal`` or ``lognormal``.
+        mean (float): Mean delay in seconds (the median for ``lognormal``).
+        spread (float): Half-width for ``uniform``, standard deviation for
+            ``normal`` and the log-space sigma for ``lognormal``.
+        error_rate (float): Probability that a call fails with a quota error.
+    """
+
+    def __init__(
+        self,
+        distribution: str = 'fixed',
+        mean: float = 0.0,
+        spread: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        if distribution not in ('fixed', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.distribution = distribution
+        self.mean = mean
+        self.spread = spread
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """Draw one delay in seconds."""
+        with self._lock:
+            if self.distribution == 'uniform':
+                delay = self._random.uniform(self.mean - self.spread, self.mean + self.spread)
+            elif self.distribution == 'normal':
+                delay = self._random.gauss(self.mean, self.spread)
+            elif self.distribution == 'lognormal':
+                delay = self.mean * self._random.lognormvariate(0, self.spread)
+            else:
+                delay = self.mean
+        return max(delay, 0.0)
+
+    def check_error(self) -> None:
+        """
+        Fail the current call with the configured probability.
+
+        Raises:
+            exceptions.ResourceExhausted: When an error is injected.
+        """
+        if self.error_rate <= 0:
+            return
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+        if failed:
+            raise exceptions.ResourceExhausted("Injected quota error")
+
+    def wait(self) -> None:
+        """Possibly fail, then sleep for one sampled delay."""
+        self.check_error()
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+    async def await_(self) -> None:
+        """Asynchronous variant of ``wait``."""
+        self.check_error()
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class RecordingStore:
+    """
+    Directory of recorded API responses, one JSON file per request.
+
+    Attributes:
+        directory (Path): Where recordings are kept.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def key(kind: str, model: str, payload: str) -> str:
+        """Address a request by its kind, model and payload."""
+        return hashlib.sha256(f"{kind}\0{model}\0{payload}".encode("utf-8")).hexdigest()
+
+    def _path(self, kind: str, key: str) -> Path:
+        return self.directory / kind / f"{key}.json"
+
+    def load(self, kind: str, key: str) -> Dict[str, Any]:
+        """
+        Load a recording.
+
+        Args:
+            kind (str): ``llm`` or ``embedding``.
+            key (str): Key from ``RecordingStore.key``.
+
+        Returns:
+            Dict[str, Any]: The recorded response.
+
+        Raises:
+            LookupError: If the request was never recorded.
+        """
+        try:
+            return json.loads(self._path(kind, key).read_text())
+        except FileNotFoundError:
+            raise LookupError(f"No recorded {kind} response for request {key}") from None
+
+    def save(self, kind: str, key: str, record: Dict[str, Any]) -> None:
+        """Write a recording atomically, replacing any earlier one."""
+        path = self._path(kind, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp_file:
+            json.dump(record, tmp_file)
+        os.replace(tmp_path, path)
+
+
+class FakeTextModel:
+    """Deterministic text generator answering from a hash of the prompt."""
+
+    words = ("the", "document", "answer", "context", "summary", "detail", "result",
+             "section", "question", "topic", "value", "point")
+
+    def __init__(self, latency: LatencyModel, length: int = 40, chunk_words: int = 8):
+        self.latency = latency
+        self.length = length
+        self.chunk_words = chunk_words
+
+    def _chunks(self, prompt: str) -> List[str]:
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        words = [self.words[digest[i % len(digest)] % len(self.words)]
+                 for i in range(self.length)]
+        text = f"[fake {digest.hex()[:8]}] " + " ".join(words) + "."
+        tokens = text.split(" ")
+        return [" ".join(tokens[i:i + self.chunk_words]) + " "
+                for i in range(0, len(tokens), self.chunk_words)]
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Yield the answer in chunks after the sampled latency."""
+        self.latency.wait()
+        yield from self._chunks(prompt)
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Asynchronous variant of ``stream``."""
+        await self.latency.await_()
+        for chunk in self._chunks(prompt):
+            yield chunk
+
+
+class LiveTextModel:
+    """Text generator calling a live ``GenerativeModel`` or LangChain chat model."""
+
+    def __init__(self, client: Any):
+        self.client = client
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Yield answer chunks from the live API."""
+        if isinstance(self.client, BaseChatModel):
+            for chunk in self.client.stream(prompt):
+                if chunk.content:
+                    yield chunk.content
+        else:
+            for chunk in self.client.generate_content(prompt, stream=True):
+                if chunk.text:
+                    yield chunk.text
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Asynchronous variant of ``stream``."""
+        if isinstance(self.client, BaseChatModel):
+            async for chunk in self.client.astream(prompt):
+                if chunk.content:
+                    yield chunk.content
+        else:
+            async for chunk in await self.client.generate_content_async(prompt, stream=True):
+                if chunk.text:
+                    yield chunk.text
+
+
+class RecordingTextModel:
+    """Text generator recording the chunks and timing of a live model."""
+
+    def __init__(self, live: LiveTextModel, store: RecordingStore, model: str):
+        self.live = live
+        self.store = store
+        self.model = model
+
+    def _save(self, prompt: str, chunks: List[Tuple[float, str]]) -> None:
+        self.store.save('llm', RecordingStore.key('llm', self.model, prompt), {
+            'model': self.model,
+            'prompt': prompt,
+            'chunks': chunks,
+        })
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Yield live answer chunks and record them once complete."""
+        chunks = []
+        last = time.perf_counter()
+        for text in self.live.stream(prompt):
+            now = time.perf_counter()
+            chunks.append((now - last, text))
+            last = now
+            yield text
+        self._save(prompt, chunks)
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Asynchronous variant of ``stream``."""
+        chunks = []
+        last = time.perf_counter()
+        async for text in self.live.astream(prompt):
+            now = time.perf_counter()
+            chunks.append((now - last, text))
+            last = now
+            yield text
+        self._save(prompt, chunks)
+
+
+class ReplayTextModel:
+    """Text generator replaying recorded chunks with their recorded timing."""
+
+    def __init__(self, store: RecordingStore, model: str, latency: LatencyModel):
+        self.store = store
+        self.model = model
+        self.latency = latency
+
+    def _load(self, prompt: str) -> List[Tuple[float, str]]:
+        self.latency.check_error()
+        record = self.store.load('llm', RecordingStore.key('llm', self.model, prompt))
+        return record['chunks']
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Yield the recorded chunks, sleeping for the recorded gaps."""
+        for delay, text in self._load(prompt):
+            time.sleep(delay)
+            yield text
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Asynchronous variant of ``stream``."""
+        for delay, text in self._load(prompt):
+            await asyncio.sleep(delay)
+            yield text
+
+
+class _AsyncChunks:
+    """Async iterable of response chunks, as returned by ``generate_content_async``."""
+
+    def __init__(self, chunks: AsyncIterator[str]):
+        self._chunks = chunks
+
+    async def __aiter__(self):
+        async for text in self._chunks:
+            yield SimpleNamespace(text=text)
+
+
+class BackendGenerativeModel:
+    """Stand-in for ``genai.GenerativeModel`` backed by a text generator."""
+
+    def __init__(self, text_model: Any):
+        self.text_model = text_model
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        """Generate a response, or an iterator of chunks when streaming."""
+        chunks = (SimpleNamespace(text=text) for text in self.text_model.stream(prompt))
+        if stream:
+            return chunks
+        return SimpleNamespace(text="".join(chunk.text for chunk in chunks))
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, **kwargs):
+        """Asynchronous variant of ``generate_content``."""
+        if stream:
+            return _AsyncChunks(self.text_model.astream(prompt))
+        parts = [text async for text in self.text_model.astream(prompt)]
+        return SimpleNamespace(text="".join(parts))
+
+
+class BackendChatModel(BaseChatModel):
+    """LangChain chat model backed by a text generator."""
+
+    text_model: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "backend-chat-model"
+
+    @staticmethod
+    def _prompt(messages) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = "".join(self.text_model.stream(self._prompt(messages)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        parts = [text async for text in self.text_model.astream(self._prompt(messages))]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(parts)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for text in self.text_model.stream(self._prompt(messages)):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async for text in self.text_model.astream(self._prompt(messages)):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic embeddings hashing words into a fixed number of dimensions.
+
+    Attributes:
+        size (int): Embedding dimension.
+        latency (LatencyModel): Simulated latency per request.
+    """
+
+    def __init__(self, size: int = 768, latency: Optional[LatencyModel] = None):
+        self.size = size
+        self.latency = latency or LatencyModel()
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts after one simulated request delay."""
+        self.latency.wait()
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query after one simulated request delay."""
+        self.latency.wait()
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Asynchronous variant of ``embed_documents``."""
+        await self.latency.await_()
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Asynchronous variant of ``embed_query``."""
+        await self.latency.await_()
+        return self._embed(text)
+
+
+class RecordingEmbeddings(Embeddings):
+    """Embeddings recording every vector returned by a live model."""
+
+    def __init__(self, embeddings: Embeddings, store: RecordingStore, model: str):
+        self.embeddings = embeddings
+        self.store = store
+        self.model = model
+
+    def _save(self, texts: List[str], vectors: List[List[float]], elapsed: float) -> None:
+        for text, vector in zip(texts, vectors):
+            self.store.save('embedding', RecordingStore.key('embedding', self.model, text), {
+                'model': self.model,
+                'latency': elapsed,
+                'vector': vector,
+            })
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with the live model and record the vectors."""
+        start = time.perf_counter()
+        vectors = self.embeddings.embed_documents(texts)
+        self._save(texts, vectors, time.perf_counter() - start)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query with the live model and record the vector."""
+        start = time.perf_counter()
+        vector = self.embeddings.embed_query(text)
+        self._save([text], [vector], time.perf_counter() - start)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Asynchronous variant of ``embed_query``."""
+        start = time.perf_counter()
+        vector = await self.embeddings.aembed_query(text)
+        self._save([text], [vector], time.perf_counter() - start)
+        return vector
+
+
+class ReplayEmbeddings(Embeddings):
+    """Embeddings replaying recorded vectors with their recorded request latency."""
+
+    def __init__(self, store: RecordingStore, model: str, latency: LatencyModel):
+        self.store = store
+        self.model = model
+        self.latency = latency
+
+    def _load(self, texts: List[str]) -> Tuple[List[List[float]], float]:
+        self.latency.check_error()
+        records = [
+            self.store.load('embedding', RecordingStore.key('embedding', self.model, text))
+            for text in texts
+        ]
+        delay = max((record['latency'] for record in records), default=0.0)
+        return [record['vector'] for record in records], delay
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Return recorded vectors after the slowest recorded request time."""
+        vectors, delay = self._load(texts)
+        time.sleep(delay)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """Return a recorded query vector."""
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Asynchronous variant of ``embed_query``."""
+        vectors, delay = self._load([text])
+        await asyncio.sleep(delay)
+        return vectors[0]
+
+
+def _backend_setting(name: str) -> str:
+    backend = getattr(settings, name, 'gemini')
+    if backend not in BACKENDS:
+        raise ValueError(f"{name} must be one of {', '.join(BACKENDS)}, not {backend!r}")
+    return backend
+
+
+def build_latency_model() -> LatencyModel:
+    """Build the latency model configured by ``BACKEND_LATENCY``."""
+    return LatencyModel(**getattr(settings, 'BACKEND_LATENCY', {}))
+
+
+def build_recording_store() -> RecordingStore:
+    """Build the recording store configured by ``BACKEND_RECORDINGS_DIR``."""
+    return RecordingStore(getattr(
+        settings,
+        'BACKEND_RECORDINGS_DIR',
+        os.path.join(settings.MEDIA_ROOT, 'recordings')
+    ))
+
+
+def build_text_model(model: str, live_factory: Callable[[], Any]) -> Optional[Any]:
+    """
+    Build the text generator selected by ``LLM_BACKEND``.
+
+    Args:
+        model (str): Model name, part of every recording key.
+        live_factory (Callable[[], Any]): Builds the live client.
+
+    Returns:
+        Optional[Any]: The text generator, or None when the live client should
+        be used directly.
+    """
+    backend = _backend_setting('LLM_BACKEND')
+    if backend == 'fake':
+        return FakeTextModel(build_latency_model())
+    if backend == 'record':
+        return RecordingTextModel(LiveTextModel(live_factory()), build_recording_store(), model)
+    if backend == 'replay':
+        return ReplayTextModel(build_recording_store(), model, build_latency_model())
+    return None
+
+
+def build_embeddings(api_key: str, model: str = EMBEDDING_MODEL) -> Tuple[Embeddings, str]:
+    """
+    Build the embedding model selected by ``EMBEDDING_BACKEND``.
+
+    Args:
+        api_key (str): Google API key for the live model.
+        model (str): Name of the live embedding model.
+
+    Returns:
+        Tuple[Embeddings, str]: The embedding model and the name its vectors
+        are cached under, which differs for fake vectors.
+    """
+    backend = _backend_setting('EMBEDDING_BACKEND')
+    if backend == 'fake':
+        embeddings = HashEmbeddings(latency=build_latency_model())
+        return embeddings, f"fake-hash-{embeddings.size}"
+    if backend == 'replay':
+        return ReplayEmbeddings(build_recording_store(), model, build_latency_model()), model
+    live = GoogleGenerativeAIEmbeddings(model=model, google_api_key=api_key)
+    if backend == 'record':
+        return RecordingEmbeddings(live, build_recording_store(), model), model
+    return live, model
@@ -0,0 +1,414 @@
+"""
+Microbenchmarks for the ingestion and retrieval hot paths.
+
+Ingestion is measured stage by stage, using the same steps as
+``RAGProcessor.process_document``: hashing, PDF loading, splitting, embedding,
+building the FAISS index and saving it. The whole pipeline is then timed end to
+end. Retrieval is measured against sessions holding a growing number of
+documents, covering cold and warm store loads, query embedding, search,
+answer generation and ``aquery_documents`` as a whole. Each index type of ``chatbot.utils.index_types`` is compared on
+synthetic vector sets for build time, search latency, size and recall against
+the exact index, to tune the size thresholds between them.
+
+Documents are synthetic PDFs of configurable size. Embeddings and answers come
+from whichever backends are configured, normally the offline fakes from
+``chatbot.utils.backends``. Every stage reports latency percentiles and,
+optionally, its peak Python heap allocation traced by ``tracemalloc``. Memory
+held by FAISS's native allocator is not visible to ``tracemalloc``.
+"""
+import platform
+import random
+import shutil
+import subprocess
+import textwrap
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import faiss
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.vectorstores import FAISS
+
+from chatbot.utils.index_types import FLAT, INDEX_TYPES, build_index
+
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "pa", "do",
+             "fi", "gu", "ha", "je", "bo", "ci", "ly", "mo", "te")
+VOCABULARY = [first + second + third for first in SYLLABLES
+              for second in SYLLABLES for third in SYLLABLES[:5]]
+
+
+def write_synthetic_pdf(path: Path, pages: int, words_per_page: int = 300, seed: int = 0) -> Path:
+    """
+    Write a text-only PDF of pseudo-random words.
+
+    Args:
+        path (Path): Where to write the file.
+        pages (int): Number of pages.
+        words_per_page (int): Words on each page.
+        seed (int): Seed of the word generator; equal seeds give equal files.
+
+    Returns:
+        Path: The written file.
+    """
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"",
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        words = " ".join(rng.choice(VOCABULARY) for _ in range(words_per_page))
+        operations = ["BT", "/F1 10 Tf", "12 TL", "50 760 Td"]
+        for line in textwrap.wrap(f"Page {page + 1}. {words}", 90):
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            operations.append(f"({escaped}) Tj T*")
+        operations.append("ET")
+        stream = "\n".join(operations).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, xref_offset
+    )
+    path.write_bytes(bytes(output))
+    return path
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """
+    Summarize latency samples in milliseconds.
+
+    Args:
+        samples (List[float]): Durations in seconds.
+
+    Returns:
+        Dict[str, float]: Sample count, mean, min, max and the 50th, 90th and
+        99th percentiles.
+    """
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        'n': len(samples),
+        'mean_ms': round(float(values.mean()), 3),
+        'min_ms': round(float(values.min()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p90_ms': round(float(np.percentile(values, 90)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+
+class StageRecorder:
+    """
+    Collects durations and peak allocations per named stage.
+
+    Attributes:
+        trace_memory (bool): Whether peak allocations are traced, which slows
+            every stage down.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.peaks: Dict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as one sample of a stage."""
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter() - start)
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                self.peaks[name] = max(self.peaks[name], peak)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """Summarize every stage, with its peak allocation when traced."""
+        report = {}
+        for name, samples in self.samples.items():
+            report[name] = summarize(samples)
+            if self.trace_memory:
+                report[name]['peak_bytes'] = self.peaks[name]
+        return report
+
+
+def benchmark_ingestion(processor, work_dir: Path, pages: int, repeat: int,
+                        trace_memory: bool = False) -> Dict[str, Any]:
+    """
+    Benchmark ingestion of one synthetic document stage by stage.
+
+    Args:
+        processor (RAGProcessor): Processor using offline backends.
+        work_dir (Path): Scratch directory.
+        pages (int): Pages in the synthetic document.
+        repeat (int): Number of measured runs.
+        trace_memory (bool): Whether to trace peak allocations.
+
+    Returns:
+        Dict[str, Any]: Document size and per-stage statistics.
+    """
+    pdf_path = write_synthetic_pdf(work_dir / f"ingest_{pages}.pdf", pages)
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=processor.chunk_size,
+        chunk_overlap=processor.chunk_overlap,
+        length_function=len,
+    )
+    recorder = StageRecorder(trace_memory)
+    num_chunks = 0
+    for run in range(repeat):
+        with recorder.stage('hash'):
+            processor.hash_file(str(pdf_path))
+        with recorder.stage('load'):
+            documents = list(PyPDFLoader(str(pdf_path)).lazy_load())
+        with recorder.stage('split'):
+            chunks = splitter.split_documents(documents)
+        texts = [chunk.page_content for chunk in chunks]
+        with recorder.stage('embed'):
+            vectors = processor.embeddings.embed_documents(texts)
+        with recorder.stage('index'):
+            store = FAISS.from_embeddings(
+                list(zip(texts, vectors)),
+                processor.embeddings,
+                metadatas=[chunk.metadata for chunk in chunks]
+            )
+        store_path = work_dir / f"store_{pages}_{run}"
+        with recorder.stage('save'):
+            store.save_local(str(store_path))
+        shutil.rmtree(store_path, ignore_errors=True)
+        num_chunks = len(chunks)
+
+        # Forget earlier runs so the pipeline does not take the duplicate path.
+        shutil.rmtree(processor.metadata_dir / 'hashes', ignore_errors=True)
+        with recorder.stage('process_document'):
+            processor.process_document(str(pdf_path), f"bench-{uuid.uuid4().hex}",
+                                       uuid.uuid4().hex)
+
+    return {
+        'pages': pages,
+        'chunks': num_chunks,
+        'file_bytes': pdf_path.stat().st_size,
+        'stages': recorder.report(),
+    }
+
+
+def benchmark_retrieval(processor, work_dir: Path, documents: int, pages: int,
+                        queries: int, trace_memory: bool = False) -> Dict[str, Any]:
+    """
+    Benchmark retrieval from one session holding several synthetic documents.
+
+    Args:
+        processor (RAGProcessor): Processor using offline backends.
+        work_dir (Path): Scratch directory.
+        documents (int): Documents indexed in the session.
+        pages (int): Pages per document.
+        queries (int): Number of measured queries.
+        trace_memory (bool): Whether to trace peak allocations.
+
+    Returns:
+        Dict[str, Any]: Session size and per-stage statistics.
+    """
+    session_id = uuid.uuid4().hex
+    store_path = None
+    for index in range(documents):
+        pdf_path = write_synthetic_pdf(
+            work_dir / f"session_{documents}_{index}.pdf", pages, seed=1000 + index
+        )
+        store_path = processor.process_document(
+            str(pdf_path), f"bench-{uuid.uuid4().hex}", session_id
+        )
+
+    rng = random.Random(documents)
+    recorder = StageRecorder(trace_memory)
+    for _ in range(queries):
+        query = " ".join(rng.choice(VOCABULARY) for _ in range(6))
+        processor.store_cache.invalidate(store_path)
+        with recorder.stage('load_cold'):
+            processor.load_vector_store(store_path)
+        with recorder.stage('load_warm'):
+            processor.load_vector_store(store_path)
+        with recorder.stage('embed_query'):
+            query_embedding = processor.embeddings.embed_query(query)
+        with recorder.stage('search'):
+            results = processor.search_stores([store_path], query_embedding)
+        with recorder.stage('answer'):
+            async_to_sync(processor.aanswer_from_chunks)(
+                query, [chunk for chunk, _ in results], []
+            )
+        with recorder.stage('query_documents'):
+            async_to_sync(processor.aquery_documents)([store_path], f"{query} again")
+
+    store_bytes = sum(path.stat().st_size for path in Path(store_path).iterdir())
+    return {
+        'documents': documents,
+        'pages_per_document': pages,
+        'store_bytes': store_bytes,
+        'stages': recorder.report(),
+    }
+
+
+def synthetic_vectors(count: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Generate unit vectors grouped around topics, like chunk embeddings.
+
+    Args:
+        count (int): Number of vectors.
+        dim (int): Vector dimension.
+        rng (np.random.Generator): Random source.
+
+    Returns:
+        np.ndarray: Float32 array of shape (count, dim).
+    """
+    topics = rng.standard_normal((max(1, count // 100), dim))
+    vectors = topics[rng.integers(len(topics), size=count)] + 0.5 * rng.standard_normal(
+        (count, dim)
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def benchmark_index_types(vectors: int, dim: int, queries: int, k: int,
+                          seed: int = 0) -> Dict[str, Any]:
+    """
+    Compare every index type on one synthetic vector set.
+
+    Args:
+        vectors (int): Number of indexed vectors.
+        dim (int): Vector dimension.
+        queries (int): Number of measured queries.
+        k (int): Neighbours retrieved per query.
+        seed (int): Seed of the vector generator.
+
+    Returns:
+        Dict[str, Any]: Per index type, the build time, serialized size, search
+        latency and mean recall@k against the exact index.
+    """
+    rng = np.random.default_rng(seed)
+    data = synthetic_vectors(vectors, dim, rng)
+    picks = data[rng.integers(vectors, size=queries)]
+    query_vectors = picks + 0.1 * rng.standard_normal(picks.shape).astype(np.float32)
+
+    results = {}
+    exact = None
+    for index_type in INDEX_TYPES:
+        start = time.perf_counter()
+        index = build_index(index_type, data)
+        build_seconds = time.perf_counter() - start
+        latencies, neighbours = [], []
+        for query in query_vectors:
+            start = time.perf_counter()
+            _, positions = index.search(query[None, :], k)
+            latencies.append(time.perf_counter() - start)
+            neighbours.append(set(positions[0].tolist()))
+        if index_type == FLAT:
+            exact = neighbours
+        recall = np.mean([len(found & expected) / len(expected)
+                          for found, expected in zip(neighbours, exact)])
+        results[index_type] = {
+            'build_ms': round(build_seconds * 1000, 3),
+            'bytes': int(faiss.serialize_index(index).size),
+            'search': summarize(latencies),
+            f'recall_at_{k}': round(float(recall), 4),
+        }
+    return {'vectors': vectors, 'dim': dim, 'types': results}
+
+
+def git_revision() -> Optional[str]:
+    """Return the current commit hash, if the code runs from a git checkout."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    processor,
+    work_dir: Path,
+    ingestion_pages: List[int],
+    session_documents: List[int],
+    pages_per_document: int,
+    repeat: int,
+    queries: int,
+    trace_memory: bool = False,
+    index_sizes: Optional[List[int]] = None,
+    index_dim: int = 768
+) -> Dict[str, Any]:
+    """
+    Run the ingestion, retrieval and index type benchmarks.
+
+    Args:
+        processor (RAGProcessor): Processor using offline backends.
+        work_dir (Path): Scratch directory.
+        ingestion_pages (List[int]): Document sizes, in pages, to ingest.
+        session_documents (List[int]): Documents per session to query against.
+        pages_per_document (int): Pages of each document in the retrieval sessions.
+        repeat (int): Measured runs per ingestion size.
+        queries (int): Measured queries per session size.
+        trace_memory (bool): Whether to trace peak allocations.
+        index_sizes (Optional[List[int]]): Vector counts to compare index types on.
+        index_dim (int): Dimension of the synthetic vectors.
+
+    Returns:
+        Dict[str, Any]: Run metadata plus ingestion, retrieval and index results.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        ingestion = [benchmark_ingestion(processor, work_dir, pages, repeat, trace_memory)
+                     for pages in ingestion_pages]
+        retrieval = [benchmark_retrieval(processor, work_dir, documents,
+                                         pages_per_document, queries, trace_memory)
+                     for documents in session_documents]
+        index = [benchmark_index_types(size, index_dim, queries, processor.retrieval_top_k)
+                 for size in index_sizes or []]
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'llm_backend': getattr(settings, 'LLM_BACKEND', 'gemini'),
+            'embedding_backend': getattr(settings, 'EMBEDDING_BACKEND', 'gemini'),
+            'backend_latency': getattr(settings, 'BACKEND_LATENCY', {}),
+            'ingestion_batch_size': getattr(settings, 'INGESTION_BATCH_SIZE', 400),
+            'index_ivf_nprobe': getattr(settings, 'INDEX_IVF_NPROBE', 16),
+            'repeat': repeat,
+            'queries': queries,
+            'trace_memory': trace_memory,
+        },
+        'ingestion': ingestion,
+        'retrieval': retrieval,
+        'index': index,
+    }
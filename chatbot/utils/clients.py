@@ -0,0 +1,134 @@
+"""
+Long-lived Gemini clients and the document answer prompt.
+
+Constructing a ``GenerativeModel`` or ``ChatGoogleGenerativeAI`` creates a new
+API client, and with it a new connection and TLS handshake on first use. This
+module builds each client once per configuration and hands out the same
+instance afterwards, so the underlying gRPC channel is reused across messages.
+
+Async clients are bound to the event loop they were first used on, so clients
+requested while a loop is running are kept per loop; under ASGI that is a
+single, process-wide instance. Clients requested outside a loop (worker
+threads, management commands) are shared process-wide.
+
+Which client is built is decided by the ``LLM_BACKEND`` setting, so fake,
+recording and replaying backends are shared the same way.
+
+Only clients are prebuilt, not retrieval chains. Document questions are
+answered from one merged retrieval across the session's stores and a single
+LLM call (``RAGProcessor.aquery_documents``). A per-store
+``ConversationalRetrievalChain`` would add a question-condensing call and search
+stores one by one, and nothing builds one.
+"""
+import asyncio
+import threading
+import weakref
+from typing import Any, Callable, Dict, Hashable
+
+import google.generativeai as genai
+from langchain.prompts import PromptTemplate
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from chatbot.utils.backends import BackendChatModel, BackendGenerativeModel, build_text_model
+
+GEMINI_MODEL = "gemini-1.5-flash-002"
+
+
+class ClientRegistry:
+    """Thread-safe registry building each client once per key and event loop."""
+
+    def __init__(self):
+        self._clients: Dict[Hashable, Any] = {}
+        self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Return the client registered under a key, building it on first use.
+
+        Args:
+            key (Hashable): Identifies the client configuration.
+            factory (Callable[[], Any]): Builds the client.
+
+        Returns:
+            Any: The shared client instance.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            if loop is None:
+                clients = self._clients
+            else:
+                clients = self._loop_clients.setdefault(loop, {})
+            if key not in clients:
+                clients[key] = factory()
+            return clients[key]
+
+    def clear(self) -> None:
+        """Drop every registered client."""
+        with self._lock:
+            self._clients.clear()
+            self._loop_clients.clear()
+
+
+client_registry = ClientRegistry()
+
+
+def get_gemini_model(model_name: str = GEMINI_MODEL) -> genai.GenerativeModel:
+    """
+    Return the shared ``GenerativeModel`` for a model name.
+
+    Args:
+        model_name (str): Name of the Gemini model.
+
+    Returns:
+        genai.GenerativeModel: The long-lived model client.
+    """
+    def build() -> genai.GenerativeModel:
+        text_model = build_text_model(model_name, lambda: genai.GenerativeModel(model_name))
+        if text_model is not None:
+            return BackendGenerativeModel(text_model)
+        return genai.GenerativeModel(model_name)
+
+    return client_registry.get(('generative_model', model_name), build)
+
+
+def get_chat_model(api_key: str, **config: Any) -> ChatGoogleGenerativeAI:
+    """
+    Return the shared LangChain chat model for an API key and configuration.
+
+    Args:
+        api_key (str): Google API key.
+        **config: Keyword arguments of ``ChatGoogleGenerativeAI`` such as
+            ``model`` and ``temperature``.
+
+    Returns:
+        ChatGoogleGenerativeAI: The long-lived chat model client.
+    """
+    def build() -> ChatGoogleGenerativeAI:
+        text_model = build_text_model(
+            config.get('model', GEMINI_MODEL),
+            lambda: ChatGoogleGenerativeAI(google_api_key=api_key, **config)
+        )
+        if text_model is not None:
+            return BackendChatModel(text_model=text_model)
+        return ChatGoogleGenerativeAI(google_api_key=api_key, **config)
+
+    key = ('chat_model', api_key, tuple(sorted(config.items())))
+    return client_registry.get(key, build)
+
+
+ANSWER_PROMPT = PromptTemplate(
+    template="""Answer the question based on the provided context.
+            If the answer cannot be found in the context, acknowledge that and provide a general response.
+
+            Context: {context}
+            Chat History: {chat_history}
+            Current Question: {question}
+            """,
+    input_variables=["context", "chat_history", "question"]
+)
@@ -0,0 +1,244 @@
+"""
+Memoizing wrapper around an embedding model.
+
+Every retrieval embeds the user question, and a single message may trigger
+several retrievals (relevance checks, retrievers, fallbacks). This module puts a
+bounded LRU cache in front of ``embed_query`` so each distinct question is sent
+to the embedding API at most once. Entries can optionally be persisted in a
+SQLite table so the cache survives restarts.
+
+Document chunks are cached by content: the SHA-256 of the model name and chunk
+text addresses a stored vector, so re-uploading a known document (or any
+document sharing chunks with one) skips the embedding API for those chunks.
+"""
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different strings share a cache key."""
+    return " ".join(text.split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that memoizes query and chunk embeddings.
+
+    Attributes:
+        embeddings (Embeddings): The wrapped embedding model.
+        model_name (str): Model name, part of every cache key.
+        max_entries (int): Maximum number of query embeddings kept in memory.
+        db_path (Optional[Path]): SQLite file holding the chunk cache, if any.
+        persist_queries (bool): Whether query embeddings are also persisted.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_entries: int = 1024,
+        db_path: Optional[str] = None,
+        persist_queries: bool = False
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.db_path = Path(db_path) if db_path else None
+        self.persist_queries = bool(self.db_path) and persist_queries
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.chunk_hits = 0
+        self.chunk_misses = 0
+        if self.db_path:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS query_embeddings "
+                    "(key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+                )
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS chunk_embeddings "
+                    "(key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+                )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _key(self, text: str) -> str:
+        payload = f"{self.model_name}\0{normalize_text(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _chunk_key(self, text: str) -> str:
+        payload = f"{self.model_name}\0{text}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        with self._lock:
+            self._queries[key] = vector
+            self._queries.move_to_end(key)
+            while len(self._queries) > self.max_entries:
+                self._queries.popitem(last=False)
+
+    def _load_query(self, key: str) -> Optional[List[float]]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT vector FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32).tolist() if row else None
+
+    def _store_query(self, key: str, vector: List[float]) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, vector) VALUES (?, ?)",
+                (key, np.asarray(vector, dtype=np.float32).tobytes())
+            )
+
+    def _lookup_memory(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+                self.hits += 1
+            return vector
+
+    def _record(self, key: str, vector: List[float], hit: bool) -> None:
+        self._remember(key, vector)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query, reusing a cached vector for previously seen text.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            List[float]: The query embedding.
+        """
+        key = self._key(text)
+        vector = self._lookup_memory(key)
+        if vector is not None:
+            return vector
+
+        if self.persist_queries:
+            vector = self._load_query(key)
+            if vector is not None:
+                self._record(key, vector, hit=True)
+                return vector
+
+        vector = self.embeddings.embed_query(text)
+        self._record(key, vector, hit=False)
+        if self.persist_queries:
+            self._store_query(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        Asynchronously embed a query, reusing a cached vector when possible.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            List[float]: The query embedding.
+        """
+        key = self._key(text)
+        vector = self._lookup_memory(key)
+        if vector is not None:
+            return vector
+
+        if self.persist_queries:
+            vector = await asyncio.to_thread(self._load_query, key)
+            if vector is not None:
+                self._record(key, vector, hit=True)
+                return vector
+
+        vector = await self.embeddings.aembed_query(text)
+        self._record(key, vector, hit=False)
+        if self.persist_queries:
+            await asyncio.to_thread(self._store_query, key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed document chunks, only sending chunks missing from the cache.
+
+        Args:
+            texts (List[str]): Chunk texts to embed.
+
+        Returns:
+            List[List[float]]: One embedding per chunk.
+        """
+        if not self.db_path:
+            return self.embeddings.embed_documents(texts)
+
+        keys = [self._chunk_key(text) for text in texts]
+        found = {}
+        with self._connect() as connection:
+            unique_keys = list(dict.fromkeys(keys))
+            # Stay below SQLite's bound parameter limit.
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                rows = connection.execute(
+                    "SELECT key, vector FROM chunk_embeddings WHERE key IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                found.update(
+                    (key, np.frombuffer(vector, dtype=np.float32).tolist())
+                    for key, vector in rows
+                )
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        with self._lock:
+            # Repeats of a missing chunk are embedded once but are not cache hits.
+            self.chunk_hits += sum(key in found for key in keys)
+            self.chunk_misses += len(missing)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            found.update(zip(missing.keys(), vectors))
+            with self._connect() as connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO chunk_embeddings (key, vector) VALUES (?, ?)",
+                    [(key, np.asarray(found[key], dtype=np.float32).tobytes())
+                     for key in missing]
+                )
+        return [found[key] for key in keys]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Report cache counters.
+
+        Returns:
+            Dict[str, int]: Query and chunk hit/miss counts plus the in-memory
+            entry count.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._queries),
+                'chunk_hits': self.chunk_hits,
+                'chunk_misses': self.chunk_misses,
+            }
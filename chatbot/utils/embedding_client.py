@@ -0,0 +1,114 @@
+"""
+Batched, concurrent and rate-limited embedding client.
+
+Document ingestion embeds many chunks. This wrapper groups them into the
+largest batches a single API request accepts (``EMBEDDING_BATCH_SIZE``), sends
+up to ``EMBEDDING_CONCURRENCY`` batches at once and paces every request through
+the shared Gemini token bucket, where query embeddings take priority over
+document batches. Quota rejections are retried with exponential backoff up to
+``GEMINI_API_RETRY_ATTEMPTS`` times.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+
+from chatbot.utils.rate_limit import TokenBucket, acall_paced, call_paced, gemini_rate_limiter
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that batches, parallelises and paces API requests.
+
+    Attributes:
+        embeddings (Embeddings): The wrapped embedding model.
+        batch_size (int): Maximum texts per API request.
+        concurrency (int): Maximum requests in flight at once.
+        rate_limiter (TokenBucket): Limiter every request must pass through.
+        retry_attempts (int): Attempts per request before giving up on quota errors.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = 100,
+        concurrency: int = 4,
+        rate_limiter: TokenBucket = gemini_rate_limiter,
+        retry_attempts: int = 3
+    ):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.retry_attempts = retry_attempts
+
+    def _call(self, function, *args, priority: bool = False):
+        return call_paced(function, *args, priority=priority,
+                          rate_limiter=self.rate_limiter, attempts=self.retry_attempts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts in maximal batches sent concurrently under the rate limit.
+
+        Args:
+            texts (List[str]): Texts to embed.
+
+        Returns:
+            List[List[float]]: One embedding per text, in input order.
+        """
+        batches = [texts[start:start + self.batch_size]
+                   for start in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.concurrency <= 1:
+            results = [self._call(self.embeddings.embed_documents, batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+                results = list(pool.map(
+                    lambda batch: self._call(self.embeddings.embed_documents, batch),
+                    batches
+                ))
+        return [vector for batch in results for vector in batch]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a single query under the rate limit, ahead of document batches.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            List[float]: The query embedding.
+        """
+        return self._call(self.embeddings.embed_query, text, priority=True)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        Embed a single query under the rate limit without blocking the event loop.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            List[float]: The query embedding.
+        """
+        return await acall_paced(self.embeddings.aembed_query, text, priority=True,
+                                 rate_limiter=self.rate_limiter,
+                                 attempts=self.retry_attempts)
+
+
+def build_embedding_client(embeddings: Embeddings) -> BatchedEmbeddings:
+    """
+    Wrap an embedding model with the batching and pacing configured in settings.
+
+    Args:
+        embeddings (Embeddings): The embedding model to wrap.
+
+    Returns:
+        BatchedEmbeddings: The configured client.
+    """
+    return BatchedEmbeddings(
+        embeddings,
+        batch_size=getattr(settings, 'EMBEDDING_BATCH_SIZE', 100),
+        concurrency=getattr(settings, 'EMBEDDING_CONCURRENCY', 4),
+        retry_attempts=settings.GEMINI_API_RETRY_ATTEMPTS
+    )
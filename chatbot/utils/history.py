@@ -0,0 +1,71 @@
+"""
+Keyset pagination over a session's chat history.
+
+Pages are addressed by a cursor holding the ``(created_at, id)`` of the oldest
+message already shown, so fetching an older page is a single indexed range scan
+on ``Chat(user, session_id, created_at)`` no matter how deep the user scrolls,
+unlike OFFSET pagination which rescans every skipped row.
+"""
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.db.models import Q
+
+from chatbot.models import Chat
+
+
+def encode_cursor(chat: Chat) -> str:
+    """Encode the position of a chat message as an opaque cursor."""
+    return f"{chat.created_at.isoformat()}_{chat.id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor produced by ``encode_cursor``.
+
+    Args:
+        cursor (str): The cursor string.
+
+    Returns:
+        Tuple[datetime, int]: The creation time and id of the message.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    created_at, _, chat_id = cursor.rpartition('_')
+    return datetime.fromisoformat(created_at), int(chat_id)
+
+
+async def afetch_chat_page(
+    user,
+    session_id: str,
+    before: Optional[str] = None,
+    limit: int = 20
+) -> Tuple[List[Chat], Optional[str]]:
+    """
+    Fetch one page of a session's messages, newest page first.
+
+    Args:
+        user (User): Owner of the session.
+        session_id (str): Chat session identifier.
+        before (Optional[str]): Cursor of the oldest message already loaded;
+            the latest page is returned when omitted.
+        limit (int): Maximum number of messages in the page.
+
+    Returns:
+        Tuple[List[Chat], Optional[str]]: The messages in chronological order and
+        the cursor for the next older page, or None if there are no older messages.
+
+    Raises:
+        ValueError: If ``before`` is not a valid cursor.
+    """
+    chats = Chat.objects.filter(user=user, session_id=session_id)
+    if before:
+        created_at, chat_id = decode_cursor(before)
+        chats = chats.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=chat_id)
+        )
+    page = [chat async for chat in chats.order_by('-created_at', '-id')[:limit + 1]]
+    has_more = len(page) > limit
+    page = page[:limit][::-1]
+    return page, encode_cursor(page[0]) if has_more else None
@@ -0,0 +1,224 @@
+"""
+Size-adaptive FAISS index types for session stores.
+
+A flat index is exact, but both its memory and its search time grow linearly
+with the number of chunks. Session stores therefore change index type as they
+grow, at thresholds configured in settings:
+
+- ``flat``: exact ``IndexFlatL2``, below ``INDEX_SQ_THRESHOLD`` chunks.
+- ``sq_fp16``: ``IndexScalarQuantizer`` storing vectors as float16. It halves
+  memory at almost no recall cost, below ``INDEX_IVFPQ_THRESHOLD`` chunks.
+- ``ivf_pq``: ``IndexIVFPQ`` with ``INDEX_IVF_NPROBE`` lists probed per query.
+  It searches a fraction of the lists over product-quantized codes.
+
+HNSW is not offered because it cannot remove vectors, and removing a document
+from its session store relies on that. IVF indexes can remove vectors but do
+not renumber the remaining ones, so removals from them rebuild the index.
+
+The quantized types only hold lossy codes, and rebuilding an index from codes
+would add the quantization error again on every rebuild. Their stores therefore
+keep the full-precision vectors in ``originals.f32``, in position order, and
+every rebuild starts from those (see ``OriginalVectors``). Flat indexes hold
+their vectors exactly and keep no such file.
+
+Distances stay squared L2 in every type, so the relevance threshold applies
+unchanged; with the approximate types they are approximate as well.
+"""
+import math
+import os
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+import faiss
+import numpy as np
+from django.conf import settings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+ORIGINALS = 'originals.f32'
+
+FLAT = 'flat'
+SQ_FP16 = 'sq_fp16'
+IVF_PQ = 'ivf_pq'
+
+# Index types from exact to most compressed.
+INDEX_TYPES = (FLAT, SQ_FP16, IVF_PQ)
+
+
+def choose_index_type(num_vectors: int) -> str:
+    """
+    Choose the index type for a store of a given size.
+
+    Args:
+        num_vectors (int): Number of chunks in the store.
+
+    Returns:
+        str: One of ``INDEX_TYPES``.
+    """
+    if num_vectors >= getattr(settings, 'INDEX_IVFPQ_THRESHOLD', 100_000):
+        return IVF_PQ
+    if num_vectors >= getattr(settings, 'INDEX_SQ_THRESHOLD', 10_000):
+        return SQ_FP16
+    return FLAT
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """Name the type of a FAISS index, treating unknown types as flat."""
+    if isinstance(index, faiss.IndexIVFPQ):
+        return IVF_PQ
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return SQ_FP16
+    return FLAT
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Pick subquantizers of about 8 dimensions, one byte of code each."""
+    return max(m for m in range(1, max(1, dim // 8) + 1) if dim % m == 0)
+
+
+def build_index(index_type: str, vectors: np.ndarray) -> faiss.Index:
+    """
+    Build, train and fill an index of the given type.
+
+    Args:
+        index_type (str): One of ``INDEX_TYPES``.
+        vectors (np.ndarray): Vectors of shape (n, d) added in order.
+
+    Returns:
+        faiss.Index: The filled index; positions match the rows of ``vectors``.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+    if index_type == SQ_FP16:
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+    elif index_type == IVF_PQ:
+        # FAISS wants about 39 training points per coarse list and PQ centroid.
+        nlist = max(1, min(int(4 * math.sqrt(count)), count // 39))
+        nbits = min(8, max(1, int(math.log2(max(count // 39, 2)))))
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist,
+                                 _pq_subquantizers(dim), nbits)
+        index.train(vectors)
+        index.nprobe = min(nlist, getattr(settings, 'INDEX_IVF_NPROBE', 16))
+        # Reconstruction and removal by id are both needed by session stores.
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    else:
+        index = faiss.IndexFlatL2(dim)
+    index.add(vectors)
+    return index
+
+
+def rebuild_store(
+    vector_store: FAISS,
+    positions: Iterable[int],
+    index_type: str,
+    vectors: Optional[np.ndarray] = None
+) -> FAISS:
+    """
+    Copy some positions of a store into a new store with another index type.
+
+    Args:
+        vector_store (FAISS): The store to copy from.
+        positions (Iterable[int]): Positions to keep, in their new order.
+        index_type (str): Index type of the new store.
+        vectors (Optional[np.ndarray]): Full-precision vectors of the kept
+            positions; reconstructed from the current index when None, which
+            carries over the quantization error of a quantized index.
+
+    Returns:
+        FAISS: A new store holding the kept chunks at positions 0..n-1.
+    """
+    positions: Sequence[int] = list(positions)
+    if vectors is None:
+        index = vector_store.index
+        vectors = np.empty((len(positions), index.d), dtype=np.float32)
+        for row, position in enumerate(positions):
+            vectors[row] = index.reconstruct(int(position))
+    chunk_ids = [vector_store.index_to_docstore_id[position] for position in positions]
+    return FAISS(
+        vector_store.embedding_function,
+        build_index(index_type, vectors),
+        InMemoryDocstore({chunk_id: vector_store.docstore.search(chunk_id)
+                          for chunk_id in chunk_ids}),
+        dict(enumerate(chunk_ids))
+    )
+
+
+class OriginalVectors:
+    """
+    Full-precision vectors of a store's positions, kept beside its index.
+
+    Only tracked for quantized stores. Vectors saved with the store are read
+    through a memory map and vectors added since are held in memory; positions
+    removed from the store are dropped with ``keep``. Quantized stores saved
+    before originals were kept fall back to the vectors of their index.
+
+    Attributes:
+        path (Path): The ``originals.f32`` file of the store.
+    """
+
+    _BLOCK = 65536
+
+    def __init__(self, path: Path, index: Optional[faiss.Index] = None):
+        self.path = Path(path)
+        count = index.ntotal if index is not None else 0
+        self._base = None
+        if count:
+            expected = count * index.d * np.dtype(np.float32).itemsize
+            if self.path.exists() and self.path.stat().st_size == expected:
+                self._base = np.memmap(self.path, dtype=np.float32, mode='r',
+                                       shape=(count, index.d))
+            else:
+                self._base = index
+        self._base_count = count
+        self._rows = np.arange(count, dtype=np.int64)
+        self._added: List[np.ndarray] = []
+
+    def _base_vectors(self) -> np.ndarray:
+        if isinstance(self._base, faiss.Index):
+            # The index is about to change under us; copy what it holds now.
+            self._base = self._base.reconstruct_n(0, self._base_count)
+        return self._base
+
+    def append(self, vectors: np.ndarray) -> None:
+        """Add the vectors of positions appended to the store."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        start = self._base_count + sum(len(added) for added in self._added)
+        self._added.append(vectors)
+        self._rows = np.concatenate([self._rows, np.arange(start, start + len(vectors))])
+
+    def keep(self, positions: Sequence[int]) -> None:
+        """Keep only the given positions, renumbered in order, as the store does."""
+        self._base_vectors()
+        self._rows = self._rows[np.asarray(positions, dtype=np.int64)]
+
+    def get(self, positions: Sequence[int]) -> np.ndarray:
+        """
+        Read the full-precision vectors of some positions.
+
+        Args:
+            positions (Sequence[int]): Positions of the store.
+
+        Returns:
+            np.ndarray: One float32 row per position.
+        """
+        rows = self._rows[np.asarray(positions, dtype=np.int64)]
+        base = self._base_vectors() if self._base_count else None
+        if len(self._added) > 1:
+            self._added = [np.vstack(self._added)]
+        added = self._added[0] if self._added else None
+        dim = base.shape[1] if base is not None else added.shape[1]
+        vectors = np.empty((len(rows), dim), dtype=np.float32)
+        from_base = rows < self._base_count
+        if from_base.any():
+            vectors[from_base] = base[rows[from_base]]
+        if not from_base.all():
+            vectors[~from_base] = added[rows[~from_base] - self._base_count]
+        return vectors
+
+    def save(self) -> None:
+        """Write the vectors of every position, replacing the file atomically."""
+        temp_path = self.path.with_name(f'{ORIGINALS}.tmp')
+        with open(temp_path, 'wb') as f:
+            for start in range(0, len(self._rows), self._BLOCK):
+                self.get(range(start, min(start + self._BLOCK, len(self._rows)))).tofile(f)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,200 @@
+"""
+Background ingestion of uploaded documents.
+
+Parsing, chunking, embedding and indexing a PDF can take much longer than a
+request should. Uploads therefore only create a ``Document`` row in the
+``queued`` state and hand it to a local worker pool; the worker advances the
+document through ``parsing`` and ``embedding`` to ``indexed`` (or ``failed``),
+which the upload page polls for progress.
+
+No external broker is needed: jobs run on a ``ThreadPoolExecutor`` inside the
+web process. Setting ``INGESTION_EAGER`` runs jobs inline instead, which is what
+the tests use. The same pool also reclaims the files of deleted documents and
+summarizes conversations.
+
+Jobs queued in a process are lost when it stops. Each process therefore
+re-enqueues, once it serves its first request, the documents whose progress
+stalled for longer than ``INGESTION_STALE_SECONDS``. A running job reports its
+stage before every batch, which refreshes ``status_updated_at``, so a large
+document that is still being embedded is never taken for a lost one.
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import close_old_connections
+from django.utils import timezone
+
+from chatbot.models import ChatSession, Document
+from chatbot.utils.reclaim import reclaim_deleted_documents, reclaim_document, stale_in_progress
+
+
+def ingest_document(doc_id: int, rag_processor) -> None:
+    """
+    Run the ingestion pipeline for one document, recording its progress.
+
+    A document whose session was deleted is reclaimed instead of, or right
+    after, being ingested.
+
+    Args:
+        doc_id (int): Primary key of the document to ingest.
+        rag_processor (RAGProcessor): Processor used to parse and index the file.
+    """
+    try:
+        doc = Document.objects.filter(pk=doc_id).first()
+        if not doc:
+            return
+        if doc.deleted_at:
+            reclaim_document(doc, rag_processor)
+            return
+
+        def set_status(status: str, **fields) -> None:
+            Document.objects.filter(pk=doc_id).update(
+                status=status, status_updated_at=timezone.now(), **fields
+            )
+
+        try:
+            vector_store_path = rag_processor.process_document(
+                doc.file.path,
+                str(doc.id),
+                str(doc.session_id),
+                on_stage=set_status,
+                user_id=doc.user_id
+            )
+        except Exception as e:
+            print(f"Ingestion of document {doc_id} failed: {e}")
+            # A tombstoned document was already uncounted from its session.
+            counted = Document.objects.filter(pk=doc_id, deleted_at__isnull=True).exclude(
+                status=Document.STATUS_FAILED
+            )
+            if counted.update(status=Document.STATUS_FAILED, status_updated_at=timezone.now(),
+                              error=str(e)):
+                ChatSession.forget_documents(doc.user_id, doc.session_id)
+            else:
+                set_status(Document.STATUS_FAILED, error=str(e))
+            return
+
+        set_status(
+            Document.STATUS_INDEXED,
+            embedding_store=vector_store_path,
+            processed=True,
+            error=''
+        )
+
+        # The session may have been deleted while the document was ingested.
+        deleted = Document.objects.filter(pk=doc_id, deleted_at__isnull=False).first()
+        if deleted:
+            reclaim_document(deleted, rag_processor)
+    finally:
+        close_old_connections()
+
+
+def recover_interrupted_documents(rag_processor) -> int:
+    """
+    Re-enqueue documents whose ingestion was lost with a stopped worker.
+
+    Each stale document is claimed with a conditional update first, so when
+    several processes recover at once only one of them re-enqueues it.
+    Stale documents of deleted sessions are reclaimed instead.
+
+    Args:
+        rag_processor (RAGProcessor): Processor used to parse and index the files.
+
+    Returns:
+        int: Number of documents re-enqueued.
+    """
+    recovered = 0
+    try:
+        stale = Document.objects.filter(stale_in_progress(), deleted_at__isnull=True)
+        for doc_id, status, updated_at in list(
+            stale.values_list('id', 'status', 'status_updated_at')
+        ):
+            claimed = Document.objects.filter(
+                pk=doc_id, status=status, status_updated_at=updated_at
+            ).update(status=Document.STATUS_QUEUED, status_updated_at=timezone.now())
+            if claimed:
+                print(f"Re-enqueueing interrupted ingestion of document {doc_id}")
+                ingestion_queue.enqueue(doc_id, rag_processor)
+                recovered += 1
+    finally:
+        close_old_connections()
+    reclaim_deleted_documents(rag_processor)
+    return recovered
+
+
+class IngestionQueue:
+    """
+    Local worker pool running ingestion jobs in the background.
+
+    Attributes:
+        max_workers (int): Number of documents ingested concurrently.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='ingestion'
+                )
+            return self._executor
+
+    def submit(self, job: Callable[..., Any], *args: Any) -> Optional[Future]:
+        """
+        Schedule a background job on the pool.
+
+        Args:
+            job (Callable[..., Any]): Function to run.
+            *args: Arguments passed to the function.
+
+        Returns:
+            Optional[Future]: The pending job, or None when it ran inline.
+        """
+        if getattr(settings, 'INGESTION_EAGER', False):
+            job(*args)
+            return None
+        return self._get_executor().submit(job, *args)
+
+    def enqueue(self, doc_id: int, rag_processor) -> Optional[Future]:
+        """
+        Schedule a document for ingestion.
+
+        Args:
+            doc_id (int): Primary key of the document to ingest.
+            rag_processor (RAGProcessor): Processor used to parse and index the file.
+
+        Returns:
+            Optional[Future]: The pending job, or None when it ran inline.
+        """
+        return self.submit(ingest_document, doc_id, rag_processor)
+
+    def recover_on_first_request(self, rag_processor) -> None:
+        """
+        Schedule ``recover_interrupted_documents`` when the process serves its
+        first request.
+
+        Nothing is scheduled with ``INGESTION_EAGER``, where jobs run inside
+        their request and no queue can be lost.
+
+        Args:
+            rag_processor (RAGProcessor): Processor used to parse and index the files.
+        """
+        if getattr(settings, 'INGESTION_EAGER', False):
+            return
+        dispatch_uid = f'ingestion-recovery-{id(self)}'
+
+        def recover(sender, **kwargs):
+            request_started.disconnect(dispatch_uid=dispatch_uid)
+            self.submit(recover_interrupted_documents, rag_processor)
+
+        request_started.connect(recover, weak=False, dispatch_uid=dispatch_uid)
+
+
+ingestion_queue = IngestionQueue(max_workers=getattr(settings, 'INGESTION_WORKERS', 2))
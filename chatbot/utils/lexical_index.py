@@ -0,0 +1,267 @@
+"""
+Local BM25 inverted index kept alongside each session vector store.
+
+Vector retrieval needs the question embedded by the remote API first. When that
+call is slow or failing, or when the question is an identifier such as an error
+code that embeddings capture poorly, the lexical index still finds the chunks
+that contain the question's terms, without any network call.
+
+Each session store directory holds a ``lexical.sqlite3`` database with the
+chunks (text, metadata and token count), their term frequencies, and collection
+totals for the BM25 length normalisation. It is written by the same
+``SessionIndexWriter`` as the vectors and committed when they are saved.
+``reciprocal_rank_fusion`` merges lexical and vector rankings, whose scores are
+not comparable, by rank alone.
+"""
+import json
+import math
+import re
+import sqlite3
+import string
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+from langchain_core.documents import Document as LangchainDocument
+
+LEXICAL_DB = 'lexical.sqlite3'
+
+# BM25 term frequency saturation and length normalisation.
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from had has have how i if in is it
+its me my no not of on or our so that the their them then there these they this
+to was we were what when where which who why will with you your
+""".split())
+
+_TOKEN = re.compile(r"\w+")
+# A digit, or punctuation joining word characters, as in ERR-4011 or config.yaml.
+_IDENTIFIER = re.compile(r"[A-Za-z]*\d|\w[_./-]\w")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id TEXT PRIMARY KEY,
+    doc_id TEXT,
+    length INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, chunk_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    chunks INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals VALUES (0, 0, 0);
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens, dropping stopwords and single letters."""
+    return [token for token in _TOKEN.findall(text.lower())
+            if token not in STOPWORDS and (len(token) > 1 or token.isdigit())]
+
+
+def is_keyword_query(query: str) -> bool:
+    """
+    Tell whether a question is better served by exact term matching.
+
+    Quoted phrases and short queries containing an identifier (a code, number
+    or dotted name, such as ``ERR-4011`` or ``section 4.2``) are keyword-like.
+    Punctuation around words does not count, so "Hi!" or "What's this?" are not.
+
+    Args:
+        query (str): The user question.
+
+    Returns:
+        bool: True for keyword-like queries.
+    """
+    text = query.strip()
+    if len(text) > 2 and text[0] == text[-1] and text[0] in '"\'':
+        return True
+    words = [word.strip(string.punctuation) for word in text.split()]
+    words = [word for word in words if word]
+    return 0 < len(words) <= 3 and any(_IDENTIFIER.search(word) for word in words)
+
+
+class LexicalIndexWriter:
+    """
+    Transactional writer of a store's lexical index.
+
+    Changes become visible when ``commit`` is called and are discarded by
+    ``close`` otherwise.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._connection = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.db_path, isolation_level=None)
+            self._connection.executescript(SCHEMA)
+            self._connection.execute('BEGIN')
+        return self._connection
+
+    def add(self, chunk_ids: Sequence[str], chunks: Sequence[LangchainDocument]) -> None:
+        """
+        Index chunks under their ids.
+
+        Args:
+            chunk_ids (Sequence[str]): Ids of the chunks.
+            chunks (Sequence[LangchainDocument]): The chunks, with ``doc_id`` metadata.
+        """
+        connection = self._connect()
+        total_length = 0
+        for chunk_id, chunk in zip(chunk_ids, chunks):
+            terms = Counter(tokenize(chunk.page_content))
+            length = sum(terms.values())
+            total_length += length
+            connection.execute(
+                'INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)',
+                (chunk_id, chunk.metadata.get('doc_id'), length, chunk.page_content,
+                 json.dumps(chunk.metadata))
+            )
+            connection.executemany(
+                'INSERT OR REPLACE INTO postings VALUES (?, ?, ?)',
+                [(term, chunk_id, tf) for term, tf in terms.items()]
+            )
+        connection.execute(
+            'UPDATE totals SET chunks = chunks + ?, length = length + ? WHERE id = 0',
+            (len(chunk_ids), total_length)
+        )
+
+    def remove(self, chunk_ids: Sequence[str]) -> None:
+        """
+        Drop chunks from the index, ignoring unknown ids.
+
+        Args:
+            chunk_ids (Sequence[str]): Ids of the chunks to drop.
+        """
+        connection = self._connect()
+        for chunk_id in chunk_ids:
+            row = connection.execute(
+                'SELECT length FROM chunks WHERE chunk_id = ?', (chunk_id,)
+            ).fetchone()
+            if row is None:
+                continue
+            connection.execute('DELETE FROM postings WHERE chunk_id = ?', (chunk_id,))
+            connection.execute('DELETE FROM chunks WHERE chunk_id = ?', (chunk_id,))
+            connection.execute(
+                'UPDATE totals SET chunks = chunks - 1, length = length - ? WHERE id = 0',
+                (row[0],)
+            )
+
+    def commit(self) -> None:
+        """Make the pending changes visible and end the transaction."""
+        if self._connection is not None:
+            self._connection.execute('COMMIT')
+            self._connection.close()
+            self._connection = None
+
+    def close(self) -> None:
+        """Discard uncommitted changes."""
+        if self._connection is not None:
+            self._connection.execute('ROLLBACK')
+            self._connection.close()
+            self._connection = None
+
+
+def search_lexical(
+    db_path: Path,
+    query: str,
+    k: int,
+    min_match: float = 0.5
+) -> List[Tuple[LangchainDocument, float]]:
+    """
+    Rank a store's chunks against a question with BM25.
+
+    Args:
+        db_path (Path): The store's lexical index.
+        query (str): The user question.
+        k (int): Maximum number of chunks returned.
+        min_match (float): Share of the question's term weight a chunk must
+            contain to be returned, weighting each term by its IDF so that
+            matching only common terms is not enough.
+
+    Returns:
+        List[Tuple[LangchainDocument, float]]: Chunks with their BM25 scores,
+        best first; empty when the store has no lexical index.
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms or not Path(db_path).exists():
+        return []
+    connection = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        chunk_count, total_length = connection.execute(
+            'SELECT chunks, length FROM totals WHERE id = 0'
+        ).fetchone()
+        if not chunk_count:
+            return []
+        average_length = total_length / chunk_count
+        rows = connection.execute(
+            'SELECT p.term, p.chunk_id, p.tf, c.length FROM postings p '
+            'JOIN chunks c ON c.chunk_id = p.chunk_id '
+            f'WHERE p.term IN ({", ".join("?" * len(terms))})',
+            terms
+        ).fetchall()
+
+        document_frequency = Counter(term for term, _, _, _ in rows)
+        idf = {term: math.log(1 + (chunk_count - document_frequency[term] + 0.5)
+                              / (document_frequency[term] + 0.5))
+               for term in terms}
+        scores: Dict[str, float] = Counter()
+        matched: Dict[str, float] = Counter()
+        for term, chunk_id, tf, length in rows:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / max(average_length, 1e-9))
+            scores[chunk_id] += idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+            matched[chunk_id] += idf[term]
+
+        required = min_match * sum(idf.values())
+        best = sorted(
+            (chunk_id for chunk_id in scores if matched[chunk_id] >= required),
+            key=lambda chunk_id: (-scores[chunk_id], chunk_id)
+        )[:k]
+        results = []
+        for chunk_id in best:
+            content, metadata = connection.execute(
+                'SELECT content, metadata FROM chunks WHERE chunk_id = ?', (chunk_id,)
+            ).fetchone()
+            results.append((
+                LangchainDocument(id=chunk_id, page_content=content,
+                                  metadata=json.loads(metadata)),
+                scores[chunk_id]
+            ))
+        return results
+    finally:
+        connection.close()
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Hashable]],
+    k: int = 60
+) -> Dict[Hashable, float]:
+    """
+    Fuse rankings by summing ``1 / (k + rank)`` over the rankings of each item.
+
+    Args:
+        rankings (Sequence[Sequence[Hashable]]): Items of each ranking, best first.
+        k (int): Damping constant; larger values flatten the rank differences.
+
+    Returns:
+        Dict[Hashable, float]: Fused score of every item; higher is better.
+    """
+    fused: Dict[Hashable, float] = Counter()
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] += 1 / (k + rank)
+    return fused
@@ -0,0 +1,64 @@
+"""
+Exclusive locks shared by threads and processes through lock files.
+
+Session stores and routing tables are updated by read-modify-write. Uploads to
+the same session can be ingested by different ASGI or worker processes, and a
+thread lock would let both load the old file and the last save win. Writers
+therefore hold an OS lock on a lock file (``flock``, or ``msvcrt.locking`` on
+Windows) for the whole read-modify-write.
+
+Lock files are kept apart from the files they guard, so deleting a store never
+deletes a lock someone is holding or waiting for.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# OS locks are per open file; the thread lock keeps threads from queueing on it.
+_thread_locks = defaultdict(threading.Lock)
+
+
+def _acquire(handle) -> None:
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _release(handle) -> None:
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(lock_path: Path) -> Iterator[None]:
+    """
+    Hold an exclusive lock on a lock file, blocking until it is free.
+
+    Args:
+        lock_path (Path): The lock file, created with its directory if missing.
+
+    Yields:
+        None: While the lock is held.
+    """
+    lock_path = Path(lock_path)
+    with _thread_locks[str(lock_path)]:
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, 'a+b') as handle:
+            _acquire(handle)
+            try:
+                yield
+            finally:
+                _release(handle)
@@ -0,0 +1,153 @@
+"""
+Conversation memory with a bounded prompt size.
+
+Sending every prior turn with each message makes prompt size, cost and latency
+grow with the length of a session. Instead the chat keeps the most recent
+``CHAT_MEMORY_WINDOW`` turns verbatim and folds older turns into a rolling
+summary stored in ``ConversationSummary``.
+
+The summary is only recomputed once ``CHAT_SUMMARY_BATCH`` turns have fallen
+out of the window, and then only from the previous summary plus those turns,
+so each turn is summarized exactly once. Summarizing runs on the background
+worker pool, so a chat request never waits for it: until the summary catches
+up, the turns waiting to be folded in are sent verbatim. Turns without a user
+message, such as the welcome turn of a new chat, are left out.
+"""
+import threading
+from typing import Dict, List, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections
+from django.utils import timezone
+
+from chatbot.models import Chat, ConversationSummary
+from chatbot.utils.clients import get_gemini_model
+from chatbot.utils.ingestion import ingestion_queue
+from chatbot.utils.rate_limit import call_paced
+
+# Sessions with a summarization job in flight in this process.
+_summarizing = set()
+_summarizing_lock = threading.Lock()
+
+
+def memory_sizes() -> Tuple[int, int]:
+    """Return the memory window and the number of expired turns summarized at once."""
+    return (getattr(settings, 'CHAT_MEMORY_WINDOW', 6),
+            getattr(settings, 'CHAT_SUMMARY_BATCH', 4))
+
+
+def pending_turns(user_id, session_id, summarized_through: int):
+    """Query the turns of a session not folded into its summary yet, oldest first."""
+    return Chat.objects.filter(
+        user=user_id,
+        session_id=session_id,
+        id__gt=summarized_through
+    ).exclude(message='').order_by('id').values('id', 'message', 'response')
+
+
+def build_summary_prompt(summary: str, turns: List[Dict]) -> str:
+    """Build the prompt folding older turns into the running summary."""
+    transcript = "\n".join(
+        f"You: {turn['message']}\nAI Chatbot: {turn['response']}"
+        for turn in turns
+    )
+    return (
+        "Update the summary of the conversation below. Keep facts, names, "
+        "decisions and open questions the user may refer back to; be concise.\n\n"
+        f"Current summary:\n{summary or '(none)'}\n\n"
+        f"New turns:\n{transcript}\n\n"
+        "Updated summary:"
+    )
+
+
+def summarize_turns(summary: str, turns: List[Dict]) -> str:
+    """
+    Fold turns into a conversation summary with one Gemini call.
+
+    Args:
+        summary (str): The current summary, possibly empty.
+        turns (List[Dict]): Turns to fold in, oldest first.
+
+    Returns:
+        str: The updated summary.
+    """
+    response = call_paced(
+        get_gemini_model().generate_content, build_summary_prompt(summary, turns)
+    )
+    return response.text.strip()
+
+
+def summarize_conversation(user_id, session_id) -> None:
+    """
+    Fold the turns that fell out of a session's memory window into its summary.
+
+    Runs as a background job. The summary only advances if no other job moved
+    it meanwhile; if summarizing fails, the expired turns are retried after
+    the next message.
+
+    Args:
+        user_id (int): Owner of the session.
+        session_id (str): Chat session identifier.
+    """
+    key = (user_id, str(session_id))
+    with _summarizing_lock:
+        if key in _summarizing:
+            return
+        _summarizing.add(key)
+    try:
+        window, batch = memory_sizes()
+        try:
+            memory, _ = ConversationSummary.objects.get_or_create(
+                user_id=user_id, session_id=session_id
+            )
+        except IntegrityError:
+            # Another process created the row concurrently.
+            memory = ConversationSummary.objects.get(user_id=user_id, session_id=session_id)
+        turns = list(pending_turns(user_id, session_id, memory.summarized_through))
+        if len(turns) < window + batch:
+            return
+        expired = turns[:-window]
+        ConversationSummary.objects.filter(
+            pk=memory.pk,
+            summarized_through=memory.summarized_through
+        ).update(
+            summary=summarize_turns(memory.summary, expired),
+            summarized_through=expired[-1]['id'],
+            updated_at=timezone.now()
+        )
+    except Exception as e:
+        print(f"Error while summarizing conversation: {e}")
+    finally:
+        with _summarizing_lock:
+            _summarizing.discard(key)
+        close_old_connections()
+
+
+async def aload_conversation_memory(user, session_id) -> Tuple[str, List[Dict]]:
+    """
+    Load the summary and recent turns to send along with a new message.
+
+    When enough turns have fallen out of the window, summarizing them is left
+    to a background job and they are sent verbatim meanwhile, up to
+    ``CHAT_SUMMARY_BATCH`` turns beyond the window.
+
+    Args:
+        user (User): Owner of the session.
+        session_id (str): Chat session identifier.
+
+    Returns:
+        Tuple[str, List[Dict]]: The summary of older turns and the recent turns,
+        oldest first, as dicts with ``message`` and ``response``.
+    """
+    window, batch = memory_sizes()
+    memory = await ConversationSummary.objects.filter(
+        user=user,
+        session_id=session_id
+    ).afirst()
+    summary, summarized_through = (memory.summary, memory.summarized_through) if memory else ('', 0)
+    pending = [turn async for turn in pending_turns(user, session_id, summarized_through)]
+
+    if len(pending) >= window + batch:
+        await sync_to_async(ingestion_queue.submit)(summarize_conversation, user.id, session_id)
+    return summary, pending[-(window + batch):]
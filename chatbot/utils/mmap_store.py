@@ -0,0 +1,425 @@
+"""
+Memory-mapped vector store format.
+
+A LangChain FAISS store is an ``index.faiss`` file plus a pickled docstore,
+``index.pkl``. The whole docstore has to be unpickled before the first search,
+and every worker process keeps its own private copy. The ``mmap`` format instead
+writes each version of a store into a fresh ``mmap-<id>`` subdirectory:
+
+- ``vectors.f32``: the raw float32 vectors, row by row. They are memory-mapped,
+  so opening a store reads nothing, and processes share the page cache.
+- ``chunks.sqlite3``: one row per vector with the chunk id, document id, text
+  and metadata. Only the rows of search hits are ever read.
+
+``manifest.json`` in the store directory names the current version with its
+dimension and row count. Replacing it is the single atomic step of a save, so
+readers see either the old or the new version and never a mix of the two, and
+its presence marks a complete store. The previous version is kept for readers
+that read the old manifest just before; older ones are removed.
+
+``MmapVectorStore`` provides the subset of the FAISS store API the RAG pipeline
+uses (``index``, ``index_to_docstore_id``, ``docstore`` and similarity
+searches). Writers load stores as FAISS objects with ``to_faiss`` and save them
+with ``write_mmap_store``.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document as LangchainDocument
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+MANIFEST = 'manifest.json'
+VECTORS = 'vectors.f32'
+CHUNKS = 'chunks.sqlite3'
+VERSION_PREFIX = 'mmap-'
+
+# Rows scored at once by the brute-force searches.
+_SEARCH_BLOCK = 65536
+
+
+def is_mmap_store(store_path) -> bool:
+    """Check whether a directory holds a complete mmap store."""
+    return (Path(store_path) / MANIFEST).exists()
+
+
+def remove_mmap_files(store_path, keep: Tuple[str, ...] = ()) -> None:
+    """
+    Delete the mmap files of a store, except the named versions.
+
+    Args:
+        store_path: Directory of the store.
+        keep (Tuple[str, ...]): Versions to keep, by manifest ``version``. With
+            none kept, the manifest goes first, so the store no longer reads as mmap.
+    """
+    store_path = Path(store_path)
+    if not keep:
+        (store_path / MANIFEST).unlink(missing_ok=True)
+    if '' not in keep:
+        # Stores written before versioning keep their files at the top level.
+        for name in (VECTORS, CHUNKS):
+            (store_path / name).unlink(missing_ok=True)
+    for version_dir in store_path.glob(f'{VERSION_PREFIX}*'):
+        if version_dir.name not in keep:
+            shutil.rmtree(version_dir, ignore_errors=True)
+
+
+class _Chunks:
+    """Read-only access to the chunk table of a store, shared across threads."""
+
+    def __init__(self, db_path: Path):
+        self._connection = sqlite3.connect(
+            f'file:{db_path}?mode=ro', uri=True, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+
+    def query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+
+class MmapIndex:
+    """
+    Exact L2 index over memory-mapped vectors with the FAISS calls used here.
+
+    Attributes:
+        vectors (np.ndarray): Read-only memory map of shape (ntotal, d).
+    """
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    @property
+    def ntotal(self) -> int:
+        """Number of indexed vectors."""
+        return self.vectors.shape[0]
+
+    @property
+    def d(self) -> int:
+        """Vector dimension."""
+        return self.vectors.shape[1]
+
+    def reconstruct(self, position: int) -> np.ndarray:
+        """Copy one stored vector."""
+        return np.array(self.vectors[position], dtype=np.float32)
+
+    def _blocks(self, query: np.ndarray) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield squared L2 distances to ``query`` block by block."""
+        query_norm = float(query @ query)
+        for start in range(0, self.ntotal, _SEARCH_BLOCK):
+            block = self.vectors[start:start + _SEARCH_BLOCK]
+            distances = np.einsum('ij,ij->i', block, block) - 2 * (block @ query) + query_norm
+            yield start, np.maximum(distances, 0)
+
+    def range_search(
+        self,
+        queries: np.ndarray,
+        radius: float
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find every vector within a squared L2 distance, as ``faiss.Index.range_search``.
+
+        Args:
+            queries (np.ndarray): Query vectors of shape (n, d).
+            radius (float): Maximum squared L2 distance.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: Result offsets per query,
+            distances and positions.
+        """
+        lims = [0]
+        distances = [np.zeros(0, dtype=np.float32)]
+        positions = [np.zeros(0, dtype=np.int64)]
+        for query in np.asarray(queries, dtype=np.float32):
+            found = 0
+            for start, block in self._blocks(query):
+                hits = np.flatnonzero(block <= radius)
+                distances.append(block[hits].astype(np.float32))
+                positions.append(hits.astype(np.int64) + start)
+                found += len(hits)
+            lims.append(lims[-1] + found)
+        return (np.array(lims, dtype=np.int64), np.concatenate(distances),
+                np.concatenate(positions))
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the ``k`` nearest vectors, as ``faiss.Index.search``.
+
+        Args:
+            queries (np.ndarray): Query vectors of shape (n, d).
+            k (int): Number of neighbours.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Distances and positions, padded with
+            -1 positions when the index holds fewer than ``k`` vectors.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        all_distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        all_positions = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, query in enumerate(queries):
+            best_distances = np.zeros(0, dtype=np.float32)
+            best_positions = np.zeros(0, dtype=np.int64)
+            for start, block in self._blocks(query):
+                take = min(k, len(block))
+                candidates = np.argpartition(block, take - 1)[:take]
+                best_distances = np.concatenate([best_distances, block[candidates]])
+                best_positions = np.concatenate([best_positions, candidates + start])
+                order = np.argsort(best_distances, kind='stable')[:k]
+                best_distances, best_positions = best_distances[order], best_positions[order]
+            all_distances[row, :len(best_distances)] = best_distances
+            all_positions[row, :len(best_positions)] = best_positions
+        return all_distances, all_positions
+
+
+class MmapIdMap(Mapping):
+    """Position to chunk id mapping of a store, read from its chunk table."""
+
+    def __init__(self, chunks: _Chunks, size: int):
+        self._chunks = chunks
+        self._size = size
+
+    def __getitem__(self, position: int) -> str:
+        rows = self._chunks.query('SELECT chunk_id FROM chunks WHERE position = ?',
+                                  (int(position),))
+        if not rows:
+            raise KeyError(position)
+        return rows[0][0]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self._size))
+
+    def __len__(self) -> int:
+        return self._size
+
+    def items(self) -> Iterable[Tuple[int, str]]:
+        return self._chunks.query('SELECT position, chunk_id FROM chunks ORDER BY position')
+
+    def values(self) -> Iterable[str]:
+        return [row[0] for row in self._chunks.query(
+            'SELECT chunk_id FROM chunks ORDER BY position'
+        )]
+
+
+class MmapDocstore:
+    """Chunk lookup by id, reading only the requested rows."""
+
+    def __init__(self, chunks: _Chunks):
+        self._chunks = chunks
+
+    def search(self, chunk_id: str) -> LangchainDocument:
+        """Fetch one chunk, raising KeyError when it is not in the store."""
+        rows = self._chunks.query(
+            'SELECT content, metadata FROM chunks WHERE chunk_id = ?', (chunk_id,)
+        )
+        if not rows:
+            raise KeyError(chunk_id)
+        content, metadata = rows[0]
+        return LangchainDocument(id=chunk_id, page_content=content,
+                                 metadata=json.loads(metadata))
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Read-only vector store over the files of the ``mmap`` format.
+
+    Attributes:
+        index (MmapIndex): The memory-mapped vectors.
+        index_to_docstore_id (MmapIdMap): Chunk id of each position.
+        docstore (MmapDocstore): Chunk texts and metadata.
+    """
+
+    def __init__(self, store_path, embeddings: Embeddings):
+        store_path = Path(store_path)
+        with open(store_path / MANIFEST, encoding='utf-8') as f:
+            manifest = json.load(f)
+        count, dim = manifest['count'], manifest['dim']
+        version_dir = store_path / manifest.get('version', '')
+        vectors_path = version_dir / VECTORS
+        if vectors_path.stat().st_size != count * dim * np.dtype(np.float32).itemsize:
+            raise ValueError(f"Vectors of {store_path} do not match its manifest")
+        vectors = np.memmap(vectors_path, dtype=np.float32, mode='r',
+                            shape=(count, dim)) if count else np.zeros((0, dim), np.float32)
+        self._chunks = _Chunks(version_dir / CHUNKS)
+        self._embeddings = embeddings
+        self.index = MmapIndex(vectors)
+        self.index_to_docstore_id = MmapIdMap(self._chunks, count)
+        self.docstore = MmapDocstore(self._chunks)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embeddings
+
+    def position_doc_ids(self) -> List[Optional[str]]:
+        """Document id of each position, read in a single query."""
+        return [row[0] for row in self._chunks.query(
+            'SELECT doc_id FROM chunks ORDER BY position'
+        )]
+
+    def _hits(
+        self,
+        positions: np.ndarray,
+        distances: np.ndarray
+    ) -> List[Tuple[LangchainDocument, float]]:
+        return [
+            (self.docstore.search(self.index_to_docstore_id[int(position)]), float(distance))
+            for position, distance in zip(positions, distances) if position >= 0
+        ]
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        **kwargs: Any
+    ) -> List[Tuple[LangchainDocument, float]]:
+        """Return the ``k`` nearest chunks with their squared L2 distances."""
+        distances, positions = self.index.search(np.asarray([embedding], np.float32), k)
+        return self._hits(positions[0], distances[0])
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        **kwargs: Any
+    ) -> List[Tuple[LangchainDocument, float]]:
+        """Return the ``k`` nearest chunks to a question with their distances."""
+        return self.similarity_search_with_score_by_vector(
+            self._embeddings.embed_query(query), k
+        )
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[LangchainDocument]:
+        """Return the ``k`` nearest chunks to a question."""
+        return [chunk for chunk, _ in self.similarity_search_with_score(query, k)]
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        **kwargs: Any
+    ) -> List[LangchainDocument]:
+        """Return ``k`` diverse chunks among the ``fetch_k`` nearest ones."""
+        embedding = np.asarray(self._embeddings.embed_query(query), dtype=np.float32)
+        _, positions = self.index.search(embedding[None, :], fetch_k)
+        positions = positions[0][positions[0] >= 0]
+        if not len(positions):
+            return []
+        candidates = np.vstack([self.index.reconstruct(int(p)) for p in positions])
+        selected = maximal_marginal_relevance(embedding, candidates, lambda_mult, k)
+        return [self.docstore.search(self.index_to_docstore_id[int(positions[i])])
+                for i in selected]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        store_path=None,
+        **kwargs: Any
+    ) -> 'MmapVectorStore':
+        """
+        Embed texts, write them as an mmap store and open it.
+
+        Args:
+            texts (List[str]): Chunk texts.
+            embedding (Embeddings): Model embedding the texts and later queries.
+            metadatas (Optional[List[dict]]): Metadata of each text.
+            ids (Optional[List[str]]): Chunk ids; generated when None.
+            store_path: Directory the store is written to.
+            **kwargs: Further arguments of ``FAISS.from_texts``.
+
+        Returns:
+            MmapVectorStore: The written store.
+        """
+        if store_path is None:
+            raise ValueError("mmap stores need a store_path to be written to")
+        vector_store = FAISS.from_texts(texts, embedding, metadatas=metadatas, ids=ids, **kwargs)
+        write_mmap_store(vector_store, store_path)
+        return cls(store_path, embedding)
+
+    def to_faiss(self) -> FAISS:
+        """
+        Copy the store into an in-memory FAISS store that can be modified.
+
+        Returns:
+            FAISS: A writable store with the same vectors, ids and chunks.
+        """
+        rows = self._chunks.query(
+            'SELECT chunk_id, content, metadata FROM chunks ORDER BY position'
+        )
+        vectors = np.asarray(self.index.vectors, dtype=np.float32)
+        return FAISS.from_embeddings(
+            [(content, vector) for (_, content, _), vector in zip(rows, vectors.tolist())],
+            self._embeddings,
+            metadatas=[json.loads(metadata) for _, _, metadata in rows],
+            ids=[chunk_id for chunk_id, _, _ in rows]
+        )
+
+
+def write_mmap_store(vector_store: FAISS, store_path) -> None:
+    """
+    Save a FAISS store in the ``mmap`` format.
+
+    The files are written into a new version directory and the manifest is
+    replaced last, so open readers keep their mapping of the previous version.
+
+    Args:
+        vector_store (FAISS): The store to save.
+        store_path: Directory of the store; FAISS files in it are removed.
+    """
+    store_path = Path(store_path)
+    previous = None
+    if is_mmap_store(store_path):
+        with open(store_path / MANIFEST, encoding='utf-8') as f:
+            previous = json.load(f).get('version', '')
+    version = f'{VERSION_PREFIX}{uuid.uuid4().hex}'
+    version_dir = store_path / version
+    version_dir.mkdir(parents=True)
+    index = vector_store.index
+    count = index.ntotal
+
+    connection = sqlite3.connect(version_dir / CHUNKS)
+    try:
+        connection.execute(
+            'CREATE TABLE chunks (position INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE, '
+            'doc_id TEXT, content TEXT, metadata TEXT)'
+        )
+
+        def rows():
+            for position in range(count):
+                chunk_id = vector_store.index_to_docstore_id[position]
+                chunk = vector_store.docstore.search(chunk_id)
+                yield (position, chunk_id, chunk.metadata.get('doc_id'),
+                       chunk.page_content, json.dumps(chunk.metadata))
+
+        connection.executemany('INSERT INTO chunks VALUES (?, ?, ?, ?, ?)', rows())
+        connection.commit()
+    finally:
+        connection.close()
+
+    (index.reconstruct_n(0, count) if count else np.zeros((0, index.d))).astype(
+        np.float32
+    ).tofile(version_dir / VECTORS)
+
+    manifest_temp = store_path / f'{MANIFEST}.tmp'
+    manifest_temp.write_text(
+        json.dumps({'format': 'mmap', 'version': version, 'dim': index.d, 'count': count}),
+        encoding='utf-8'
+    )
+    os.replace(manifest_temp, store_path / MANIFEST)
+    remove_mmap_files(store_path, keep=(version,) if previous is None else (version, previous))
+    for name in ('index.faiss', 'index.pkl'):
+        (store_path / name).unlink(missing_ok=True)
@@ -0,0 +1,148 @@
+"""
+Parallel text extraction and chunking of PDF page ranges.
+
+Extracting text from a long PDF is CPU-bound and used to run page after page
+on a single core before the first chunk could be embedded. Large documents are
+instead cut into ranges of ``PDF_PAGES_PER_TASK`` pages that worker processes
+extract and split independently. Chunks never span pages (each page is split
+on its own, as in the sequential path), and every page carries the document
+metadata ``PyPDFLoader`` gave the first page, so splitting per range yields
+exactly the chunks of a sequential run. Ranges are collected in page order and
+only a few are in flight at once, so chunk ids assigned downstream stay stable
+and memory stays bounded.
+
+Workers are spawned rather than forked, since the parent runs embedding and
+ingestion threads. Pools are kept for the life of the process, one per worker
+count, and only replaced once broken, since other ingestion threads may still
+be collecting results from them. This module must not import Django so that
+spawned workers can import it cheaply.
+"""
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Deque, Dict, Iterator, List
+
+import pypdf
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document as LangchainDocument
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pool_lock = threading.Lock()
+
+
+def extract_page_range(
+    file_path: str,
+    start: int,
+    stop: int,
+    chunk_size: int,
+    chunk_overlap: int,
+    document_metadata: Dict[str, Any]
+) -> List[LangchainDocument]:
+    """
+    Extract and split the pages ``start`` to ``stop - 1`` of a PDF.
+
+    Runs in a worker process; pages carry the same metadata as ``PyPDFLoader``
+    gives them: the document's, plus their ``page`` and ``page_label``.
+
+    Args:
+        file_path (str): Path to the PDF file.
+        start (int): First page, zero-based.
+        stop (int): Page after the last one.
+        chunk_size (int): Maximum characters per chunk.
+        chunk_overlap (int): Characters shared by consecutive chunks.
+        document_metadata (Dict[str, Any]): Metadata ``PyPDFLoader`` gives
+            every page, without ``page`` and ``page_label``.
+
+    Returns:
+        List[LangchainDocument]: Chunks of the range, in page order.
+    """
+    reader = pypdf.PdfReader(file_path)
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+    )
+    chunks = []
+    for page_number in range(start, stop):
+        page = LangchainDocument(
+            page_content=reader.pages[page_number].extract_text(extraction_mode='plain').strip(),
+            metadata={
+                **document_metadata,
+                'page': page_number,
+                'page_label': reader.page_labels[page_number],
+            }
+        )
+        chunks.extend(text_splitter.split_documents([page]))
+    return chunks
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Get the shared extraction pool of a size, replacing it only once broken.
+
+    A pool breaks when one of its processes dies; its pending results fail
+    either way, so replacing it never cuts off a caller still using it.
+
+    Args:
+        workers (int): Number of worker processes.
+
+    Returns:
+        ProcessPoolExecutor: The pool.
+    """
+    with _pool_lock:
+        pool = _pools.get(workers)
+        if pool is None or pool._broken:
+            pool = _pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return pool
+
+
+def iter_parallel_chunks(
+    file_path: str,
+    num_pages: int,
+    chunk_size: int,
+    chunk_overlap: int,
+    workers: int,
+    pages_per_task: int,
+    document_metadata: Dict[str, Any]
+) -> Iterator[List[LangchainDocument]]:
+    """
+    Extract page ranges in worker processes and yield their chunks in page order.
+
+    At most two ranges per worker are extracted ahead of the consumer.
+
+    Args:
+        file_path (str): Path to the PDF file.
+        num_pages (int): Number of pages in the file.
+        chunk_size (int): Maximum characters per chunk.
+        chunk_overlap (int): Characters shared by consecutive chunks.
+        workers (int): Number of worker processes.
+        pages_per_task (int): Pages extracted by each task.
+        document_metadata (Dict[str, Any]): Metadata ``PyPDFLoader`` gives
+            every page, without ``page`` and ``page_label``.
+
+    Yields:
+        List[LangchainDocument]: The chunks of each page range, in order.
+    """
+    pool = get_pool(workers)
+    ranges = ((start, min(start + pages_per_task, num_pages))
+              for start in range(0, num_pages, pages_per_task))
+
+    def submit(page_range) -> Future:
+        return pool.submit(extract_page_range, file_path, *page_range,
+                           chunk_size, chunk_overlap, document_metadata)
+
+    pending: Deque[Future] = deque(submit(page_range)
+                                   for page_range in islice(ranges, 2 * workers))
+    try:
+        while pending:
+            chunks = pending.popleft().result()
+            for page_range in islice(ranges, 1):
+                pending.append(submit(page_range))
+            yield chunks
+    finally:
+        for future in pending:
+            future.cancel()
@@ -1,35 +1,123 @@
 """
 Retrieval-Augmented Generation (RAG) Utilities for document processing,
-embedding storage, and conversational retrieval chains using Google Generative AI.
+embedding storage, and retrieval-augmented answering using Google Generative AI.
 
 This module provides utilities for:
-1. Interacting with Google Generative AI models for content generation.
-2. Processing and splitting PDF documents into chunks for embedding.
-3. Managing embeddings and vector stores using FAISS.
-4. Creating conversational retrieval chains for Q&A with document context.
-5. Querying multiple vector stores and combining responses intelligently.
-6. Cleaning up vector stores, metadata, and associated documents.
+1. Processing and splitting PDF documents into chunks for embedding.
+2. Maintaining one vector store per chat session, alongside a BM25 index.
+3. Retrieving chunks from all of a session's stores in one merged search.
+4. Answering from the retrieved chunks with a single, cached LLM call.
+5. Cleaning up vector stores, metadata, and associated documents.
 """
+import asyncio
+import hashlib
+import itertools
 import json
 import os
 import shutil
-import time
-from dataclasses import asdict, dataclass
+import threading
+import weakref
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 from django.conf import settings
 from google.api_core import exceptions
-from tenacity import retry, stop_after_attempt, wait_exponential
 
 from langchain.prompts import PromptTemplate
-from langchain.chains import ConversationalRetrievalChain
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+from langchain_core.documents import Document as LangchainDocument
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from chatbot.utils.ask_gemini import (
+    aask_gemini,
+    aask_gemini_stream,
+)
+from chatbot.utils.backends import build_embeddings
+from chatbot.utils.clients import ANSWER_PROMPT, GEMINI_MODEL, get_chat_model
+from chatbot.utils.embedding_cache import CachedEmbeddings
+from chatbot.utils.embedding_client import build_embedding_client
+from chatbot.utils.index_types import (
+    FLAT,
+    INDEX_TYPES,
+    IVF_PQ,
+    ORIGINALS,
+    OriginalVectors,
+    choose_index_type,
+    index_type_of,
+    rebuild_store,
+)
+from chatbot.utils.lexical_index import (
+    LEXICAL_DB,
+    LexicalIndexWriter,
+    is_keyword_query,
+    reciprocal_rank_fusion,
+    search_lexical,
+)
+from chatbot.utils.locks import file_lock
+from chatbot.utils.mmap_store import (
+    MmapVectorStore,
+    is_mmap_store,
+    remove_mmap_files,
+    write_mmap_store,
+)
+from chatbot.utils.pdf_extraction import iter_parallel_chunks
+from chatbot.utils.rate_limit import acall_paced, gemini_rate_limiter
+from chatbot.utils.response_cache import response_cache
+from chatbot.utils.routing_index import RoutingIndex, document_centroids
+from chatbot.utils.store_cache import vector_store_cache
+from chatbot.utils.timing import span, timed_iter
+
+# Per loaded store: the document of every index position, built once per store object.
+_document_codes: "weakref.WeakKeyDictionary[FAISS, Tuple[np.ndarray, List[str]]]" = (
+    weakref.WeakKeyDictionary()
+)
+_document_codes_lock = threading.Lock()
+
+def store_exists(store_path: Path) -> bool:
+    """Check whether a directory holds a saved store in any format."""
+    return (store_path / 'index.faiss').exists() or is_mmap_store(store_path)
+
+
+def read_store(store_path: str, embeddings) -> Union[FAISS, MmapVectorStore]:
+    """
+    Open a saved store in whichever format it was written.
+
+    Args:
+        store_path (str): Path to the store directory.
+        embeddings: Embedding model used for questions.
+
+    Returns:
+        Union[FAISS, MmapVectorStore]: The opened store.
+    """
+    if is_mmap_store(store_path):
+        return MmapVectorStore(store_path, embeddings)
+    return FAISS.load_local(
+        str(store_path),
+        embeddings,
+        allow_dangerous_deserialization=True
+    )
+
+
+@dataclass
+class RelevantDocument:
+    """
+    A document passing the relevance gate.
+
+    Attributes:
+        doc_id (str): Document identifier.
+        score (float): L2 distance of its closest chunk to the query; lower is better.
+        store_path (str): Vector store holding the document.
+    """
+    doc_id: str
+    score: float
+    store_path: str
 
-from chatbot.utils.ask_gemini import ask_gemini
 
 @dataclass
 class DocumentMetadata:
@@ -41,24 +129,223 @@ class DocumentMetadata:
     chunk_overlap: int
     num_chunks: int
     embedding_model: str
+    session_id: Optional[str] = None
+    chunk_ids: List[str] = field(default_factory=list)
+    file_sha256: Optional[str] = None
+    index_type: str = FLAT
+
+
+class SessionIndexWriter:
+    """
+    Incremental writer for a session vector store.
+
+    Obtained from ``RAGProcessor.open_session_index``; chunks are added batch by
+    batch so a large document never has to be held in memory all at once.
+    The store is edited as an in-memory FAISS store and saved in ``store_format``.
+    In the ``faiss`` format its index type follows the store size, see
+    ``chatbot.utils.index_types``; ``mmap`` stores are searched exactly and are
+    always saved flat, from full-precision vectors.
+    The store's lexical index is updated alongside and committed with it; stores
+    saved before lexical indexes existed are indexed in full on their next write.
+    """
+
+    def __init__(self, embeddings, store_path: Path, vector_store: Optional[FAISS],
+                 store_format: str = 'faiss'):
+        self.embeddings = embeddings
+        self.store_path = store_path
+        self.vector_store = vector_store
+        self.store_format = store_format
+        self.lexical = LexicalIndexWriter(store_path / LEXICAL_DB)
+        # Flat indexes hold their vectors exactly; only quantized ones need originals.
+        self.originals = None
+        if vector_store is not None and self.index_type != FLAT:
+            self.originals = OriginalVectors(store_path / ORIGINALS, vector_store.index)
+        self._next_chunk = defaultdict(int)
+        if vector_store is not None and not self.lexical.db_path.exists():
+            chunk_ids = list(vector_store.index_to_docstore_id.values())
+            self.lexical.add(chunk_ids, [vector_store.docstore.search(chunk_id)
+                                         for chunk_id in chunk_ids])
+
+    def add(
+        self,
+        chunks: List[LangchainDocument],
+        doc_id: str,
+        vectors: Optional[List[List[float]]] = None
+    ) -> List[str]:
+        """
+        Append a batch of a document's chunks.
+
+        Args:
+            chunks (List[LangchainDocument]): Chunks to append.
+            doc_id (str): Document the chunks belong to.
+            vectors (Optional[List[List[float]]]): Precomputed chunk embeddings;
+                chunks are embedded when omitted.
+
+        Returns:
+            List[str]: Ids assigned to the chunks, continuing the document's numbering.
+        """
+        if not chunks:
+            return []
+        start = self._next_chunk[doc_id]
+        chunk_ids = [f'{doc_id}-{index}' for index in range(start, start + len(chunks))]
+        self._next_chunk[doc_id] = start + len(chunks)
+        for chunk in chunks:
+            chunk.metadata['doc_id'] = doc_id
+        texts = [chunk.page_content for chunk in chunks]
+        if vectors is None:
+            with span('embed_chunks'):
+                vectors = self.embeddings.embed_documents(texts)
+        text_embeddings = list(zip(texts, vectors))
+        metadatas = [chunk.metadata for chunk in chunks]
+
+        with span('index_add'):
+            if self.originals is not None:
+                self.originals.append(vectors)
+            if self.vector_store is None:
+                self.vector_store = FAISS.from_embeddings(
+                    text_embeddings,
+                    self.embeddings,
+                    metadatas=metadatas,
+                    ids=chunk_ids
+                )
+            else:
+                self.vector_store.add_embeddings(
+                    text_embeddings, metadatas=metadatas, ids=chunk_ids
+                )
+        with span('lexical_add'):
+            self.lexical.add(chunk_ids, chunks)
+        return chunk_ids
+
+    def remove(self, chunk_ids: List[str]) -> None:
+        """
+        Remove chunks by id, ignoring ids that are not in the store.
+
+        Args:
+            chunk_ids (List[str]): Ids of the chunks to remove.
+        """
+        if self.vector_store is None:
+            return
+        removed = set(chunk_ids) & set(self.vector_store.index_to_docstore_id.values())
+        if not removed:
+            return
+        self.lexical.remove(list(removed))
+        if self.originals is None:
+            self.vector_store.delete(list(removed))
+            return
+        kept = [position for position, chunk_id
+                in sorted(self.vector_store.index_to_docstore_id.items())
+                if chunk_id not in removed]
+        vectors = self.originals.get(kept) if kept and self.index_type == IVF_PQ else None
+        self.originals.keep(kept)
+        if vectors is None:
+            self.vector_store.delete(list(removed))
+            return
+        self.vector_store = rebuild_store(
+            self.vector_store, kept, self.target_index_type(len(kept)), vectors
+        )
+
+    @property
+    def index_type(self) -> str:
+        """Index type of the store, 'flat' before it has any chunks."""
+        if self.vector_store is None:
+            return FLAT
+        return index_type_of(self.vector_store.index)
+
+    def target_index_type(self, num_vectors: int) -> str:
+        """Index type a store of a given size is saved with in ``store_format``."""
+        if self.store_format == 'mmap':
+            return FLAT
+        return choose_index_type(num_vectors)
+
+    def save(self) -> None:
+        """
+        Persist the store, deleting it from disk once it holds no chunks.
+
+        A store that grew past the threshold of a more compact index type is
+        rebuilt with that type first, and a quantized store saved as ``mmap`` is
+        rebuilt flat; rebuilds start from the full-precision vectors, which a
+        store leaving the flat type starts keeping then.
+        """
+        if self.vector_store is None:
+            return
+        count = self.vector_store.index.ntotal
+        target = self.target_index_type(count)
+        current = self.index_type
+        if (target == FLAT and current != FLAT) or (
+                INDEX_TYPES.index(target) > INDEX_TYPES.index(current)):
+            with span('index_build'):
+                if self.originals is not None:
+                    vectors = self.originals.get(range(count))
+                else:
+                    vectors = self.vector_store.index.reconstruct_n(0, count)
+                self.vector_store = rebuild_store(
+                    self.vector_store, range(count), target, vectors
+                )
+                if self.originals is None and target != FLAT:
+                    self.originals = OriginalVectors(self.store_path / ORIGINALS)
+                    self.originals.append(vectors)
+        if count:
+            with span('store_save'):
+                if self.store_format == 'mmap':
+                    write_mmap_store(self.vector_store, self.store_path)
+                else:
+                    self.vector_store.save_local(str(self.store_path))
+                    remove_mmap_files(self.store_path)
+                if self.index_type == FLAT:
+                    (self.store_path / ORIGINALS).unlink(missing_ok=True)
+                else:
+                    self.originals.save()
+                self.lexical.commit()
+        elif self.store_path.exists():
+            self.lexical.close()
+            shutil.rmtree(self.store_path)
+
+    def close(self) -> None:
+        """
+        Discard unsaved lexical changes, and the directory of a store never saved.
+        """
+        self.lexical.close()
+        if self.store_path.exists() and not store_exists(self.store_path):
+            shutil.rmtree(self.store_path)
 
 
 class RAGProcessor:
     """
     Retrieval-Augmented Generation Processor for managing document embeddings
-    and conversational retrieval chains.
+    and conversational retrieval.
     """
 
+    document_relevance_threshold = 0.7
+    retrieval_top_k = 4
+    # Share of a question's IDF-weighted terms a chunk must contain to be a lexical hit.
+    lexical_min_match = 0.5
+    fusion_k = 60
+    chunk_size = 1000
+    chunk_overlap = 200
+    llm_model = GEMINI_MODEL
+
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=api_key
+        self.store_format = getattr(settings, 'VECTOR_STORE_FORMAT', 'faiss')
+        self.query_embedding_timeout = getattr(settings, 'QUERY_EMBEDDING_TIMEOUT', 5.0)
+        embeddings, embedding_model = build_embeddings(api_key)
+        self.embeddings = CachedEmbeddings(
+            build_embedding_client(embeddings),
+            model_name=embedding_model,
+            max_entries=getattr(settings, 'QUERY_EMBEDDING_CACHE_SIZE', 1024),
+            db_path=getattr(settings, 'EMBEDDING_CACHE_DB', None),
+            persist_queries=getattr(settings, 'QUERY_EMBEDDING_CACHE_PERSIST', False)
         )
         self.vector_store_dir = Path(settings.MEDIA_ROOT) / 'vector_stores'
         self.metadata_dir = Path(settings.MEDIA_ROOT) / 'metadata'
         self.vector_store_dir.mkdir(parents=True, exist_ok=True)
         self.metadata_dir.mkdir(parents=True, exist_ok=True)
+        self.store_cache = vector_store_cache
+        self.routing_index = RoutingIndex(Path(settings.MEDIA_ROOT) / 'routing')
+        self.response_cache = response_cache
+        if self.response_cache.embeddings is None:
+            # Questions are embedded for the semantic tier through the same cache.
+            self.response_cache.embeddings = self.embeddings
 
     def get_store_paths(self, doc_id: str) -> Tuple[Path, Path]:
         """
@@ -74,192 +361,955 @@ class RAGProcessor:
         metadata_file = self.metadata_dir / f'meta_{doc_id}.json'
         return vector_store, metadata_file
 
-    def process_document(self, file_path: str, doc_id: str) -> str:
+    def load_vector_store(self, vector_store_path: str) -> Union[FAISS, MmapVectorStore]:
         """
-        Process a PDF document, create embeddings, and store them in a vector store.
+        Load a vector store, reusing the process-wide cache when possible.
+
+        Args:
+            vector_store_path (str): Path to the vector store.
+
+        Returns:
+            Union[FAISS, MmapVectorStore]: The loaded, read-only vector store.
+        """
+        with span('store_load'):
+            return self.store_cache.get(
+                vector_store_path,
+                lambda path: read_store(path, self.embeddings)
+            )
+
+    def get_session_store_path(self, session_id: str) -> Path:
+        """
+        Get the path of the vector store shared by all documents of a session.
+
+        Args:
+            session_id (str): Chat session identifier.
+
+        Returns:
+            Path: Path for the session vector store.
+        """
+        return self.vector_store_dir / f'session_{session_id}'
+
+    def get_store_lock_path(self, store_path: Path) -> Path:
+        """
+        Get the lock file serialising writers of a store across processes.
+
+        Readers do not lock; they use cached copies of the last saved store.
+
+        Args:
+            store_path (Path): Path to the vector store.
+
+        Returns:
+            Path: Lock file kept outside the store, which may be deleted.
+        """
+        return self.vector_store_dir / 'locks' / f'{Path(store_path).name}.lock'
+
+    def read_metadata(self, doc_id: str) -> Optional[DocumentMetadata]:
+        """
+        Read the stored metadata of a processed document.
 
         Args:
-            file_path (str): Path to the PDF file.
             doc_id (str): Unique document identifier.
 
         Returns:
-            str: Path to the stored vector store.
+            Optional[DocumentMetadata]: The metadata, or None if it does not exist.
+        """
+        _, metadata_path = self.get_store_paths(doc_id)
+        if not metadata_path.exists():
+            return None
+        with open(metadata_path, encoding="utf-8") as f:
+            return DocumentMetadata(**json.load(f))
 
-        Raises:
-            ValueError: If any error occurs during document processing.
+    @contextmanager
+    def open_session_index(self, session_id: str) -> Iterator['SessionIndexWriter']:
         """
-        try:
-            loader = PyPDFLoader(file_path)
-            documents = loader.load()
+        Open a session vector store for writing.
+
+        Writers of the same session are serialised, across processes too, by a
+        lock held from loading the store to saving it. Changes are saved once when
+        the block exits normally and discarded if it raises.
+
+        Args:
+            session_id (str): Chat session identifier.
+
+        Yields:
+            SessionIndexWriter: Writer appending to or removing from the store.
+        """
+        store_path = self.get_session_store_path(session_id)
+        with file_lock(self.get_store_lock_path(store_path)):
+            vector_store = None
+            if store_exists(store_path):
+                vector_store = read_store(str(store_path), self.embeddings)
+                if isinstance(vector_store, MmapVectorStore):
+                    vector_store = vector_store.to_faiss()
+            writer = SessionIndexWriter(
+                self.embeddings, store_path, vector_store, self.store_format
+            )
+            try:
+                yield writer
+                writer.save()
+            finally:
+                writer.close()
+            self.store_cache.invalidate(str(store_path))
+
+    def get_hash_pointer_path(self, file_sha256: str) -> Path:
+        """
+        Get the path of the file recording which document holds a file hash.
+
+        Args:
+            file_sha256 (str): SHA-256 of the uploaded file.
+
+        Returns:
+            Path: Path of the pointer file.
+        """
+        return self.metadata_dir / 'hashes' / f'{file_sha256}.txt'
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        """
+        Compute the SHA-256 of a file without reading it into memory at once.
+
+        Args:
+            file_path (str): Path to the file.
+
+        Returns:
+            str: Hex digest of the file contents.
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def find_indexed_copy(self, file_sha256: str) -> Optional[DocumentMetadata]:
+        """
+        Find an already indexed document with identical file contents.
+
+        Args:
+            file_sha256 (str): SHA-256 of the uploaded file.
+
+        Returns:
+            Optional[DocumentMetadata]: Metadata of the indexed copy, or None if
+            there is no usable copy.
+        """
+        pointer_path = self.get_hash_pointer_path(file_sha256)
+        if not pointer_path.exists():
+            return None
+        metadata = self.read_metadata(pointer_path.read_text(encoding='utf-8').strip())
+        if not metadata or not metadata.session_id or metadata.file_sha256 != file_sha256:
+            return None
+        store_path = self.get_session_store_path(metadata.session_id)
+        if not store_exists(store_path):
+            return None
+
+        vector_store = self.load_vector_store(str(store_path))
+        stored_ids = set(vector_store.index_to_docstore_id.values())
+        if any(chunk_id not in stored_ids for chunk_id in metadata.chunk_ids):
+            return None
+        return metadata
+
+    def iter_indexed_copy(
+        self,
+        metadata: DocumentMetadata,
+        batch_size: int
+    ) -> Iterator[Tuple[List[LangchainDocument], List[List[float]]]]:
+        """
+        Read the chunks and vectors of an indexed document in batches.
+
+        Args:
+            metadata (DocumentMetadata): Metadata of the indexed document.
+            batch_size (int): Number of chunks per batch.
+
+        Yields:
+            Tuple[List[LangchainDocument], List[List[float]]]: Chunks and their vectors.
+        """
+        store_path = self.get_session_store_path(metadata.session_id)
+        vector_store = self.load_vector_store(str(store_path))
+        positions = {chunk_id: position
+                     for position, chunk_id in vector_store.index_to_docstore_id.items()}
+        for start in range(0, len(metadata.chunk_ids), batch_size):
+            chunk_ids = metadata.chunk_ids[start:start + batch_size]
+            chunks = []
+            for chunk_id in chunk_ids:
+                stored = vector_store.docstore.search(chunk_id)
+                chunks.append(LangchainDocument(
+                    page_content=stored.page_content,
+                    metadata=dict(stored.metadata)
+                ))
+            vectors = [vector_store.index.reconstruct(positions[chunk_id]).tolist()
+                       for chunk_id in chunk_ids]
+            yield chunks, vectors
+
+    @staticmethod
+    def iter_pdf_chunks(
+        file_path: str,
+        chunk_size: int,
+        chunk_overlap: int,
+        batch_size: int
+    ) -> Iterator[List[LangchainDocument]]:
+        """
+        Lazily read a PDF page by page and yield its chunks in fixed-size batches.
+
+        PDFs of at least ``PDF_PARALLEL_MIN_PAGES`` pages are extracted and split
+        in ranges by ``PDF_EXTRACTION_WORKERS`` processes, see
+        ``chatbot.utils.pdf_extraction``; the chunks come out in the same order,
+        with the metadata the loader gave the first page.
+
+        Args:
+            file_path (str): Path to the PDF file.
+            chunk_size (int): Maximum characters per chunk.
+            chunk_overlap (int): Characters shared by consecutive chunks.
+            batch_size (int): Number of chunks per batch.
 
-            chunk_size = 1000
-            chunk_overlap = 200
+        Yields:
+            List[LangchainDocument]: The next batch of chunks, in page order.
+        """
+        workers = getattr(settings, 'PDF_EXTRACTION_WORKERS', os.cpu_count() or 1)
+        pages = PyPDFLoader(file_path).lazy_load()
+        first_page = next(pages, None)
+        if first_page is None:
+            return
+        num_pages = first_page.metadata.get('total_pages', 0)
+        if workers > 1 and num_pages >= getattr(settings, 'PDF_PARALLEL_MIN_PAGES', 32):
+            pages.close()
+            document_metadata = {key: value for key, value in first_page.metadata.items()
+                                 if key not in ('page', 'page_label')}
+            page_chunks = iter_parallel_chunks(
+                file_path, num_pages, chunk_size, chunk_overlap, workers,
+                getattr(settings, 'PDF_PAGES_PER_TASK', 8), document_metadata
+            )
+        else:
             text_splitter = RecursiveCharacterTextSplitter(
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap,
                 length_function=len,
             )
-            chunks = text_splitter.split_documents(documents)
+            page_chunks = (text_splitter.split_documents([page])
+                           for page in itertools.chain([first_page], pages))
+        batch = []
+        for chunks in page_chunks:
+            batch.extend(chunks)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        if batch:
+            yield batch
+
+    def remove_document(self, doc_id: str, session_id: str, user_id=None) -> None:
+        """
+        Remove a document's chunks from its session vector store.
+
+        The session store is deleted once its last document is removed.
+
+        Args:
+            doc_id (str): Unique document identifier.
+            session_id (str): Chat session the document belongs to.
+            user_id: Owner of the document, whose routing index drops it.
+        """
+        _, metadata_path = self.get_store_paths(doc_id)
+        metadata = self.read_metadata(doc_id)
+
+        if user_id is not None:
+            self.routing_index.remove(user_id, doc_id)
+
+        if metadata and metadata.chunk_ids:
+            with self.open_session_index(session_id) as writer:
+                writer.remove(metadata.chunk_ids)
+
+        if metadata and metadata.file_sha256:
+            pointer_path = self.get_hash_pointer_path(metadata.file_sha256)
+            if (pointer_path.exists()
+                    and pointer_path.read_text(encoding='utf-8').strip() == doc_id):
+                pointer_path.unlink()
+
+        if metadata_path.exists():
+            metadata_path.unlink()
+
+    def process_document(
+        self,
+        file_path: str,
+        doc_id: str,
+        session_id: str,
+        on_stage: Optional[Callable[[str], None]] = None,
+        user_id=None
+    ) -> str:
+        """
+        Process a PDF document, create embeddings, and merge them into the
+        session vector store.
+
+        Pages are read lazily and chunks are embedded and appended to the index
+        in batches of ``INGESTION_BATCH_SIZE``, so memory use is bounded by the
+        batch size rather than the document size. An upload identical to an
+        already indexed file reuses that file's chunks and vectors without
+        parsing or embedding anything. When the owner is given, the document's
+        centroids are added to their routing index.
+
+        Args:
+            file_path (str): Path to the PDF file.
+            doc_id (str): Unique document identifier.
+            session_id (str): Chat session the document belongs to.
+            on_stage (Optional[Callable[[str], None]]): Called with the name of
+                the current pipeline stage: 'parsing' when processing starts,
+                then 'embedding' before every batch, as a heartbeat.
+            user_id: Owner of the document, or None to leave it unrouted.
+
+        Returns:
+            str: Path to the session vector store.
 
-            vector_store = FAISS.from_documents(chunks, self.embeddings)
-            vector_store_path, metadata_path = self.get_store_paths(doc_id)
-            vector_store.save_local(str(vector_store_path))
+        Raises:
+            ValueError: If any error occurs during document processing, including
+                a PDF without extractable text (e.g. a scan).
+        """
+        on_stage = on_stage or (lambda stage: None)
+        on_stage('parsing')
+        try:
+            chunk_size = self.chunk_size
+            chunk_overlap = self.chunk_overlap
+            batch_size = getattr(settings, 'INGESTION_BATCH_SIZE', 400)
+            with span('hash'):
+                file_sha256 = self.hash_file(file_path)
+            indexed_copy = self.find_indexed_copy(file_sha256)
+
+            if indexed_copy:
+                chunk_size = indexed_copy.chunk_size
+                chunk_overlap = indexed_copy.chunk_overlap
+                batches = self.iter_indexed_copy(indexed_copy, batch_size)
+            else:
+                batches = (
+                    (chunks, None)
+                    for chunks in timed_iter('parse', self.iter_pdf_chunks(
+                        file_path, chunk_size, chunk_overlap, batch_size
+                    ))
+                )
+
+            chunk_ids = []
+            with self.open_session_index(session_id) as writer:
+                for chunks, vectors in batches:
+                    on_stage('embedding')
+                    for chunk in chunks:
+                        chunk.metadata['source'] = file_path
+                    chunk_ids.extend(writer.add(chunks, doc_id, vectors))
+                if not chunk_ids:
+                    raise ValueError("No text could be extracted from the document")
+                if user_id is not None:
+                    with span('route'):
+                        centroids, radii = document_centroids(
+                            writer.vector_store,
+                            chunk_ids,
+                            getattr(settings, 'ROUTING_CENTROIDS', 4)
+                        )
+            if user_id is not None:
+                self.routing_index.add(
+                    user_id, doc_id, str(writer.store_path), centroids, radii
+                )
+            _, metadata_path = self.get_store_paths(doc_id)
 
             metadata = DocumentMetadata(
                 doc_id=doc_id,
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap,
-                num_chunks=len(chunks),
-                embedding_model="models/embedding-001"
+                num_chunks=len(chunk_ids),
+                embedding_model=self.embeddings.model_name,
+                session_id=session_id,
+                chunk_ids=chunk_ids,
+                file_sha256=file_sha256,
+                index_type=writer.index_type
             )
             with open(metadata_path, 'w', encoding="utf-8") as f:
                 json.dump(asdict(metadata), f)
 
-            return str(vector_store_path)
+            pointer_path = self.get_hash_pointer_path(file_sha256)
+            if not indexed_copy:
+                pointer_path.parent.mkdir(parents=True, exist_ok=True)
+                pointer_path.write_text(doc_id, encoding='utf-8')
+
+            return str(writer.store_path)
 
         except Exception as e:
             raise ValueError(f"Error processing document: {str(e)}") from e
 
-    def get_retrieval_chain(self, vector_store_path: str) -> ConversationalRetrievalChain:
+    def get_llm(self) -> ChatGoogleGenerativeAI:
+        """
+        Get the shared chat model used to answer document questions.
+
+        Its own retries are disabled; quota errors are retried by ``acall_paced``.
+
+        Returns:
+            ChatGoogleGenerativeAI: Configured Gemini chat model.
+        """
+        return get_chat_model(
+            self.api_key,
+            model=self.llm_model,
+            temperature=0.7,
+            top_k=3,
+            top_p=0.8,
+            max_output_tokens=1024,
+            max_retries=1
+        )
+
+    @staticmethod
+    def get_prompt() -> PromptTemplate:
+        """
+        Get the prompt template used to answer document questions.
+
+        Returns:
+            PromptTemplate: Prompt taking context, chat history and question.
+        """
+        return ANSWER_PROMPT
+
+    @staticmethod
+    def document_codes(vector_store: FAISS, store_path: str) -> Tuple[np.ndarray, List[str]]:
         """
-        Create a conversational retrieval chain.
+        Map every position of a store's index to the document it belongs to.
+
+        Built once per loaded store object and reused until the store cache
+        replaces the object.
 
         Args:
-            vector_store_path (str): Path to the vector store.
+            vector_store (FAISS): A loaded, read-only vector store.
+            store_path (str): Path of the store, naming the document of legacy
+                single-document stores whose chunks carry no ``doc_id``.
 
         Returns:
-            ConversationalRetrievalChain: Configured conversational retrieval chain.
+            Tuple[np.ndarray, List[str]]: The document index of each position and
+            the document ids those indices refer to.
+        """
+        with _document_codes_lock:
+            codes = _document_codes.get(vector_store)
+        if codes is not None:
+            return codes
 
-        Raises:
-            ValueError: If the retrieval chain cannot be created.
+        fallback_id = Path(store_path).name.removeprefix('store_')
+        if isinstance(vector_store, MmapVectorStore):
+            position_doc_ids = vector_store.position_doc_ids()
+        else:
+            position_doc_ids = [None] * vector_store.index.ntotal
+            for position, docstore_id in vector_store.index_to_docstore_id.items():
+                chunk = vector_store.docstore.search(docstore_id)
+                position_doc_ids[position] = chunk.metadata.get('doc_id')
+        doc_ids: Dict[str, int] = {}
+        positions = np.empty(len(position_doc_ids), dtype=np.int64)
+        for position, doc_id in enumerate(position_doc_ids):
+            positions[position] = doc_ids.setdefault(doc_id or fallback_id, len(doc_ids))
+        codes = (positions, list(doc_ids))
+        with _document_codes_lock:
+            _document_codes[vector_store] = codes
+        return codes
+
+    def relevance_gate(
+        self,
+        store_paths: List[str],
+        query_embedding: List[float]
+    ) -> Tuple[List[RelevantDocument], List[Tuple[LangchainDocument, float]]]:
         """
-        try:
-            vector_store = FAISS.load_local(
-                vector_store_path,
-                self.embeddings,
-                allow_dangerous_deserialization=True
-            )
+        Score every chunk of the given stores against the query in one pass.
 
-            llm = ChatGoogleGenerativeAI(
-                model="gemini-1.5-flash-002",
-                google_api_key=self.api_key,
-                temperature=0.7,
-                top_k=3,
-                top_p=0.8,
-                max_output_tokens=1024
-            )
+        Each store answers a single FAISS range search for the chunks within
+        ``document_relevance_threshold`` of the query, so the cost does not grow
+        with the number of documents. The hits are grouped by document with a
+        vectorized minimum, and the closest chunks overall are kept for the prompt.
 
-            prompt_template = """Answer the question based on the provided context.
-            If the answer cannot be found in the context, acknowledge that and provide a general response.
+        Args:
+            store_paths (List[str]): Paths of existing vector stores.
+            query_embedding (List[float]): The embedded question.
 
-            Context: {context}
-            Chat History: {chat_history}
-            Current Question: {question}
-            """
-            prompt = PromptTemplate(
-                template=prompt_template,
-                input_variables=["context", "chat_history", "question"]
-            )
-            chain = ConversationalRetrievalChain.from_llm(
-                llm=llm,
-                retriever=vector_store.as_retriever(
-                    search_kwargs={
-                        "k": 2,
-                        "fetch_k": 5,
-                        "search_type": "mmr",
-                        "lambda_mult": 0.7 
-                    }
-                ),
-                return_source_documents=True,
-                combine_docs_chain_kwargs={"prompt": prompt},
-                verbose=True
+        Returns:
+            Tuple[List[RelevantDocument], List[Tuple[LangchainDocument, float]]]:
+            The relevant documents ranked by their best chunk, and up to
+            ``retrieval_top_k`` chunks with their scores, best first.
+        """
+        query = np.asarray([query_embedding], dtype=np.float32)
+        documents: Dict[str, RelevantDocument] = {}
+        hits = []
+        for store_path in store_paths:
+            vector_store = self.load_vector_store(store_path)
+            with span('search'):
+                _, distances, positions = vector_store.index.range_search(
+                    query, self.document_relevance_threshold
+                )
+                if not len(positions):
+                    continue
+                codes, doc_ids = self.document_codes(vector_store, store_path)
+                best = np.full(len(doc_ids), np.inf, dtype=np.float32)
+                np.minimum.at(best, codes[positions], distances)
+                for code in np.flatnonzero(np.isfinite(best)):
+                    doc_id, score = doc_ids[code], float(best[code])
+                    if doc_id not in documents or score < documents[doc_id].score:
+                        documents[doc_id] = RelevantDocument(doc_id, score, store_path)
+
+                top = np.argsort(distances, kind='stable')[:self.retrieval_top_k]
+                hits.extend(
+                    (float(distances[index]), vector_store, int(positions[index]))
+                    for index in top
+                )
+
+        hits.sort(key=lambda hit: hit[0])
+        chunks = [
+            (vector_store.docstore.search(vector_store.index_to_docstore_id[position]), score)
+            for score, vector_store, position in hits[:self.retrieval_top_k]
+        ]
+        return sorted(documents.values(), key=lambda document: document.score), chunks
+
+    def search_stores(
+        self,
+        store_paths: List[str],
+        query_embedding: List[float]
+    ) -> List[Tuple[LangchainDocument, float]]:
+        """
+        Search stores with an embedded query and merge the best chunks globally.
+
+        Scores are FAISS L2 distances, so lower is more relevant; chunks above
+        the relevance threshold are discarded.
+
+        Args:
+            store_paths (List[str]): Paths of existing vector stores.
+            query_embedding (List[float]): The embedded question.
+
+        Returns:
+            List[Tuple[LangchainDocument, float]]: Up to ``retrieval_top_k`` chunks
+            with their scores, best first.
+        """
+        return self.relevance_gate(store_paths, query_embedding)[1]
+
+    def rank_documents(
+        self,
+        vector_store_paths: List[str],
+        query: str
+    ) -> List[RelevantDocument]:
+        """
+        Rank the documents relevant to a question, embedding it only once.
+
+        Args:
+            vector_store_paths (List[str]): Paths to the vector stores to search.
+            query (str): The user question.
+
+        Returns:
+            List[RelevantDocument]: Documents within the relevance threshold, best first.
+        """
+        store_paths = self.existing_store_paths(vector_store_paths)
+        if not store_paths:
+            return []
+        with span('embed_query'):
+            query_embedding = self.embeddings.embed_query(query)
+        return self.relevance_gate(store_paths, query_embedding)[0]
+
+    @staticmethod
+    def existing_store_paths(vector_store_paths: List[str]) -> List[str]:
+        """Deduplicate store paths and drop those missing on disk."""
+        return [path for path in dict.fromkeys(vector_store_paths) if os.path.exists(path)]
+
+    def route_stores(
+        self,
+        store_paths: List[str],
+        query_embedding: List[float],
+        user_id=None,
+        doc_ids: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Drop the stores the owner's routing index proves irrelevant, unopened.
+
+        Args:
+            store_paths (List[str]): Paths of existing vector stores.
+            query_embedding (List[float]): The embedded question.
+            user_id: Owner of the documents; routing is skipped when None.
+            doc_ids (Optional[List[str]]): Documents held by the stores.
+
+        Returns:
+            List[str]: The stores to search.
+        """
+        if user_id is None or not doc_ids:
+            return store_paths
+        with span('route'):
+            return self.routing_index.route(
+                user_id, doc_ids, store_paths, query_embedding,
+                self.document_relevance_threshold
             )
-            return chain
 
-        except Exception as e:
-            raise Exception(f"Error creating retrieval chain: {str(e)}") from e
+    def lexical_search(
+        self,
+        store_paths: List[str],
+        query: str
+    ) -> List[Tuple[LangchainDocument, float]]:
+        """
+        Search the stores' lexical indexes without embedding the question.
 
-    @retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
-    retry=lambda retry_state: isinstance(retry_state.outcome.exception(),
-                                         exceptions.ResourceExhausted)
-    )
-    def query_documents(
+        Args:
+            store_paths (List[str]): Paths of existing vector stores.
+            query (str): The user question.
+
+        Returns:
+            List[Tuple[LangchainDocument, float]]: Up to ``retrieval_top_k`` chunks
+            with their BM25 scores, best first; higher is more relevant.
+        """
+        with span('lexical_search'):
+            results = []
+            for store_path in store_paths:
+                results.extend(search_lexical(
+                    Path(store_path) / LEXICAL_DB, query,
+                    self.retrieval_top_k, self.lexical_min_match
+                ))
+            results.sort(key=lambda result: -result[1])
+            return results[:self.retrieval_top_k]
+
+    def fuse_results(
+        self,
+        vector_results: List[Tuple[LangchainDocument, float]],
+        lexical_results: List[Tuple[LangchainDocument, float]]
+    ) -> List[Tuple[LangchainDocument, float]]:
+        """
+        Merge vector and lexical results by reciprocal rank fusion.
+
+        When only one side found chunks its results and scores are returned as is.
+
+        Args:
+            vector_results (List[Tuple[LangchainDocument, float]]): Chunks by L2 distance.
+            lexical_results (List[Tuple[LangchainDocument, float]]): Chunks by BM25 score.
+
+        Returns:
+            List[Tuple[LangchainDocument, float]]: Up to ``retrieval_top_k`` chunks
+            with their fused scores, best first; higher is more relevant.
+        """
+        if not lexical_results or not vector_results:
+            return vector_results or lexical_results
+        chunks: Dict[str, LangchainDocument] = {}
+        rankings = []
+        for results in (vector_results, lexical_results):
+            ranking = []
+            for chunk, _ in results:
+                key = chunk.id or chunk.page_content
+                chunks.setdefault(key, chunk)
+                ranking.append(key)
+            rankings.append(ranking)
+        fused = reciprocal_rank_fusion(rankings, self.fusion_k)
+        best = sorted(fused, key=fused.get, reverse=True)[:self.retrieval_top_k]
+        return [(chunks[key], fused[key]) for key in best]
+
+    def search_embedded(
+        self,
+        store_paths: List[str],
+        query: str,
+        query_embedding: List[float],
+        user_id=None,
+        doc_ids: Optional[List[str]] = None,
+        lexical_results: Optional[List[Tuple[LangchainDocument, float]]] = None
+    ) -> List[Tuple[LangchainDocument, float]]:
+        """
+        Search the routed stores with an embedded question and fuse the BM25 hits.
+
+        Args:
+            store_paths (List[str]): Paths of existing vector stores.
+            query (str): The user question.
+            query_embedding (List[float]): The embedded question.
+            user_id: Owner of the documents, enabling routing.
+            doc_ids (Optional[List[str]]): Documents held by the stores.
+            lexical_results (Optional[List[Tuple[LangchainDocument, float]]]): BM25
+                hits already found for the question; searched when None.
+
+        Returns:
+            List[Tuple[LangchainDocument, float]]: Up to ``retrieval_top_k`` chunks
+            with their scores, best first.
+        """
+        routed_paths = self.route_stores(store_paths, query_embedding, user_id, doc_ids)
+        if lexical_results is None:
+            lexical_results = self.lexical_search(store_paths, query)
+        return self.fuse_results(
+            self.search_stores(routed_paths, query_embedding), lexical_results
+        )
+
+    async def aretrieve_chunks(
         self,
         vector_store_paths: List[str],
         query: str,
-        chat_history: Optional[List[Dict]] = None
-    ) -> Optional[str]:
-        """Query multiple documents using the retrieval chain after checking relevance threshold."""
-        try:
-            if not vector_store_paths:
-                return None
+        user_id=None,
+        doc_ids: Optional[List[str]] = None
+    ) -> List[Tuple[LangchainDocument, float]]:
+        """
+        Search every store once and merge the most relevant chunks globally.
 
-            formatted_history = [
-                (msg["message"], msg["response"])
-                for msg in chat_history
-                if msg.get("message") and msg.get("response")
-            ]
+        The query is embedded a single time and the same vector is used against
+        every store the routing index does not rule out; the vector hits are
+        fused with the stores' BM25 hits. Keyword-like questions are answered
+        from the lexical indexes alone when they match, as are questions whose
+        embedding fails or exceeds ``QUERY_EMBEDDING_TIMEOUT``. Store loads and
+        searches run in a worker thread, keeping the event loop free.
 
-            all_responses = []
-            document_relevance_threshold = 0.7
+        Args:
+            vector_store_paths (List[str]): Paths to the vector stores to search.
+            query (str): The user question.
+            user_id: Owner of the documents, enabling routing.
+            doc_ids (Optional[List[str]]): Documents held by the stores.
 
-            for store_path in vector_store_paths:
-                if not os.path.exists(store_path):
-                    continue
+        Returns:
+            List[Tuple[LangchainDocument, float]]: Up to ``retrieval_top_k`` chunks
+            with their scores, best first.
+        """
+        store_paths = await asyncio.to_thread(self.existing_store_paths, vector_store_paths)
+        if not store_paths:
+            return []
+        lexical_results = None
+        if is_keyword_query(query):
+            lexical_results = await asyncio.to_thread(self.lexical_search, store_paths, query)
+            if lexical_results:
+                return lexical_results
 
-                vector_store = FAISS.load_local(
-                    store_path,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
+        embedding = asyncio.ensure_future(self.embeddings.aembed_query(query))
+        # Retrieve the outcome even when the lexical results are used instead.
+        embedding.add_done_callback(lambda task: task.cancelled() or task.exception())
+        try:
+            with span('embed_query'):
+                query_embedding = await asyncio.wait_for(
+                    asyncio.shield(embedding), self.query_embedding_timeout
+                )
+        except Exception as e:
+            if lexical_results is None:
+                lexical_results = await asyncio.to_thread(
+                    self.lexical_search, store_paths, query
                 )
+            if lexical_results:
+                print(f"Query embedding unavailable ({e!r}); using the lexical index.")
+                return lexical_results
+            with span('embed_query'):
+                query_embedding = await embedding
 
-                similarity_results = vector_store.similarity_search_with_score(query)
-                # print(f'similarity result is:{similarity_results}')
+        return await asyncio.to_thread(
+            self.search_embedded,
+            store_paths, query, query_embedding, user_id, doc_ids, lexical_results
+        )
 
-                if similarity_results and similarity_results[0][1] > document_relevance_threshold:
-                    continue
+    def document_scope(self, vector_store_paths: List[str]) -> str:
+        """
+        Identify the document set behind a list of stores for the response cache.
+
+        Adding or removing a document rewrites its store, which changes the scope,
+        so cached answers are only reused for the exact same documents.
+
+        Args:
+            vector_store_paths (List[str]): Paths to the searched vector stores.
+
+        Returns:
+            str: The resolved store paths with their latest modification times.
+        """
+        parts = []
+        for store_path in sorted(self.existing_store_paths(vector_store_paths)):
+            path = Path(store_path).resolve()
+            try:
+                mtime = max((file_path.stat().st_mtime for file_path in path.iterdir()),
+                            default=0)
+            except FileNotFoundError:
+                # Reclaimed or rewritten meanwhile; the scope simply misses the cache.
+                mtime = 'missing'
+            parts.append(f"{path}@{mtime}")
+        return "|".join(parts)
+
+    def answer_cache_args(
+        self,
+        vector_store_paths: List[str],
+        query: str,
+        formatted_history: List[Tuple[str, str]],
+        summary: Optional[str] = None
+    ) -> Dict[str, Optional[str]]:
+        """
+        Build the response cache arguments addressing a document answer.
+
+        The question is only offered for semantic matching when there is no
+        conversation context the answer could depend on.
+
+        Args:
+            vector_store_paths (List[str]): Paths to the searched vector stores.
+            query (str): The user question.
+            formatted_history (List[Tuple[str, str]]): Recent (question, answer) pairs.
+            summary (Optional[str]): Summary of the turns before the recent ones.
+
+        Returns:
+            Dict[str, Optional[str]]: The model, scope and standalone query.
+        """
+        standalone = not formatted_history and not summary
+        return {
+            'model': self.llm_model,
+            'scope': self.document_scope(vector_store_paths),
+            'query': query if standalone else None,
+        }
+
+    def build_answer_prompt(
+        self,
+        query: str,
+        chunks: List[LangchainDocument],
+        formatted_history: List[Tuple[str, str]],
+        summary: Optional[str] = None
+    ) -> str:
+        """
+        Build the prompt answering a question from retrieved chunks.
+
+        Args:
+            query (str): The user question.
+            chunks (List[LangchainDocument]): Retrieved context chunks.
+            formatted_history (List[Tuple[str, str]]): Recent (question, answer) pairs.
+            summary (Optional[str]): Summary of the turns before the recent ones.
+
+        Returns:
+            str: The formatted prompt.
+        """
+        chat_history = "\n".join(
+            f"Human: {question}\nAssistant: {answer}"
+            for question, answer in formatted_history
+        )
+        if summary:
+            chat_history = f"Summary of the earlier conversation: {summary}\n{chat_history}"
+        return self.get_prompt().format(
+            context="\n\n".join(chunk.page_content for chunk in chunks),
+            chat_history=chat_history,
+            question=query
+        )
+
+    @staticmethod
+    def format_history(chat_history: Optional[List[Dict]]) -> List[Tuple[str, str]]:
+        """Pair up the answered messages of a chat history as (question, answer)."""
+        return [
+            (msg["message"], msg["response"])
+            for msg in chat_history or []
+            if msg.get("message") and msg.get("response")
+        ]
+
+    async def aanswer_from_chunks(
+        self,
+        query: str,
+        chunks: List[LangchainDocument],
+        formatted_history: List[Tuple[str, str]],
+        summary: Optional[str] = None,
+        cache_args: Optional[Dict[str, Optional[str]]] = None
+    ) -> str:
+        """
+        Answer a question from retrieved chunks with a single LLM call.
+
+        Args:
+            query (str): The user question.
+            chunks (List[LangchainDocument]): Retrieved context chunks.
+            formatted_history (List[Tuple[str, str]]): Recent (question, answer) pairs.
+            summary (Optional[str]): Summary of the turns before the recent ones.
+            cache_args (Optional[Dict[str, Optional[str]]]): Response cache
+                arguments from ``answer_cache_args``; the cache is skipped if None.
+
+        Returns:
+            str: The generated answer.
+        """
+        prompt = self.build_answer_prompt(query, chunks, formatted_history, summary)
+        if cache_args is not None:
+            cached = await self.response_cache.alookup(prompt, **cache_args)
+            if cached is not None:
+                return cached
+        with span('llm'):
+            answer = (await acall_paced(self.get_llm().ainvoke, prompt, priority=True)).content
+        if cache_args is not None:
+            await self.response_cache.astore(prompt, response=answer, **cache_args)
+        return answer
+
+    async def astream_query(
+        self,
+        vector_store_paths: List[str],
+        query: str,
+        chat_history: Optional[List[Dict]] = None,
+        summary: Optional[str] = None,
+        user_id=None,
+        doc_ids: Optional[List[str]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the answer to a document question as tokens are generated.
+
+        Falls back to streaming a plain Gemini answer when no chunk is relevant
+        or retrieval fails.
+
+        Args:
+            vector_store_paths (List[str]): Paths to the vector stores to search.
+            query (str): The user question.
+            chat_history (Optional[List[Dict]]): Recent messages of the session.
+            summary (Optional[str]): Summary of the turns before the recent ones.
+            user_id: Owner of the documents, enabling routing.
+            doc_ids (Optional[List[str]]): Documents held by the stores.
+
+        Yields:
+            str: Answer text as it is generated.
+        """
+        formatted_history = self.format_history(chat_history)
+        try:
+            results = await self.aretrieve_chunks(vector_store_paths, query, user_id, doc_ids)
+        except Exception as e:
+            print(f"Query error: {e}")
+            results = []
+
+        if not results:
+            async for token in aask_gemini_stream(query, chat_history, summary, user_id):
+                yield token
+            return
+
+        prompt = self.build_answer_prompt(
+            query,
+            [chunk for chunk, _ in results],
+            formatted_history,
+            summary
+        )
+        cache_args = await asyncio.to_thread(
+            self.answer_cache_args, vector_store_paths, query, formatted_history, summary
+        )
+        cached = await self.response_cache.alookup(prompt, **cache_args)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        with span('llm'):
+            await gemini_rate_limiter.aacquire(priority=True)
+            async for chunk in self.get_llm().astream(prompt):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+        await self.response_cache.astore(prompt, response="".join(parts), **cache_args)
 
-                chain=self.get_retrieval_chain(store_path)
-                result = chain({
-                    "question": query,
-                    "chat_history": formatted_history or []
-                })
-                if result.get("answer"):
-                    all_responses.append(result["answer"])
+    async def aquery_documents(
+        self,
+        vector_store_paths: List[str],
+        query: str,
+        chat_history: Optional[List[Dict]] = None,
+        summary: Optional[str] = None,
+        user_id=None,
+        doc_ids: Optional[List[str]] = None
+    ) -> Optional[str]:
+        """Query all documents at once, merging their chunks into a single LLM call."""
+        try:
+            if not vector_store_paths:
+                return None
 
-            if not all_responses:
-                all_responses.append(ask_gemini(query, formatted_history))
-            return " ".join(all_responses)
+            formatted_history = self.format_history(chat_history)
+
+            results = await self.aretrieve_chunks(vector_store_paths, query, user_id, doc_ids)
+            if not results:
+                with span('llm'):
+                    return await aask_gemini(query, chat_history, summary, user_id)
+
+            cache_args = await asyncio.to_thread(
+                self.answer_cache_args, vector_store_paths, query, formatted_history, summary
+            )
+            return await self.aanswer_from_chunks(
+                query,
+                [chunk for chunk, _ in results],
+                formatted_history,
+                summary,
+                cache_args
+            )
 
         except exceptions.ResourceExhausted:
-            print("Google API quota exceeded. Waiting before retry.")
-            time.sleep(30)
+            print("Google API quota exceeded.")
             raise
         except Exception as e:
             print(f"Query error: {e}")
             return None
 
-    def cleanup_vector_stores(self) -> None:
-        """Clean up vector stores, metadata, and associated PDFs immediately when called."""        
-        for store_path in self.vector_store_dir.glob('store_*'):
-            try:
-                if store_path.is_dir():
-                    shutil.rmtree(store_path)
-                    print(f"Deleted store: {store_path}")
-
-                meta_path = self.metadata_dir / f'meta_{store_path.name[6:]}.json'
-                if meta_path.exists():
-                    meta_path.unlink()
-                    print(f"Deleted metadata: {meta_path}")
-
-            except Exception as e:
-                print(f"Error cleaning up {store_path}: {e}")
+    def delete_store(self, vector_store_path: str) -> None:
+        """
+        Delete a vector store from disk and from the store cache.
 
-        documents_dir = Path("media/documents")
-        for pdf_path in documents_dir.glob("*.pdf"):
-            try:
-                pdf_path.unlink()
-            except Exception as e:
-                print(f"Error cleaning up PDF {pdf_path}: {e}")
+        Args:
+            vector_store_path (str): Path to the vector store.
+        """
+        store_path = Path(vector_store_path)
+        with file_lock(self.get_store_lock_path(store_path)):
+            self.store_cache.invalidate(str(store_path))
+            if store_path.exists():
+                shutil.rmtree(store_path)
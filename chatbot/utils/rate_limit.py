@@ -0,0 +1,187 @@
+"""
+Shared request pacing for the Gemini API.
+
+``GEMINI_API_RATE_LIMIT`` is the per-minute request quota of the API key.
+Embedding batches, query embeddings, answer generation and conversation
+summaries all acquire a token from the same bucket before sending a request, so
+together they never exceed the quota and trigger ``ResourceExhausted``.
+
+Requests a user is waiting on (questions and their answers) acquire with
+priority: while one of them waits for a token, background requests such as
+ingestion batches do not take the next one. ``call_paced`` and
+``acall_paced`` pace a request and are the only layer retrying its quota
+rejections.
+"""
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+from django.conf import settings
+from google.api_core import exceptions
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+
+def is_quota_error(error: BaseException) -> bool:
+    """
+    Check whether an error, or the error it wraps, is a quota rejection.
+
+    LangChain wraps API errors in its own exception types, so the cause chain
+    is inspected as well.
+
+    Args:
+        error (BaseException): The raised error.
+
+    Returns:
+        bool: True if the API rejected the request for exceeding the quota.
+    """
+    while error is not None:
+        if isinstance(error, exceptions.ResourceExhausted):
+            return True
+        error = error.__cause__
+    return False
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting requests per minute.
+
+    Callers acquiring with ``priority`` are served first: while any of them is
+    waiting, other callers are refused even when a token is available.
+
+    Attributes:
+        rate_per_minute (float): Tokens added per minute.
+        capacity (int): Maximum tokens that can accumulate, i.e. the burst size.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        capacity: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = max(1, capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self.capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self._priority_waiters = 0
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(
+            self.capacity,
+            self._tokens + elapsed * self.rate_per_minute / 60.0
+        )
+
+    def _try_take(self, priority: bool = False) -> float:
+        """Consume a token if one is available, else return the seconds to wait."""
+        with self._lock:
+            self._refill()
+            if not priority and self._priority_waiters:
+                # Yield to the waiting priority callers for a refill interval.
+                return 60.0 / self.rate_per_minute
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) * 60.0 / self.rate_per_minute
+
+    @contextmanager
+    def _waiting(self, priority: bool) -> Iterator[None]:
+        if not priority:
+            yield
+            return
+        with self._lock:
+            self._priority_waiters += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._priority_waiters -= 1
+
+    def acquire(self, priority: bool = False) -> None:
+        """Block until a token is available, then consume it."""
+        with self._waiting(priority):
+            while wait := self._try_take(priority):
+                self._sleep(wait)
+
+    async def aacquire(self, priority: bool = False) -> None:
+        """Wait without blocking the event loop until a token is available."""
+        with self._waiting(priority):
+            while wait := self._try_take(priority):
+                await asyncio.sleep(wait)
+
+
+gemini_rate_limiter = TokenBucket(
+    rate_per_minute=settings.GEMINI_API_RATE_LIMIT,
+    capacity=getattr(settings, 'EMBEDDING_CONCURRENCY', 1)
+)
+
+
+def _quota_retry_options(attempts: Optional[int]) -> dict:
+    return {
+        'stop': stop_after_attempt(attempts or settings.GEMINI_API_RETRY_ATTEMPTS),
+        'wait': wait_exponential(multiplier=1, min=4, max=10),
+        'retry': retry_if_exception(is_quota_error),
+        'reraise': True,
+    }
+
+
+def call_paced(
+    function: Callable[..., Any],
+    *args: Any,
+    priority: bool = False,
+    rate_limiter: TokenBucket = gemini_rate_limiter,
+    attempts: Optional[int] = None,
+    **kwargs: Any
+) -> Any:
+    """
+    Send an API request under the rate limit, retrying quota rejections.
+
+    Every attempt takes its own token. Attempts default to
+    ``GEMINI_API_RETRY_ATTEMPTS``, with exponential backoff between them.
+
+    Args:
+        function (Callable[..., Any]): Sends the request.
+        *args: Positional arguments of ``function``.
+        priority (bool): Whether a user is waiting on the request.
+        rate_limiter (TokenBucket): Bucket the request is paced by.
+        attempts (Optional[int]): Attempts before a quota error is raised.
+        **kwargs: Keyword arguments of ``function``.
+
+    Returns:
+        Any: What ``function`` returns.
+    """
+    for attempt in Retrying(**_quota_retry_options(attempts)):
+        with attempt:
+            rate_limiter.acquire(priority)
+            return function(*args, **kwargs)
+    return None
+
+
+async def acall_paced(
+    function: Callable[..., Awaitable[Any]],
+    *args: Any,
+    priority: bool = False,
+    rate_limiter: TokenBucket = gemini_rate_limiter,
+    attempts: Optional[int] = None,
+    **kwargs: Any
+) -> Any:
+    """Asynchronous variant of ``call_paced`` for coroutine functions."""
+    async for attempt in AsyncRetrying(**_quota_retry_options(attempts)):
+        with attempt:
+            await rate_limiter.aacquire(priority)
+            return await function(*args, **kwargs)
+    return None
@@ -0,0 +1,179 @@
+"""
+Background reclamation of deleted documents' files.
+
+Deleting a session only tombstones its documents by setting ``deleted_at``, so
+the request does no filesystem work. The reclaimer, scheduled on the ingestion
+worker pool, then removes exactly what each tombstoned document references:
+its chunks in the session store (the store itself once it is empty), its legacy
+per-document store, its metadata, routing entry and uploaded file. The row is
+deleted last, so a failed reclamation is retried by the next run. Documents
+still being ingested are left to the ingestion job, unless they have been in
+progress for longer than ``INGESTION_STALE_SECONDS`` and were evidently lost
+with a stopped worker.
+
+``sweep_orphans`` catches whatever is left behind, such as files of rows that
+were deleted outside the app. It lists the storage directories once and removes
+entries no ``Document`` row refers to, but only after a grace period so that
+uploads still being written are never mistaken for orphans. Routing entries
+are only written for documents that already have a row, so those of missing
+rows are pruned without a grace period, and emptied routing files removed.
+"""
+import shutil
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from chatbot.models import Document
+
+IN_PROGRESS = (Document.STATUS_QUEUED, Document.STATUS_PARSING, Document.STATUS_EMBEDDING)
+
+
+def stale_in_progress() -> Q:
+    """Match documents in progress without a status change for ``INGESTION_STALE_SECONDS``."""
+    cutoff = timezone.now() - timedelta(
+        seconds=getattr(settings, 'INGESTION_STALE_SECONDS', 60 * 60)
+    )
+    return Q(status__in=IN_PROGRESS, status_updated_at__lt=cutoff)
+
+
+def reclaim_document(doc: Document, rag_processor) -> None:
+    """
+    Remove the files of one tombstoned document, then its row.
+
+    Args:
+        doc (Document): The tombstoned document.
+        rag_processor (RAGProcessor): Processor owning the stores and metadata.
+    """
+    rag_processor.remove_document(str(doc.id), str(doc.session_id), user_id=doc.user_id)
+    if doc.embedding_store and Path(doc.embedding_store).name == f'store_{doc.id}':
+        rag_processor.delete_store(doc.embedding_store)
+    if doc.file:
+        doc.file.delete(save=False)
+    doc.delete()
+
+
+def reclaim_deleted_documents(rag_processor) -> int:
+    """
+    Reclaim every tombstoned document that is not being ingested.
+
+    Documents still in the ingestion pipeline are left for the ingestion job,
+    which reclaims them once it finishes; stale ones are reclaimed right away.
+
+    Args:
+        rag_processor (RAGProcessor): Processor owning the stores and metadata.
+
+    Returns:
+        int: Number of documents reclaimed.
+    """
+    reclaimed = 0
+    try:
+        deleted = Document.objects.filter(deleted_at__isnull=False).filter(
+            ~Q(status__in=IN_PROGRESS) | stale_in_progress()
+        )
+        for doc in list(deleted):
+            try:
+                reclaim_document(doc, rag_processor)
+                reclaimed += 1
+            except Exception as e:
+                print(f"Error reclaiming document {doc.id}: {e}")
+    finally:
+        close_old_connections()
+    return reclaimed
+
+
+def _is_stale(path: Path, cutoff: float) -> bool:
+    return path.stat().st_mtime < cutoff
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink()
+
+
+def sweep_orphans(rag_processor, grace: Optional[float] = None) -> Dict[str, int]:
+    """
+    Remove stores, metadata, routing entries and uploads no ``Document`` row refers to.
+
+    Tombstoned rows still count as references; their files are the
+    reclaimer's to remove.
+
+    Args:
+        rag_processor (RAGProcessor): Processor owning the stores and metadata.
+        grace (Optional[float]): Minimum age in seconds of a removed entry; defaults to
+            ``RECLAIM_GRACE_SECONDS``.
+
+    Returns:
+        Dict[str, int]: Number of removed stores, metadata files, routing entries
+        and uploads.
+    """
+    if grace is None:
+        grace = getattr(settings, 'RECLAIM_GRACE_SECONDS', 60 * 60)
+    cutoff = time.time() - grace
+    removed = {'stores': 0, 'metadata': 0, 'routing': 0, 'uploads': 0}
+    try:
+        doc_ids, session_ids, files = set(), set(), set()
+        for doc_id, session_id, file_name in Document.objects.values_list(
+            'id', 'session_id', 'file'
+        ).iterator():
+            doc_ids.add(str(doc_id))
+            session_ids.add(str(session_id))
+            if file_name:
+                files.add(Path(file_name).as_posix())
+    finally:
+        close_old_connections()
+
+    def sweep(paths, referenced, counter, remove=_remove):
+        for path in paths:
+            try:
+                if not referenced(path) and _is_stale(path, cutoff):
+                    remove(path)
+                    removed[counter] += 1
+                    print(f"Deleted orphan: {path}")
+            except Exception as e:
+                print(f"Error sweeping {path}: {e}")
+
+    def remove_store(path):
+        rag_processor.delete_store(str(path))
+
+    sweep(
+        rag_processor.vector_store_dir.glob('session_*'),
+        lambda path: path.name.removeprefix('session_') in session_ids,
+        'stores',
+        remove_store
+    )
+    sweep(
+        rag_processor.vector_store_dir.glob('store_*'),
+        lambda path: path.name.removeprefix('store_') in doc_ids,
+        'stores',
+        remove_store
+    )
+    sweep(
+        rag_processor.metadata_dir.glob('meta_*.json'),
+        lambda path: path.stem.removeprefix('meta_') in doc_ids,
+        'metadata'
+    )
+    sweep(
+        rag_processor.metadata_dir.glob('hashes/*.txt'),
+        lambda path: path.read_text(encoding='utf-8').strip() in doc_ids,
+        'metadata'
+    )
+    for user_id in rag_processor.routing_index.user_ids():
+        try:
+            removed['routing'] += rag_processor.routing_index.prune(user_id, doc_ids)
+        except Exception as e:
+            print(f"Error sweeping routing entries of user {user_id}: {e}")
+    media_root = Path(settings.MEDIA_ROOT)
+    sweep(
+        (path for path in (media_root / 'documents').glob('*') if path.is_file()),
+        lambda path: path.relative_to(media_root).as_posix() in files,
+        'uploads'
+    )
+    return removed
@@ -0,0 +1,280 @@
+"""
+Cache of generated Gemini answers.
+
+Many questions repeat almost verbatim ("what is this document about", greetings),
+and each one would otherwise be a full generation round-trip. Answers are cached
+in two tiers:
+
+- Exact: the SHA-256 of the model, scope and whitespace-normalized prompt.
+- Semantic (optional): when a question carries no conversation context, its
+  embedding is compared with those of earlier standalone questions and the
+  answer of the nearest one is reused above ``RESPONSE_CACHE_SIMILARITY``
+  cosine similarity.
+
+Every entry belongs to a scope. Plain chat answers are scoped to the user who
+asked, and document-grounded answers to the document set they were generated
+from, so a similar question never reuses another user's answer. Entries expire after
+``RESPONSE_CACHE_TTL`` seconds and the least recently used are evicted beyond
+``RESPONSE_CACHE_SIZE`` entries.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+
+from chatbot.utils.embedding_cache import normalize_text
+
+
+@dataclass
+class CachedResponse:
+    """A cached answer and what it may be reused for."""
+    response: str
+    model: str
+    scope: str
+    expires_at: float
+    vector: Optional[np.ndarray] = None
+
+
+class ResponseCache:
+    """
+    Thread-safe TTL and LRU cache of generated answers.
+
+    Attributes:
+        max_entries (int): Maximum number of cached answers; 0 disables the cache.
+        ttl (float): Seconds an answer may be reused for.
+        similarity_threshold (Optional[float]): Minimum cosine similarity for a
+            semantic hit; None disables the semantic tier.
+        embeddings (Optional[Embeddings]): Model embedding standalone questions.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl: float = 3600,
+        similarity_threshold: Optional[float] = None,
+        embeddings: Optional[Embeddings] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embeddings = embeddings
+        self._clock = clock
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def semantic_enabled(self) -> bool:
+        """Whether standalone questions are matched by embedding similarity."""
+        return self.similarity_threshold is not None and self.embeddings is not None
+
+    @staticmethod
+    def _key(prompt: str, model: str, scope: str) -> str:
+        payload = f"{model}\0{scope}\0{normalize_text(prompt)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _purge_expired(self, now: float) -> None:
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            del self._entries[key]
+
+    def _find(self, key: str, model: str, scope: str, vector: Optional[np.ndarray]) -> Optional[str]:
+        with self._lock:
+            now = self._clock()
+            entry = self._entries.get(key)
+            if entry and entry.expires_at <= now:
+                del self._entries[key]
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.response
+
+            if vector is not None:
+                self._purge_expired(now)
+                candidates = [
+                    (entry_key, entry) for entry_key, entry in self._entries.items()
+                    if entry.vector is not None and entry.model == model
+                    and entry.scope == scope
+                ]
+                if candidates:
+                    similarities = np.stack([entry.vector for _, entry in candidates]) @ vector
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.similarity_threshold:
+                        best_key, best_entry = candidates[best]
+                        self._entries.move_to_end(best_key)
+                        self.semantic_hits += 1
+                        return best_entry.response
+
+            self.misses += 1
+            return None
+
+    def _put(self, key: str, entry: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _embed(self, query: Optional[str]) -> Optional[np.ndarray]:
+        if not query or not self.semantic_enabled:
+            return None
+        try:
+            return self._normalize(self.embeddings.embed_query(query))
+        except Exception as e:
+            print(f"Error while embedding question for the response cache: {e}")
+            return None
+
+    async def _aembed(self, query: Optional[str]) -> Optional[np.ndarray]:
+        if not query or not self.semantic_enabled:
+            return None
+        try:
+            return self._normalize(await self.embeddings.aembed_query(query))
+        except Exception as e:
+            print(f"Error while embedding question for the response cache: {e}")
+            return None
+
+    def lookup(
+        self,
+        prompt: str,
+        model: str,
+        scope: str = '',
+        query: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Find a cached answer for a prompt.
+
+        Args:
+            prompt (str): The full prompt that would be sent to the model.
+            model (str): Name of the generating model.
+            scope (str): Document set the answer is grounded on, or the user for plain chat.
+            query (Optional[str]): The question, passed only when the answer depends
+                on it alone; enables the semantic tier.
+
+        Returns:
+            Optional[str]: The cached answer, or None on a miss.
+        """
+        if self.max_entries <= 0:
+            return None
+        return self._find(self._key(prompt, model, scope), model, scope, self._embed(query))
+
+    async def alookup(
+        self,
+        prompt: str,
+        model: str,
+        scope: str = '',
+        query: Optional[str] = None
+    ) -> Optional[str]:
+        """Asynchronous variant of ``lookup``."""
+        if self.max_entries <= 0:
+            return None
+        vector = await self._aembed(query)
+        return self._find(self._key(prompt, model, scope), model, scope, vector)
+
+    def _entry(self, response: str, model: str, scope: str,
+               vector: Optional[np.ndarray]) -> CachedResponse:
+        return CachedResponse(
+            response=response,
+            model=model,
+            scope=scope,
+            expires_at=self._clock() + self.ttl,
+            vector=vector
+        )
+
+    def store(
+        self,
+        prompt: str,
+        model: str,
+        response: str,
+        scope: str = '',
+        query: Optional[str] = None
+    ) -> None:
+        """
+        Cache a generated answer.
+
+        Args:
+            prompt (str): The prompt the answer was generated from.
+            model (str): Name of the generating model.
+            response (str): The generated answer.
+            scope (str): Document set the answer is grounded on, or the user for plain chat.
+            query (Optional[str]): The question, passed only when the answer depends
+                on it alone; makes the answer reusable for similar questions.
+        """
+        if self.max_entries <= 0 or not response:
+            return
+        vector = self._embed(query)
+        self._put(self._key(prompt, model, scope), self._entry(response, model, scope, vector))
+
+    async def astore(
+        self,
+        prompt: str,
+        model: str,
+        response: str,
+        scope: str = '',
+        query: Optional[str] = None
+    ) -> None:
+        """Asynchronous variant of ``store``."""
+        if self.max_entries <= 0 or not response:
+            return
+        vector = await self._aembed(query)
+        self._put(self._key(prompt, model, scope), self._entry(response, model, scope, vector))
+
+    def clear(self) -> None:
+        """Drop every cached answer."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Report cache counters.
+
+        Returns:
+            Dict[str, int]: Exact and semantic hits, misses, evictions and the
+            current entry count.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+            }
+
+
+def build_response_cache(embeddings: Optional[Embeddings] = None) -> ResponseCache:
+    """
+    Build the response cache configured by the ``RESPONSE_CACHE_*`` settings.
+
+    Args:
+        embeddings (Optional[Embeddings]): Model embedding standalone questions for
+            the semantic tier; ``RAGProcessor`` attaches its own when None.
+
+    Returns:
+        ResponseCache: The configured cache.
+    """
+    return ResponseCache(
+        max_entries=getattr(settings, 'RESPONSE_CACHE_SIZE', 512),
+        ttl=getattr(settings, 'RESPONSE_CACHE_TTL', 3600),
+        similarity_threshold=getattr(settings, 'RESPONSE_CACHE_SIMILARITY', None),
+        embeddings=embeddings
+    )
+
+
+response_cache = build_response_cache()
@@ -0,0 +1,312 @@
+"""
+Per-user routing index of document centroids.
+
+Answering a question used to load every store of the session just to find out
+that none of its chunks was within the relevance threshold. At ingest time each
+document is instead summarised by a few centroids of its chunk embeddings, each
+with the radius of the chunks it covers, and these are kept in one small
+``.npz`` file per user.
+
+Before opening any store, the chat path compares the query with the centroids.
+By the triangle inequality no chunk of a centroid's group can be closer to the
+query than its centroid distance minus its radius, so a store whose documents
+all exceed the threshold by that bound is skipped without loss. When one of the
+documents was never routed (ingested before this index existed), every store is
+searched.
+"""
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Sequence, Set, Tuple
+
+import numpy as np
+
+from chatbot.utils.locks import file_lock
+
+# Distances are compared after a square root; keep a margin for float rounding.
+_TOLERANCE = 1e-4
+
+
+def document_centroids(
+    vector_store,
+    chunk_ids: Sequence[str],
+    max_centroids: int,
+    batch_size: int = 1024
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Summarise a document by centroids of consecutive runs of its chunks.
+
+    Vectors are reconstructed from the index in batches, once to sum each run
+    and once to measure its radius, so memory does not grow with the document.
+
+    Args:
+        vector_store (FAISS): Store holding the document's chunks.
+        chunk_ids (Sequence[str]): Ids of the document's chunks, in order.
+        max_centroids (int): Maximum number of centroids.
+        batch_size (int): Vectors reconstructed at once.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The centroids and the L2 radius of each.
+    """
+    positions = {chunk_id: position
+                 for position, chunk_id in vector_store.index_to_docstore_id.items()}
+    groups = np.array_split(
+        np.array([positions[chunk_id] for chunk_id in chunk_ids], dtype=np.int64),
+        max(1, min(max_centroids, len(chunk_ids)))
+    )
+    index = vector_store.index
+
+    def batches(group: np.ndarray):
+        for start in range(0, len(group), batch_size):
+            yield np.vstack([index.reconstruct(int(position))
+                             for position in group[start:start + batch_size]])
+
+    centroids = np.zeros((len(groups), index.d), dtype=np.float32)
+    radii = np.zeros(len(groups), dtype=np.float32)
+    for row, group in enumerate(groups):
+        for vectors in batches(group):
+            centroids[row] += vectors.sum(axis=0)
+        centroids[row] /= len(group)
+        for vectors in batches(group):
+            radii[row] = max(radii[row],
+                             float(np.linalg.norm(vectors - centroids[row], axis=1).max()))
+    return centroids, radii
+
+
+@dataclass
+class RoutingTable:
+    """
+    Centroids of all routed documents of one user.
+
+    Attributes:
+        doc_ids (np.ndarray): Document id of each routed document.
+        store_paths (np.ndarray): Vector store holding each document.
+        owners (np.ndarray): Index into ``doc_ids`` of each centroid.
+        centroids (np.ndarray): Centroid vectors, one row per centroid.
+        radii (np.ndarray): L2 radius of each centroid's chunks.
+    """
+    doc_ids: np.ndarray
+    store_paths: np.ndarray
+    owners: np.ndarray
+    centroids: np.ndarray
+    radii: np.ndarray
+
+    @classmethod
+    def empty(cls) -> 'RoutingTable':
+        """Create a table without documents."""
+        return cls(
+            doc_ids=np.array([], dtype=str),
+            store_paths=np.array([], dtype=str),
+            owners=np.array([], dtype=np.int64),
+            centroids=np.zeros((0, 0), dtype=np.float32),
+            radii=np.array([], dtype=np.float32)
+        )
+
+    def without(self, doc_id: str) -> 'RoutingTable':
+        """Copy the table without a document's rows."""
+        return self.select(self.doc_ids != doc_id)
+
+    def select(self, keep_docs: np.ndarray) -> 'RoutingTable':
+        """Copy the table keeping the documents selected by a boolean mask."""
+        keep_rows = keep_docs[self.owners]
+        renumbered = np.cumsum(keep_docs) - 1
+        return RoutingTable(
+            doc_ids=self.doc_ids[keep_docs],
+            store_paths=self.store_paths[keep_docs],
+            owners=renumbered[self.owners[keep_rows]],
+            centroids=self.centroids[keep_rows],
+            radii=self.radii[keep_rows]
+        )
+
+    def with_document(
+        self,
+        doc_id: str,
+        store_path: str,
+        centroids: np.ndarray,
+        radii: np.ndarray
+    ) -> 'RoutingTable':
+        """Copy the table with a document's centroids added or replaced."""
+        table = self.without(doc_id)
+        existing = table.centroids if len(table.radii) else np.zeros(
+            (0, centroids.shape[1]), dtype=np.float32
+        )
+        return RoutingTable(
+            doc_ids=np.append(table.doc_ids, doc_id),
+            store_paths=np.append(table.store_paths, store_path),
+            owners=np.append(table.owners, np.full(len(radii), len(table.doc_ids))),
+            centroids=np.vstack([existing, centroids.astype(np.float32)]),
+            radii=np.append(table.radii, radii).astype(np.float32)
+        )
+
+    def plausible_stores(self, query_embedding: Sequence[float], threshold: float) -> Set[str]:
+        """
+        Find the stores holding a document that could pass the relevance gate.
+
+        Args:
+            query_embedding (Sequence[float]): The embedded question.
+            threshold (float): Maximum squared L2 distance of a relevant chunk.
+
+        Returns:
+            Set[str]: Paths of the stores worth searching.
+        """
+        if not len(self.radii):
+            return set()
+        query = np.asarray(query_embedding, dtype=np.float32)
+        distances = np.linalg.norm(self.centroids - query, axis=1)
+        reachable = distances - self.radii <= np.sqrt(threshold) + _TOLERANCE
+        return set(self.store_paths[np.unique(self.owners[reachable])].tolist())
+
+
+class RoutingIndex:
+    """
+    Store of per-user routing tables, safe across threads and processes.
+
+    Tables are written atomically and cached in memory until their file changes.
+    Updates hold a per-user lock file from loading the table to saving it.
+
+    Attributes:
+        directory (Path): Directory holding one ``user_<id>.npz`` file per user.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._tables: Dict[str, Tuple[int, RoutingTable]] = {}
+        self._lock = threading.Lock()
+
+    def path(self, user_id) -> Path:
+        """Get the routing file of a user."""
+        return self.directory / f'user_{user_id}.npz'
+
+    def lock_path(self, user_id) -> Path:
+        """Get the lock file serialising updates of a user's routing file."""
+        return self.directory / 'locks' / f'user_{user_id}.lock'
+
+    def load(self, user_id) -> RoutingTable:
+        """
+        Load a user's routing table, reusing the cached copy while it is current.
+
+        Args:
+            user_id: Owner of the documents.
+
+        Returns:
+            RoutingTable: The table, empty if the user has no routed documents.
+        """
+        path = self.path(user_id)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return RoutingTable.empty()
+        with self._lock:
+            cached = self._tables.get(str(path))
+            if cached and cached[0] == mtime:
+                return cached[1]
+        with np.load(path) as data:
+            table = RoutingTable(**{name: data[name] for name in data.files})
+        with self._lock:
+            self._tables[str(path)] = (mtime, table)
+        return table
+
+    def _save(self, user_id, table: RoutingTable) -> None:
+        path = self.path(user_id)
+        if not len(table.doc_ids):
+            path.unlink(missing_ok=True)
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix('.tmp.npz')
+        np.savez(temp_path, **vars(table))
+        os.replace(temp_path, path)
+
+    def add(
+        self,
+        user_id,
+        doc_id: str,
+        store_path: str,
+        centroids: np.ndarray,
+        radii: np.ndarray
+    ) -> None:
+        """
+        Route a document, replacing any earlier centroids it had.
+
+        Args:
+            user_id: Owner of the document.
+            doc_id (str): Document identifier.
+            store_path (str): Vector store holding the document.
+            centroids (np.ndarray): Centroids from ``document_centroids``.
+            radii (np.ndarray): Radius of each centroid.
+        """
+        with file_lock(self.lock_path(user_id)):
+            table = self.load(user_id)
+            if len(table.radii) and table.centroids.shape[1] != centroids.shape[1]:
+                table = RoutingTable.empty()
+            self._save(user_id, table.with_document(doc_id, store_path, centroids, radii))
+
+    def remove(self, user_id, doc_id: str) -> None:
+        """
+        Stop routing a document.
+
+        Args:
+            user_id: Owner of the document.
+            doc_id (str): Document identifier.
+        """
+        with file_lock(self.lock_path(user_id)):
+            table = self.load(user_id)
+            if doc_id in table.doc_ids:
+                self._save(user_id, table.without(doc_id))
+
+    def user_ids(self) -> List[str]:
+        """List the users that have a routing file."""
+        return [path.stem.removeprefix('user_') for path in self.directory.glob('user_*.npz')
+                if not path.name.endswith('.tmp.npz')]
+
+    def prune(self, user_id, doc_ids: Set[str]) -> int:
+        """
+        Stop routing every document of a user that is not in a set.
+
+        Args:
+            user_id: Owner of the documents.
+            doc_ids (Set[str]): Documents to keep routing.
+
+        Returns:
+            int: Number of documents no longer routed.
+        """
+        with file_lock(self.lock_path(user_id)):
+            table = self.load(user_id)
+            keep = np.isin(table.doc_ids, list(doc_ids))
+            if keep.all():
+                return 0
+            self._save(user_id, table.select(keep))
+            return int((~keep).sum())
+
+    def route(
+        self,
+        user_id,
+        doc_ids: Sequence[str],
+        store_paths: List[str],
+        query_embedding: Sequence[float],
+        threshold: float
+    ) -> List[str]:
+        """
+        Drop the stores that provably hold no chunk within the threshold.
+
+        Nothing is dropped while one of the documents is not routed, since its
+        chunks could be in any of the stores.
+
+        Args:
+            user_id: Owner of the documents.
+            doc_ids (Sequence[str]): Documents the question is asked about.
+            store_paths (List[str]): Stores holding those documents.
+            query_embedding (Sequence[float]): The embedded question.
+            threshold (float): Maximum squared L2 distance of a relevant chunk.
+
+        Returns:
+            List[str]: The stores still worth searching, in their original order.
+        """
+        table = self.load(user_id)
+        if not len(table.radii) or table.centroids.shape[1] != len(query_embedding):
+            return store_paths
+        selected = np.isin(table.doc_ids, [str(doc_id) for doc_id in doc_ids])
+        if selected.sum() < len(set(map(str, doc_ids))):
+            return store_paths
+        plausible = table.select(selected).plausible_stores(query_embedding, threshold)
+        return [path for path in store_paths if path in plausible]
@@ -0,0 +1,145 @@
+"""
+Process-wide cache of loaded FAISS vector stores.
+
+Loading a store means reading ``index.faiss`` and unpickling ``index.pkl``,
+which is far more expensive than searching it. This module keeps recently
+used stores in memory so that repeated questions against the same session
+documents only pay that cost once.
+
+Entries are keyed by the resolved store path and its modification time, so a
+store that is rewritten on disk is reloaded automatically. The cache is bounded
+both by entry count and by an approximate byte budget (the on-disk size of the
+store files), evicting the least recently used stores first.
+"""
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+from django.conf import settings
+
+
+class VectorStoreCache:
+    """
+    Thread-safe LRU cache of loaded vector stores.
+
+    Attributes:
+        max_entries (int): Maximum number of stores kept in memory.
+        max_bytes (int): Approximate memory budget, measured as on-disk store size.
+    """
+
+    def __init__(self, max_entries: int = 32, max_bytes: int = 512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _fingerprint(store_path: Path) -> Tuple[float, int]:
+        """
+        Compute the modification time and total size of a store directory.
+
+        Args:
+            store_path (Path): Path to the vector store directory.
+
+        Returns:
+            Tuple[float, int]: Latest file modification time and total size in bytes.
+        """
+        mtime = store_path.stat().st_mtime
+        size = 0
+        for file_path in store_path.iterdir():
+            stat = file_path.stat()
+            mtime = max(mtime, stat.st_mtime)
+            size += stat.st_size
+        return mtime, size
+
+    def get(self, store_path: str, loader: Callable[[str], Any]) -> Any:
+        """
+        Return the loaded store at ``store_path``, loading it on a miss.
+
+        Args:
+            store_path (str): Path to the vector store directory.
+            loader (Callable[[str], Any]): Function that loads the store from disk.
+
+        Returns:
+            Any: The loaded vector store.
+        """
+        path = Path(store_path).resolve()
+        key = str(path)
+        mtime, size = self._fingerprint(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == mtime:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        store = loader(store_path)
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (mtime, size, store)
+            self._bytes += size
+            self._evict()
+        return store
+
+    def invalidate(self, store_path: str) -> None:
+        """
+        Drop a store from the cache, e.g. after it was deleted or re-ingested.
+
+        Args:
+            store_path (str): Path to the vector store directory.
+        """
+        with self._lock:
+            self._discard(str(Path(store_path).resolve()))
+
+    def clear(self) -> None:
+        """Drop every cached store."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Report cache counters for sizing the cache.
+
+        Returns:
+            Dict[str, int]: Hit, miss and eviction counts plus current usage.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry[1]
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            # Always keep the most recently loaded store, even if it alone
+            # exceeds the byte budget.
+            if len(self._entries) == 1:
+                break
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+
+vector_store_cache = VectorStoreCache(
+    max_entries=getattr(settings, 'VECTOR_STORE_CACHE_MAX_ENTRIES', 32),
+    max_bytes=getattr(settings, 'VECTOR_STORE_CACHE_MAX_BYTES', 512 * 1024 * 1024),
+)
@@ -0,0 +1,205 @@
+"""
+Stage timing spans, latency histograms and Prometheus exposition.
+
+Code wraps each expensive stage in ``span(name)``. Every span is observed in a
+process-wide histogram. When it runs inside a request handled by
+``ServerTimingMiddleware``, it is also added to that request's ``Server-Timing``
+header. The current request is tracked with a context variable, which follows
+the request through ``await``, ``sync_to_async`` and ``asyncio.to_thread``.
+Spans in background ingestion only feed the histograms.
+
+``render_metrics`` formats the histograms, and the counters of the caches, in
+the Prometheus text exposition format served on ``/metrics/``.
+"""
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar('T')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    'request_timings', default=None
+)
+
+
+class Histogram:
+    """
+    Thread-safe cumulative histogram of durations, keyed by label values.
+
+    Attributes:
+        name (str): Metric name.
+        documentation (str): Help text.
+        label_names (Tuple[str, ...]): Names of the labels.
+        buckets (Tuple[float, ...]): Upper bounds of the buckets, in seconds.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series: "OrderedDict[Tuple[str, ...], List]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *label_values: str) -> None:
+        """Record one duration for the given label values."""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.setdefault(
+                tuple(label_values), [[0] * (len(self.buckets) + 1), 0.0, 0]
+            )
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[List[int], float, int]]:
+        """Copy the per-bucket counts, sum and count of every series."""
+        with self._lock:
+            return {labels: (list(counts), total, count)
+                    for labels, (counts, total, count) in self._series.items()}
+
+    def clear(self) -> None:
+        """Drop every recorded series."""
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        """Render the histogram in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self.snapshot().items():
+            pairs = [f'{name}="{escape_label(value)}"'
+                     for name, value in zip(self.label_names, labels)]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_pairs = pairs + [f'le="{le}"']
+                lines.append(f"{self.name}_bucket{{{','.join(bucket_pairs)}}} {cumulative}")
+            label_text = f"{{{','.join(pairs)}}}" if pairs else ''
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+def escape_label(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+stage_duration = Histogram(
+    'chatbot_stage_duration_seconds',
+    'Duration of instrumented processing stages.',
+    ('stage',)
+)
+request_duration = Histogram(
+    'chatbot_request_duration_seconds',
+    'Duration of HTTP requests until the response is returned.',
+    ('view', 'method', 'status')
+)
+
+# Caches exported on /metrics/, as (cache label, stats callable) pairs.
+_collectors: List[Tuple[str, Callable[[], Dict[str, int]]]] = []
+
+
+def register_collector(cache_name: str, stats: Callable[[], Dict[str, int]]) -> None:
+    """
+    Export the counters of a cache on ``/metrics/``.
+
+    Args:
+        cache_name (str): Value of the ``cache`` label.
+        stats (Callable[[], Dict[str, int]]): Returns the cache's current counters.
+    """
+    _collectors.append((cache_name, stats))
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Time the enclosed block as one processing stage.
+
+    Args:
+        name (str): Stage name; a ``Server-Timing`` token, so no spaces.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def timed_iter(name: str, iterable: Iterable[T]) -> Iterator[T]:
+    """
+    Time producing each item of a lazy iterable as one span.
+
+    Args:
+        name (str): Stage name of every span.
+        iterable (Iterable[T]): Items that are expensive to produce, e.g. parsed pages.
+
+    Yields:
+        T: The items, unchanged.
+    """
+    iterator = iter(iterable)
+    while True:
+        with span(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+@contextmanager
+def collect_request_timings() -> Iterator[List[Tuple[str, float]]]:
+    """Collect the spans of the current request into a fresh list."""
+    timings: List[Tuple[str, float]] = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    """
+    Format request spans as a ``Server-Timing`` header value.
+
+    Repeated stages are summed, and ``total`` is appended last.
+
+    Args:
+        timings (List[Tuple[str, float]]): Stage names and durations in seconds.
+        total (float): Total request duration in seconds.
+
+    Returns:
+        str: The header value, with durations in milliseconds.
+    """
+    merged: "OrderedDict[str, float]" = OrderedDict()
+    for name, seconds in timings:
+        merged[name] = merged.get(name, 0.0) + seconds
+    merged['total'] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in merged.items())
+
+
+def render_metrics() -> str:
+    """Render every metric in the Prometheus text exposition format."""
+    lines = stage_duration.render() + request_duration.render()
+    counters: Dict[str, List[str]] = OrderedDict()
+    for cache_name, stats in _collectors:
+        for counter, value in stats().items():
+            counters.setdefault(counter, []).append(
+                f'chatbot_cache_{counter}{{cache="{escape_label(cache_name)}"}} {value}'
+            )
+    for counter, samples in counters.items():
+        lines.append(f"# TYPE chatbot_cache_{counter} gauge")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
@@ -4,71 +4,155 @@ This module contains view functions to handle the chatbot application built usin
 The main functionalities include:
 
 - Starting and managing chat sessions for authenticated users.
-- Handling AI-generated responses using the Gemini model.
-- Uploading and processing documents for query-based interactions.
+- Handling AI-generated responses using the Gemini model, optionally streamed
+  token by token as server-sent events.
+- Uploading documents and queueing them for background processing.
+- Reporting document processing status for upload progress polling.
 - Querying documents using a Retrieval-Augmented Generation (RAG) pipeline.
 - Managing session-based document associations.
-- Deleting chat sessions and cleaning up associated data.
+- Serving older chat history page by page for lazy loading.
+- Exporting stage latency histograms and cache counters for Prometheus.
+- Deleting chat sessions and reclaiming their documents' files in the background.
 
 Typical usage example:
 
     1. A user logs in and starts a chat session.
     2. The chatbot() function manages chat interactions and session history.
-    3. The upload_document() function processes user-uploaded documents for querying.
+    3. The upload_document() function queues user-uploaded documents for processing,
+       and document_status() reports their progress.
     4. The delete_session() function removes a specified chat session and associated files.
+
+All views are asynchronous: Gemini and embedding calls are awaited and database
+access goes through the async ORM, so a single ASGI process can hold many
+in-flight conversations while they wait on the API.
 """
+import hmac
+import json
 import uuid
-from pathlib import Path
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
-from django.contrib.auth.decorators import login_required
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from django.db.models import Min
 from django_chatgpt_clone.settings import API_KEY
-from chatbot.utils.ask_gemini import ask_gemini
-from .models import Chat,Document
+from chatbot.utils.ask_gemini import aask_gemini, aask_gemini_stream
+from .decorators import async_login_required
+from .models import Chat,ChatSession,Document
+from .utils.history import afetch_chat_page
+from .utils.ingestion import ingestion_queue
+from .utils.memory import aload_conversation_memory
 from .utils.rag_utils import RAGProcessor
+from .utils.reclaim import reclaim_deleted_documents
+from .utils.response_cache import response_cache
+from .utils.store_cache import vector_store_cache
+from .utils.timing import register_collector, render_metrics, span
 
 rag_processor = RAGProcessor(API_KEY)
+ingestion_queue.recover_on_first_request(rag_processor)
+
+register_collector('vector_store', vector_store_cache.stats)
+register_collector('embedding', lambda: rag_processor.embeddings.stats())
+register_collector('response', response_cache.stats)
 
-@login_required
-def upload_document(request):
-    """Handle document upload and processing."""
+@async_login_required
+async def upload_document(request):
+    """Handle document upload and queue it for background processing."""
     if request.method == 'POST' and request.FILES.get('document'):
         document = request.FILES['document']
         title = document.name
         session_id = request.POST.get('session_id')
 
-        doc = Document.objects.create(
-            user=request.user,
-            session_id=session_id,
-            title=title,
-            file=document
-        )
         try:
-            vector_store_path = rag_processor.process_document(
-                doc.file.path,
-                str(doc.id),
-            )
-            doc.embedding_store = vector_store_path
-            doc.processed = True
-            doc.save()
-            return JsonResponse({'success': True, 'message': 'Document processed successfully'})
+            with span('db_document'):
+                doc = await Document.objects.acreate(
+                    user=request.user,
+                    session_id=session_id,
+                    title=title,
+                    file=document
+                )
+            with span('enqueue'):
+                await sync_to_async(ingestion_queue.enqueue)(doc.id, rag_processor)
         except Exception as e:
-            doc.delete()
             return JsonResponse({'success': False, 'message': str(e)})
 
+        await doc.arefresh_from_db(fields=['status'])
+        return JsonResponse({
+            'success': True,
+            'message': 'Document queued for processing',
+            'document_id': doc.id,
+            'status': doc.status
+        })
+
     return JsonResponse({'success': False, 'message': 'No document provided'})
 
-@login_required
-def chatbot(request):
+@async_login_required
+async def document_status(request, document_id):
+    """Report the processing status of an uploaded document."""
+    doc = await Document.objects.filter(
+        user=request.user, id=document_id, deleted_at__isnull=True
+    ).afirst()
+    if not doc:
+        return JsonResponse({'success': False, 'message': 'Document not found'}, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'document_id': doc.id,
+        'status': doc.status,
+        'processed': doc.processed,
+        'error': doc.error
+    })
+
+def sse_event(payload):
+    """Encode a payload as a server-sent event."""
+    return f"data: {json.dumps(payload)}\n\n"
+
+def stream_chat_response(user, session_id, message, vector_store_paths, chat_history,
+                         summary=None, doc_ids=None):
+    """Stream the chatbot answer as server-sent events and store it once complete."""
+    async def event_stream():
+        parts = []
+        try:
+            if vector_store_paths:
+                tokens = rag_processor.astream_query(
+                    vector_store_paths, message, chat_history, summary,
+                    user_id=user.id, doc_ids=doc_ids
+                )
+            else:
+                tokens = aask_gemini_stream(message, chat_history, summary, user.id)
+            async for token in tokens:
+                parts.append(token)
+                yield sse_event({'token': token})
+        except Exception as stream_error:
+            print(f"Streaming failed: {stream_error}")
+
+        response = "".join(parts)
+        if not response:
+            response = "Service temporarily unavailable. Please try again later."
+            yield sse_event({'token': response})
+        await Chat.objects.acreate(
+            user=user,
+            session_id=session_id,
+            message=message,
+            response=response,
+            created_at=timezone.now()
+        )
+        yield sse_event({
+            'done': True,
+            'message': message,
+            'response': response,
+            'session_id': session_id
+        })
+
+    streaming_response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    streaming_response['Cache-Control'] = 'no-cache'
+    streaming_response['X-Accel-Buffering'] = 'no'
+    return streaming_response
+
+@async_login_required
+async def chatbot(request):
     """Handle the core functionalities of the chatbot."""
-    all_sessions = (
-        Chat.objects.filter(user=request.user)
-        .values('session_id')
-        .annotate(first_message=Min('created_at'))
-        .order_by('first_message')
-    )
+    all_sessions = ChatSession.objects.filter(user=request.user).order_by('created_at')
     current_session_id = None
 
     if request.method == 'POST':
@@ -77,7 +161,7 @@ def chatbot(request):
     else:
         if request.GET.get('new_chat'):
             current_session_id = str(uuid.uuid4())
-            Chat.objects.create(
+            await Chat.objects.acreate(
                 user=request.user,
                 session_id=current_session_id,
                 message="",
@@ -88,13 +172,14 @@ def chatbot(request):
         else:
             current_session_id = request.GET.get('session_id')
             if not current_session_id:
-                if all_sessions.exists():
-                    current_session_id = str(all_sessions.last()['session_id'])
+                last_session = await all_sessions.alast()
+                if last_session:
+                    current_session_id = str(last_session.session_id)
                 else:
                     current_session_id = str(uuid.uuid4())
                     welcome_msg = (f"Hi {request.user.username}, I'm your AI Chatbot."
                                    "How can I help you today?")
-                    Chat.objects.create(
+                    await Chat.objects.acreate(
                         user=request.user,
                         session_id=current_session_id,
                         message="",
@@ -102,47 +187,69 @@ def chatbot(request):
                         created_at=timezone.now()
                     )
 
-    session_chats = Chat.objects.filter(
-        user=request.user,
-        session_id=current_session_id
-    ).order_by('created_at')
     if request.method == 'POST':
         message = request.POST.get('message')
         if message:
             try:
-                user_docs = Document.objects.filter(
-                    user=request.user,
-                    session_id=current_session_id,
-                    processed=True
-                )
-                vector_store_paths = [doc.embedding_store for doc in user_docs
-                                      if doc.embedding_store]
-                chat_history = Chat.objects.filter(
-                    user=request.user,
-                    session_id=current_session_id
-                ).order_by('created_at').values('message', 'response')
+                with span('db_documents'):
+                    documents = [
+                        (str(doc_id), store_path)
+                        async for doc_id, store_path in Document.objects.filter(
+                            user=request.user,
+                            session_id=current_session_id,
+                            processed=True,
+                            embedding_store__isnull=False,
+                            deleted_at__isnull=True
+                        ).values_list('id', 'embedding_store')
+                        if store_path
+                    ]
+                    doc_ids = [doc_id for doc_id, _ in documents]
+                    vector_store_paths = list(dict.fromkeys(
+                        store_path for _, store_path in documents
+                    ))
+                with span('memory'):
+                    summary, chat_history = await aload_conversation_memory(
+                        request.user,
+                        current_session_id
+                    )
+
+                if request.POST.get('stream'):
+                    return stream_chat_response(
+                        request.user,
+                        current_session_id,
+                        message,
+                        vector_store_paths,
+                        chat_history,
+                        summary,
+                        doc_ids
+                    )
 
                 response = None
                 if vector_store_paths:
                     try:
-                        response = rag_processor.query_documents(
+                        response = await rag_processor.aquery_documents(
                             vector_store_paths,
                             message,
-                            list(chat_history)
+                            chat_history,
+                            summary,
+                            user_id=request.user.id,
+                            doc_ids=doc_ids
                         )
                     except Exception as doc_query_error:
                         print(f"Document query failed: {doc_query_error}")
 
                 if not response:
-                    response = ask_gemini(message, list(chat_history))
+                    with span('llm'):
+                        response = await aask_gemini(message, chat_history, summary, request.user.id)
 
-                Chat.objects.create(
-                    user=request.user,
-                    session_id=current_session_id,
-                    message=message,
-                    response=response,
-                    created_at=timezone.now()
-                )
+                with span('db_save'):
+                    await Chat.objects.acreate(
+                        user=request.user,
+                        session_id=current_session_id,
+                        message=message,
+                        response=response,
+                        created_at=timezone.now()
+                    )
 
                 return JsonResponse({
                     'message': message,
@@ -157,39 +264,82 @@ def chatbot(request):
                     'session_id': current_session_id
                 }, status=500)
 
-    session_list = []
-    for session in all_sessions:
-        first_chat = Chat.objects.filter(
-            user=request.user,
-            session_id=session['session_id']
-        ).exclude(message="").first()
-        title = "New Chat"
-        if first_chat and first_chat.message:
-            title = (
-                first_chat.message[:30] + "..."
-                if len(first_chat.message) > 30
-                else first_chat.message
-            )
-        session_list.append({
-            'id': session['session_id'],
-            'title': title,
-            'timestamp': session['first_message']
+    with span('db_history'):
+        session_chats, older_cursor = await afetch_chat_page(
+            request.user,
+            current_session_id,
+            limit=settings.CHAT_HISTORY_PAGE_SIZE
+        )
+    with span('db_sessions'):
+        session_list = [
+            {
+                'id': session['session_id'],
+                'title': session['title'],
+                'timestamp': session['created_at']
+            }
+            async for session in all_sessions.values('session_id', 'title', 'created_at')
+        ]
+    with span('render'):
+        return render(request, 'chatbot.html', {
+            'chats': session_chats,
+            'older_cursor': older_cursor,
+            'current_session_id': current_session_id,
+            'all_sessions': session_list,
         })
-    return render(request, 'chatbot.html', {
-        'chats': session_chats,
-        'current_session_id': current_session_id,
-        'all_sessions': session_list,
+
+
+@async_login_required
+async def chat_history(request, session_id):
+    """Return one page of a session's messages, older than the given cursor."""
+    try:
+        limit = min(int(request.GET.get('limit', settings.CHAT_HISTORY_PAGE_SIZE)), 100)
+        chats, older_cursor = await afetch_chat_page(
+            request.user,
+            session_id,
+            before=request.GET.get('before'),
+            limit=max(limit, 1)
+        )
+    except (ValueError, ValidationError):
+        return JsonResponse({'success': False, 'message': 'Invalid cursor'}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'messages': [
+            {
+                'id': chat.id,
+                'message': chat.message,
+                'response': chat.response,
+                'created_at': chat.created_at.isoformat()
+            }
+            for chat in chats
+        ],
+        'older_cursor': older_cursor
     })
 
+async def metrics(request):
+    """
+    Expose stage latency histograms and cache counters in Prometheus format.
+
+    Scrapers authenticate with the METRICS_TOKEN bearer token. Without a token
+    configured the endpoint is only served to staff users and hidden otherwise.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+            return HttpResponse(status=401)
+    elif not await sync_to_async(lambda: request.user.is_staff)():
+        raise Http404
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-@login_required
-def create_new_chat(request):
+@async_login_required
+async def create_new_chat(request):
     """Create a new chat session for the user."""
     if request.method == 'POST':
         new_session_id = str(uuid.uuid4())
         welcome_msg = (f"Hi {request.user.username}, I'm your AI Chatbot."
                        "How can I help you today?")
-        Chat.objects.create(
+        await Chat.objects.acreate(
             user=request.user,
             session_id=new_session_id,
             message="",
@@ -207,44 +357,37 @@ def create_new_chat(request):
         'message': 'Invalid request method'
     }, status=400)
 
-@login_required
-def delete_session(request, session_id):
-    """Delete a chat session for the user."""
+@async_login_required
+async def delete_session(request, session_id):
+    """Delete a chat session, leaving its documents' files to the background reclaimer."""
     chat_session = Chat.objects.filter(user=request.user, session_id=session_id)
-    if not chat_session.exists():
+    if not await chat_session.aexists():
         return redirect('chatbot')
 
     try:
-        user_documents = Document.objects.filter(user=request.user)
-        for doc in user_documents:
-            if doc.file:
-                file_path = Path(doc.file.path)
-                if file_path.exists():
-                    try:
-                        file_path.unlink()
-                        print(f"Deleted document file: {file_path}")
-                    except Exception as file_error:
-                        print(f"Error deleting file {file_path}: {file_error}")
-
-            if doc.embedding_store:
-                try:
-                    rag_processor.cleanup_vector_stores()
-                except Exception as cleanup_error:
-                    print(f"Error cleaning up vector store: {cleanup_error}")
-
-            doc.delete()
-
-        chat_session.delete()
-
-        remaining_sessions = (
-            Chat.objects.filter(user=request.user)
-            .values('session_id')
-            .annotate(first_message=Min('created_at'))
-            .order_by('-first_message')
+        live_documents = Document.objects.filter(
+            user=request.user,
+            session_id=session_id,
+            deleted_at__isnull=True
+        )
+        deleted_at = timezone.now()
+        counted = await live_documents.exclude(
+            status=Document.STATUS_FAILED
+        ).aupdate(deleted_at=deleted_at)
+        await live_documents.aupdate(deleted_at=deleted_at)
+        await sync_to_async(ChatSession.forget_documents)(request.user.id, session_id, counted)
+        await sync_to_async(ingestion_queue.submit)(reclaim_deleted_documents, rag_processor)
+
+        await chat_session.adelete()
+        await ChatSession.objects.filter(user=request.user, session_id=session_id).adelete()
+
+        next_session = await (
+            ChatSession.objects.filter(user=request.user)
+            .order_by('-created_at')
+            .afirst()
         )
-        if remaining_sessions.exists():
-            next_session = remaining_sessions.first()["session_id"]
-            return redirect(f'/chatbot?session_id={next_session}')
+        if next_session:
+            return redirect(f'/chatbot?session_id={next_session.session_id}')
 
     except Exception as general_error:
         print(f"General error during cleanup: {general_error}")
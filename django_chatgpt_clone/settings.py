@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 LOGIN_URL = '/login/'
 
 MIDDLEWARE = [
+    'chatbot.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -101,6 +102,81 @@ os.makedirs(VECTOR_STORE_ROOT, exist_ok=True)
 
 GEMINI_API_RATE_LIMIT = 60  # requests per minute
 GEMINI_API_RETRY_ATTEMPTS = 3
+# Backends answering generation and embedding calls: 'gemini' (live API),
+# 'fake' (deterministic, offline), 'record' (live API, saved to disk) or
+# 'replay' (saved responses with their recorded timing, offline).
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'gemini')
+BACKEND_RECORDINGS_DIR = os.path.join(MEDIA_ROOT, 'recordings')
+# Latency (seconds) and error injection for the fake and replay backends;
+# distribution is 'fixed', 'uniform', 'normal' or 'lognormal'.
+BACKEND_LATENCY = {
+    'distribution': 'fixed',
+    'mean': 0.0,
+    'spread': 0.0,
+    'error_rate': 0.0,
+    'seed': None,
+}
+EMBEDDING_BATCH_SIZE = 100  # texts per batchEmbedContents request (API maximum)
+EMBEDDING_CONCURRENCY = 4  # embedding requests in flight at once
+
+VECTOR_STORE_CACHE_MAX_ENTRIES = 32
+VECTOR_STORE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# On-disk format of written vector stores: 'faiss' (index.faiss plus a pickled
+# docstore) or 'mmap' (memory-mapped vectors plus a SQLite chunk table, opened
+# without unpickling). Stores in either format are read.
+VECTOR_STORE_FORMAT = os.getenv('VECTOR_STORE_FORMAT', 'faiss')
+# Session stores in the faiss format switch to float16 vectors, then to IVF-PQ,
+# at these chunk counts (mmap stores stay flat); tune them with the index
+# section of manage.py benchmark.
+INDEX_SQ_THRESHOLD = 10_000
+INDEX_IVFPQ_THRESHOLD = 100_000
+INDEX_IVF_NPROBE = 16  # inverted lists searched per query by IVF-PQ stores
+
+EMBEDDING_CACHE_DB = os.path.join(MEDIA_ROOT, 'cache', 'embeddings.sqlite3')
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+QUERY_EMBEDDING_CACHE_PERSIST = False
+
+RESPONSE_CACHE_SIZE = 512  # cached answers; 0 disables the response cache
+RESPONSE_CACHE_TTL = 60 * 60  # seconds a cached answer may be reused
+# Cosine similarity above which a standalone question reuses the answer of a
+# similar one, e.g. 0.95; None disables the semantic tier.
+RESPONSE_CACHE_SIMILARITY = None
+
+CHAT_HISTORY_PAGE_SIZE = 20  # messages rendered per page of chat history
+CHAT_MEMORY_WINDOW = 6  # recent turns sent verbatim with each message
+CHAT_SUMMARY_BATCH = 4  # expired turns folded into the summary at once
+
+INGESTION_WORKERS = 2
+INGESTION_EAGER = False  # run background jobs inline instead of on the worker pool
+# Documents in progress without a status change for this long are taken to be
+# lost with a stopped worker: re-enqueued, or reclaimed if their session is gone.
+# Workers refresh the status before every ingestion batch.
+INGESTION_STALE_SECONDS = 60 * 60
+# Chunks embedded and indexed per batch; a multiple of EMBEDDING_BATCH_SIZE
+# lets one ingestion batch fill all concurrent embedding requests.
+INGESTION_BATCH_SIZE = 400
+# PDFs of at least PDF_PARALLEL_MIN_PAGES pages are extracted and chunked in
+# ranges of PDF_PAGES_PER_TASK pages by this many worker processes; 1 disables.
+PDF_EXTRACTION_WORKERS = os.cpu_count() or 1
+PDF_PARALLEL_MIN_PAGES = 32
+PDF_PAGES_PER_TASK = 8
+# Centroids summarising each document in its owner's routing index, which lets
+# questions skip stores that cannot hold a relevant chunk without loading them.
+ROUTING_CENTROIDS = 4
+# Seconds a question waits for its embedding before it is answered from the
+# lexical (BM25) index alone, when that index matches; None waits indefinitely.
+QUERY_EMBEDDING_TIMEOUT = 5.0
+# Minimum age of an unreferenced store, metadata file or upload before the
+# orphan sweep (manage.py reclaim_storage --sweep) removes it.
+RECLAIM_GRACE_SECONDS = 60 * 60
+
+# Stage timings are returned to clients in a Server-Timing header and exported
+# on /metrics/, which requires "Authorization: Bearer <METRICS_TOKEN>" when the
+# token is set and a staff login otherwise.
+SERVER_TIMING_HEADER = True
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 